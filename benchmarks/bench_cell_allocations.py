@@ -0,0 +1,67 @@
+"""
+Allocation benchmark of the Cell wrappers created while iterating over a notebook.
+
+Usage: python benchmarks/bench_cell_allocations.py [N_CELLS]
+"""
+import sys
+import time
+import tracemalloc
+
+import nbformat
+
+from nbmanips import Notebook
+from nbmanips.cell import Cell
+from nbmanips.selector import Selector
+
+
+def make_notebook(n_cells):
+    cells = []
+    for i in range(n_cells):
+        if i % 3:
+            cells.append(nbformat.v4.new_code_cell(f'x = {i}\nprint(x)'))
+        else:
+            cells.append(nbformat.v4.new_markdown_cell(f'# Title {i}'))
+    return Notebook(nbformat.v4.new_notebook(cells=cells), validate=False, copy=False)
+
+
+def measure(label, func, repeat=5):
+    func()  # warm-up: fills the wrapper pool
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<40} {elapsed * 1000:>9.1f} ms {peak / 1024:>10.1f} KiB peak')
+
+
+def main(n_cells=100_000):
+    nb = make_notebook(n_cells)
+    selection = nb.select('is_code') & nb.select('contains', 'print')
+    raw_nb = nb.raw_nb
+    selector = Selector('is_code') & Selector('contains', 'print')
+
+    def unpooled_selection():
+        # what iter_cells did before the pool: new wrappers for each iteration
+        cells = (Cell(cell, i) for i, cell in enumerate(raw_nb['cells']))
+        return list(filter(selector.get_callable(raw_nb), cells))
+
+    def unpooled_cells():
+        return [Cell(cell, i) for i, cell in enumerate(raw_nb['cells'])]
+
+    print(f'{n_cells} cells')
+    measure('chained selectors, new wrappers', unpooled_selection)
+    measure('chained selectors, pooled wrappers', selection.list_cells)
+    measure('list_cells, new wrappers', unpooled_cells)
+    measure('list_cells, pooled wrappers', nb.list_cells)
+
+    tracemalloc.start()
+    cells = [Cell(cell, i) for i, cell in enumerate(raw_nb['cells'])]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{"size of a Cell wrapper":<40} {size / len(cells):>9.1f} bytes')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
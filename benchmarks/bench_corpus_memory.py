@@ -0,0 +1,53 @@
+"""
+Memory benchmark of a corpus of notebooks: plain dictionaries vs NotebookCorpus.
+
+Usage: python benchmarks/bench_corpus_memory.py [N_NOTEBOOKS]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+from nbmanips.notebook import NotebookCorpus
+
+TEST_FILES = Path(__file__).parent.parent / 'tests' / 'test_files'
+
+
+def load_corpus(contents, n_notebooks, compact):
+    corpus = NotebookCorpus() if compact else []
+    for i in range(n_notebooks):
+        # each notebook is parsed separately, as if it was read from its own file
+        nb = json.loads(contents[i % len(contents)])
+        if compact:
+            corpus.add(nb)
+        else:
+            corpus.append(nb)
+    return corpus
+
+
+def measure(contents, n_notebooks, compact):
+    gc.collect()
+    tracemalloc.start()
+    corpus = load_corpus(contents, n_notebooks, compact)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del corpus
+    return size
+
+
+def main(n_notebooks=2000):
+    contents = [path.read_text(encoding='utf-8') for path in TEST_FILES.glob('*.ipynb')]
+
+    plain = measure(contents, n_notebooks, compact=False)
+    compact = measure(contents, n_notebooks, compact=True)
+    print(f'{n_notebooks} notebooks')
+    print(f'{"dictionaries":<20} {plain / 2**20:>8.1f} MiB')
+    print(f'{"NotebookCorpus":<20} {compact / 2**20:>8.1f} MiB')
+    print(
+        f'{"saved":<20} {(plain - compact) / 2**20:>8.1f} MiB ({1 - compact / plain:.0%})'
+    )
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,91 @@
+"""
+Microbenchmark of deep selector chains: compiled predicates vs per-cell
+evaluation of the selector tree (how ListSelector used to evaluate them).
+
+Usage: python benchmarks/bench_selector_chains.py [N_CELLS]
+"""
+import sys
+import time
+
+import nbformat
+
+from nbmanips import Notebook
+from nbmanips._utils import partial
+from nbmanips.selector import Selector
+from nbmanips.selector.base_selectors import ListSelector
+from nbmanips.selector.callable_selector import CallableSelector
+
+
+def make_notebook(n_cells):
+    cells = []
+    for i in range(n_cells):
+        if i % 3:
+            cells.append(nbformat.v4.new_code_cell(f'x = {i}\nprint(x)'))
+        else:
+            cells.append(nbformat.v4.new_markdown_cell(f'# Title {i}'))
+    return Notebook(nbformat.v4.new_notebook(cells=cells), validate=False, copy=False)
+
+
+def tree_callable(selector, nb):
+    # selector callables resolved on each cell, arguments bound with _utils.partial
+    if isinstance(selector, ListSelector):
+        op = all if selector._and else any
+        return lambda cell: op(
+            sel._neg ^ bool(tree_callable(sel, nb)(cell)) for sel in selector._list
+        )
+    if isinstance(selector, CallableSelector):
+        return partial(selector._function, *selector._args, **selector._kwargs)
+    return selector.get_callable(nb)
+
+
+def naive_iter_cells(selector, nb):
+    predicate = tree_callable(selector, nb)
+    cells = selector._enumerate_cells(nb)
+    if selector._neg:
+        return (cell for cell in cells if not predicate(cell))
+    return filter(predicate, cells)
+
+
+def chains():
+    def has_type(cell, type):
+        return cell.type == type
+
+    code = Selector(has_type, 'code')
+    markdown = Selector(has_type, type='markdown')
+    contains = Selector('contains', 'x')
+    return {
+        'and of 10 selectors': ListSelector([code] * 9 + [contains]),
+        'or of 10 selectors': ListSelector([~code] * 9 + [contains], type='or'),
+        'nested and/or, depth 6': (
+            ((((code | markdown) & contains) | ~markdown) & code) | markdown
+        )
+        & ~Selector(slice(0, 10)),
+        'negated chains': ~(~(code & contains) | ~(markdown | contains)),
+    }
+
+
+def measure(func, repeat=5):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(n_cells=20_000):
+    nb = make_notebook(n_cells)
+    raw_nb = nb.raw_nb
+
+    print(f'{n_cells} cells')
+    print(f'{"":<26} {"per-cell tree":>14} {"compiled":>10}')
+    for label, selector in chains().items():
+        expected = [cell.num for cell in naive_iter_cells(selector, raw_nb)]
+        assert [cell.num for cell in selector.iter_cells(raw_nb)] == expected
+
+        naive = measure(lambda: list(naive_iter_cells(selector, raw_nb)))
+        compiled = measure(lambda: list(selector.iter_cells(raw_nb)))
+        print(f'{label:<26} {naive * 1000:>11.1f} ms {compiled * 1000:>7.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
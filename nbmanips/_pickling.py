@@ -0,0 +1,71 @@
+from typing import Any, List, Tuple
+
+try:
+    from pickle import PickleBuffer
+except ImportError:
+    PickleBuffer = None
+
+# Strings at least this long are sent as out-of-band buffers (pickle protocol 5)
+PAYLOAD_MIN_SIZE = 4096
+
+
+class PayloadRef:
+    """
+    Placeholder of a string that is pickled as an out-of-band buffer
+    """
+
+    __slots__ = ('index',)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __reduce__(self):
+        return PayloadRef, (self.index,)
+
+
+def split_payloads(content, protocol: int) -> Tuple[Any, List]:
+    """
+    Replaces the long strings of a json value by PayloadRef placeholders,
+    when the pickle protocol supports out-of-band buffers.
+
+    :param content: json value (e.g. a raw notebook or a raw cell)
+    :param protocol: pickle protocol
+    :return: the new json value, and the list of the payloads as PickleBuffers
+    """
+    if PickleBuffer is None or protocol < 5:
+        return content, []
+
+    payloads: list = []
+    return _split(content, payloads), payloads
+
+
+def join_payloads(content, payloads: List) -> Any:
+    """
+    Inverse of split_payloads
+    """
+    if not payloads:
+        return content
+    return _join(content, payloads)
+
+
+def _split(value, payloads: list):
+    if isinstance(value, str):
+        if len(value) < PAYLOAD_MIN_SIZE:
+            return value
+        payloads.append(PickleBuffer(value.encode('utf-8')))
+        return PayloadRef(len(payloads) - 1)
+    if isinstance(value, dict):
+        return {key: _split(item, payloads) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_split(item, payloads) for item in value]
+    return value
+
+
+def _join(value, payloads: list):
+    if isinstance(value, PayloadRef):
+        return str(payloads[value.index], 'utf-8')
+    if isinstance(value, dict):
+        return {key: _join(item, payloads) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_join(item, payloads) for item in value]
+    return value
@@ -1,4 +1,7 @@
+from .blob_store import BlobStore
+from .cell_features import CellFeatures
 from .cell_output import CellOutput
+from .cell_pool import CellPool
 from .cells import Cell, CodeCell, MarkdownCell, RawCell
 from .output_parsers import HtmlParser, ImageParser, TextParser
 
@@ -7,4 +10,13 @@ CellOutput.register_parser('text/html', HtmlParser())
 CellOutput.register_parser('image', ImageParser())
 
 
-__all__ = ['Cell', 'CellOutput', 'MarkdownCell', 'CodeCell', 'RawCell']
+__all__ = [
+    'BlobStore',
+    'Cell',
+    'CellFeatures',
+    'CellOutput',
+    'CellPool',
+    'MarkdownCell',
+    'CodeCell',
+    'RawCell',
+]
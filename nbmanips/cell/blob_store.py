@@ -0,0 +1,73 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Union
+
+# -- Constants --
+BLOB_REFERENCE_PREFIX = 'nbmanips-blob:sha256:'
+
+
+class BlobStore:
+    """
+    Content-addressed store of output payloads, keyed by their SHA-256 digest.
+    Identical payloads are only stored once.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def put(self, payload: Union[str, List[str]]) -> str:
+        """
+        Add a payload to the store
+        :param payload: output payload (str or list of lines)
+        :return: the reference to store in the notebook instead of the payload
+        """
+        if not isinstance(payload, str):
+            payload = ''.join(payload)
+
+        content = payload.encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not blob_path.exists():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=str(blob_path.parent))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, str(blob_path))
+        return self.reference(digest)
+
+    def get(self, reference: str) -> str:
+        """
+        Read the payload of a reference
+        :param reference: reference returned by put
+        :return: the original payload
+        """
+        digest = self.parse_reference(reference)
+        if digest is None:
+            raise ValueError(f'Invalid blob reference: {reference!r}')
+
+        blob_path = self._blob_path(digest)
+        if not blob_path.exists():
+            raise FileNotFoundError(f'Blob {digest} not found in {self.path}')
+        return blob_path.read_bytes().decode('utf-8')
+
+    def __contains__(self, reference: str) -> bool:
+        digest = self.parse_reference(reference)
+        return digest is not None and self._blob_path(digest).exists()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.path / digest[:2] / digest[2:]
+
+    @staticmethod
+    def reference(digest: str) -> str:
+        return BLOB_REFERENCE_PREFIX + digest
+
+    @staticmethod
+    def parse_reference(value) -> Optional[str]:
+        if isinstance(value, str) and value.startswith(BLOB_REFERENCE_PREFIX):
+            return value[len(BLOB_REFERENCE_PREFIX) :]
+        return None
+
+    def __repr__(self):
+        return f'<BlobStore "{self.path}">'
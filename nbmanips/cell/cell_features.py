@@ -0,0 +1,169 @@
+import json
+from typing import Any, Callable, ClassVar, Dict, Iterable, List, Optional, Tuple
+
+from .cell_output import DataOutput
+from .cell_utils import total_size
+
+# byte sizes of a cell: (size of the source, sizes of the outputs), where the size
+# of an output is (its mime types, its size, the sizes of its data items or None)
+ByteSizes = Tuple[int, Tuple[Tuple[frozenset, int, Optional[Dict[str, int]]], ...]]
+
+
+class CellFeatures:
+    """
+    Feature table of the cells of a notebook: one column per feature, computed
+    lazily (the first time a cell is asked for it), and kept until the cell
+    changes. The default selectors read the features of the cells from the table
+    of their notebook instead of deriving them on each call.
+
+    The table is only used if it is enabled (with the selection cache of the
+    notebook): the changes made directly to the raw cells are not seen by it.
+    """
+
+    # feature name -> function computing the feature of a Cell
+    _features: ClassVar[Dict[str, Callable[[Any], Any]]] = {}
+
+    def __init__(self):
+        # feature name -> id(raw cell) -> (raw cell, value)
+        self._columns: Dict[str, Dict[int, Tuple[dict, Any]]] = {}
+
+        # features are computed on each call unless the table is enabled
+        self.enabled = False
+
+    @classmethod
+    def register_feature(cls, name: str, function: Callable[[Any], Any]) -> None:
+        """
+        Registers a feature
+
+        :param name: name of the feature
+        :param function: function taking a Cell, and returning its feature
+        """
+        cls._features[name] = function
+
+    @classmethod
+    def compute(cls, name: str, cell) -> Any:
+        """
+        Computes the feature of a cell, without caching it
+        """
+        return cls._features[name](cell)
+
+    def get(self, name: str, cell) -> Any:
+        """
+        Returns the feature of a cell, computing it if needed
+        """
+        if not self.enabled:
+            return self._features[name](cell)
+
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns.setdefault(name, {})
+
+        raw_cell = cell.cell
+        entry = column.get(id(raw_cell))
+        if entry is not None and entry[0] is raw_cell:
+            return entry[1]
+
+        value = self._features[name](cell)
+        column[id(raw_cell)] = (raw_cell, value)
+        return value
+
+    def column(self, name: str, cells: Iterable) -> List[Any]:
+        """
+        Returns the features of cells, in order
+        """
+        return [self.get(name, cell) for cell in cells]
+
+    def enable(self, enabled: bool = True) -> None:
+        """
+        Enables (or disables) the table. The features computed before are dropped.
+        """
+        self._columns = {}
+        self.enabled = enabled
+
+    def discard(self, raw_cell: dict) -> None:
+        """
+        Forgets the features of a raw cell (the cell changed)
+        """
+        for column in self._columns.values():
+            column.pop(id(raw_cell), None)
+
+    def prune(self, raw_cells: Iterable[dict]) -> None:
+        """
+        Keeps the features of the given raw cells only
+        """
+        kept = {id(raw_cell) for raw_cell in raw_cells}
+        for name, column in list(self._columns.items()):
+            self._columns[name] = {
+                key: entry for key, entry in column.items() if key in kept
+            }
+
+
+def byte_size(sizes: ByteSizes, output_types=None, ignore_source=False) -> int:
+    """
+    Byte size of a cell (same as Cell.byte_size), from its byte sizes feature
+    """
+    source_size, outputs = sizes
+    size = 0 if ignore_source else source_size
+    for types, output_size, item_sizes in outputs:
+        if output_types is None:
+            size += output_size
+        elif not types & output_types:
+            continue
+        elif item_sizes is None:
+            size += output_size
+        else:
+            # size of the JSON object of the selected data items
+            selected = [item_sizes[key] for key in item_sizes if key in output_types]
+            size += 2 + sum(selected) + 2 * max(len(selected) - 1, 0)
+    return size
+
+
+def _get_tags(cell) -> frozenset:
+    return frozenset(cell.metadata.get('tags', ()))
+
+
+def _get_lower_tags(cell) -> frozenset:
+    return frozenset(tag.lower() for tag in cell.metadata.get('tags', ()))
+
+
+def _get_slide_type(cell) -> Optional[str]:
+    slideshow = cell.metadata.get('slideshow')
+    if not slideshow or 'slide_type' not in slideshow:
+        return None
+    return slideshow['slide_type']
+
+
+def _get_output_types(cell) -> frozenset:
+    output_types = set()
+    for cell_output in cell.outputs:
+        output_types |= cell_output.output_types
+    return frozenset(output_types)
+
+
+def _get_byte_sizes(cell) -> ByteSizes:
+    outputs = []
+    for cell_output in cell.outputs:
+        item_sizes = None
+        if isinstance(cell_output, DataOutput):
+            item_sizes = {
+                key: len(json.dumps(key)) + 2 + total_size(value)
+                for key, value in cell_output.content['data'].items()
+            }
+        outputs.append(
+            (
+                frozenset(cell_output.output_types),
+                total_size(cell_output.content),
+                item_sizes,
+            )
+        )
+    return total_size(cell['source']), tuple(outputs)
+
+
+CellFeatures.register_feature('type', lambda cell: cell.type)
+CellFeatures.register_feature('tags', _get_tags)
+CellFeatures.register_feature('lower_tags', _get_lower_tags)
+CellFeatures.register_feature('slide_type', _get_slide_type)
+CellFeatures.register_feature('output_types', _get_output_types)
+CellFeatures.register_feature('has_output', lambda cell: cell.output != '')
+CellFeatures.register_feature('source_length', lambda cell: len(cell.source))
+CellFeatures.register_feature('byte_sizes', _get_byte_sizes)
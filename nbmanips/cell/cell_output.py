@@ -1,16 +1,67 @@
+from collections.abc import Mapping
 from typing import Dict, Optional
 
-from .cell_utils import _get_output_types, _to_html, total_size
+from nbmanips._pickling import join_payloads, split_payloads
+
+from .blob_store import BlobStore
+from .cell_utils import _get_output_types, _to_html, total_size, truncate_text
 from .output_parsers import ParserBase
 
 
+def _truncate_field(content: dict, key: str, text: str, max_size: int, lines=False):
+    """
+    Returns content with content[key] truncated so that the serialized content
+    fits in max_size bytes, or None if even the truncation marker does not fit
+
+    :param lines: True if the field is stored as a list of lines
+    """
+    budget = max_size - (total_size({**content, key: ''}) - total_size(''))
+    while budget >= 0:
+        value = truncate_text(text, budget)
+        new_content = {**content, key: value.split('\n') if lines else value}
+        excess = total_size(new_content) - max_size
+        if excess <= 0:
+            return new_content
+        budget -= excess
+    return None
+
+
+class OutputData(Mapping):
+    """
+    Read-only view of the data of an output that resolves the payloads
+    offloaded to a BlobStore when they are accessed.
+    """
+
+    __slots__ = ('_data', '_store')
+
+    def __init__(self, data: dict, store: BlobStore):
+        self._data = data
+        self._store = store
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if BlobStore.parse_reference(value) is not None:
+            return self._store.get(value)
+        return value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
 class CellOutput:
+    __slots__ = ('content', 'blob_store')
+
     output_type = None
     _output_types: Dict[str, type] = {}
     _parsers: Dict[str, ParserBase] = {}
 
-    def __init__(self, content):
+    def __init__(self, content, blob_store: Optional[BlobStore] = None):
         self.content = content
+        # store resolving the payloads offloaded by offload (not saved in the notebook)
+        self.blob_store = blob_store
 
     @property
     def output_types(self) -> set:
@@ -35,6 +86,19 @@ class CellOutput:
         """
         return output_types & self.output_types
 
+    def truncate(self, max_size: int) -> Optional[dict]:
+        """
+        Returns the content of the output reduced to max_size bytes,
+        or None if it cannot be reduced and should be dropped
+        """
+        return self.content if total_size(self.content) <= max_size else None
+
+    def offload(self, store: BlobStore, min_size: int, output_types=None):
+        pass
+
+    def rehydrate(self, store: Optional[BlobStore] = None):
+        pass
+
     def byte_size(self, output_types: Optional[set]):
         if output_types is None or self.has_output_type(output_types):
             return total_size(self.content)
@@ -58,11 +122,19 @@ class CellOutput:
     def default_parsers(self) -> set:
         return {key for key, value in self._parsers.items() if value.default_state}
 
+    def __reduce_ex__(self, protocol):
+        return _rebuild_output, (
+            *split_payloads(self.content, protocol),
+            self.blob_store,
+        )
+
     def __new__(cls, content, *args, **kwargs):
         output_type = content['output_type']
         output_class = cls._output_types[output_type]
         obj = super().__new__(output_class)
-        output_class.__init__(obj, content, *args, **kwargs)
+        if not isinstance(obj, cls):
+            # __init__ is only called automatically on instances of cls
+            output_class.__init__(obj, content, *args, **kwargs)
         return obj
 
     def __init_subclass__(cls, output_type=None, **kwargs):
@@ -73,6 +145,8 @@ class CellOutput:
 
 
 class StreamOutput(CellOutput, output_type='stream'):
+    __slots__ = ()
+
     @property
     def text(self):
         return self.content['text']
@@ -112,8 +186,13 @@ class StreamOutput(CellOutput, output_type='stream'):
     def erase_output(self, output_types: set):
         return None if self.has_output_type(output_types) else self.content
 
+    def truncate(self, max_size: int) -> Optional[dict]:
+        return _truncate_field(self.content, 'text', self.text, max_size)
+
 
 class DataOutput(CellOutput):
+    __slots__ = ()
+
     _default_data_types = ['text', 'image', 'text/html']
 
     @classmethod
@@ -131,6 +210,13 @@ class DataOutput(CellOutput):
         )
         return s1, s2
 
+    @property
+    def data(self):
+        store = self.blob_store
+        if store is None:
+            return self.content['data']
+        return OutputData(self.content['data'], store)
+
     def to_str(self, parsers=None, parsers_config=None, excluded_data_types=None):
         parsers = self.default_parsers if parsers is None else set(parsers)
         parsers_config = parsers_config or {}
@@ -138,7 +224,7 @@ class DataOutput(CellOutput):
             set() if excluded_data_types is None else set(excluded_data_types)
         )
 
-        data = self.content['data']
+        data = self.data
         for data_type in sorted(data, key=lambda x: self._get_key(x, parsers)):
             alt_data_types = _get_output_types(data_type)
             if alt_data_types & excluded_data_types:
@@ -160,23 +246,25 @@ class DataOutput(CellOutput):
             set() if excluded_data_types is None else set(excluded_data_types)
         )
 
-        data = self.content['data'].copy()
-        for data_type in list(data.keys()):
-            if _get_output_types(data_type) & excluded_data_types:
-                data.pop(data_type, None)
+        data = self.data
+        data_types = [
+            data_type
+            for data_type in data
+            if not (_get_output_types(data_type) & excluded_data_types)
+        ]
 
-        if 'text/html' in data:
+        if 'text/html' in data_types:
             output_text = data['text/html']
             if not isinstance(output_text, str):
                 output_text = '\n'.join(output_text)
             return output_text
 
-        for data_type in data:
+        for data_type in data_types:
             if data_type.startswith('image'):
                 content = data['image/png']
                 return f'<img src="data:image/png;base64, {content}"/>'
 
-        if 'text/plain' in data:
+        if 'text/plain' in data_types:
             output_text = data['text/plain']
             if not isinstance(output_text, str):
                 output_text = '\n'.join(output_text)
@@ -184,6 +272,67 @@ class DataOutput(CellOutput):
 
         return ''
 
+    def truncate(self, max_size: int) -> Optional[dict]:
+        # text/plain is truncated, the other MIME types are kept if they fit
+        # (the caller reports the ones that were removed)
+        remaining = max_size - total_size({**self.content, 'data': {}})
+        data = {}
+        for data_type, value in self.content['data'].items():
+            # the size of an entry includes its key and separator
+            overhead = total_size({data_type: ''}) - total_size('')
+            size = total_size(value) + overhead
+            if size > remaining and data_type.startswith('text/plain'):
+                value = truncate_text(value, max(remaining - overhead, 0))
+                size = total_size(value) + overhead
+            if size <= remaining:
+                data[data_type] = value
+                remaining -= size
+
+        if not data:
+            return None
+        return {**self.content, 'data': data}
+
+    def offload(self, store: BlobStore, min_size: int, output_types=None):
+        """
+        Move the payloads bigger than min_size to a BlobStore
+
+        :param store: BlobStore where to put the payloads
+        :param min_size: minimum byte size of the payloads to offload
+        :param output_types: Output Types(MIME types) to offload: image/png, text/html, ...
+        """
+        previous_store = self.blob_store
+        if previous_store is not None and previous_store.path != store.path:
+            self.rehydrate(previous_store)
+
+        data = self.content['data']
+        for data_type, value in data.items():
+            if BlobStore.parse_reference(value) is not None:
+                continue
+            if output_types is not None and not (
+                _get_output_types(data_type) & output_types
+            ):
+                continue
+            if total_size(value) >= min_size:
+                data[data_type] = store.put(value)
+        self.blob_store = store
+
+    def rehydrate(self, store: Optional[BlobStore] = None):
+        """
+        Restore the payloads that were offloaded to a BlobStore
+
+        :param store: BlobStore to read the payloads from (default: the output's store)
+        """
+        store = store or self.blob_store
+        data = self.content['data']
+        for data_type, value in data.items():
+            if BlobStore.parse_reference(value) is None:
+                continue
+            if store is None:
+                raise ValueError(
+                    'The output references offloaded payloads: a BlobStore is needed'
+                )
+            data[data_type] = store.get(value)
+
     def erase_output(self, output_types: set):
         for key in output_types:
             self.content['data'].pop(key, None)
@@ -216,6 +365,8 @@ class DataOutput(CellOutput):
 
 
 class ErrorOutput(CellOutput, output_type='error'):
+    __slots__ = ()
+
     @property
     def ename(self):
         return self.content['ename']
@@ -258,12 +409,26 @@ class ErrorOutput(CellOutput, output_type='error'):
     def erase_output(self, output_types: set):
         return None if self.has_output_type(output_types) else self.content
 
+    def truncate(self, max_size: int) -> Optional[dict]:
+        traceback = '\n'.join(self.traceback)
+        return _truncate_field(
+            self.content, 'traceback', traceback, max_size, lines=True
+        )
+
 
 class DisplayData(DataOutput, output_type='display_data'):
+    __slots__ = ()
+
     pass
 
 
 class ExecuteResult(DataOutput, output_type='execute_result'):
+    __slots__ = ()
+
     @property
     def execution_count(self):
         return self.content.get('execution_count', None)
+
+
+def _rebuild_output(content, payloads, blob_store=None):
+    return CellOutput(join_payloads(content, payloads), blob_store)
@@ -0,0 +1,100 @@
+import threading
+from typing import Dict, Optional
+from weakref import WeakValueDictionary
+
+from .cell_features import CellFeatures
+from .cells import Cell
+
+
+class CellPool:
+    """
+    Cell wrappers of the raw cells of a notebook, reused across iterations.
+    """
+
+    # id(raw notebook) -> CellPool
+    _pools: 'WeakValueDictionary[int, CellPool]' = WeakValueDictionary()
+
+    def __init__(self, raw_nb: dict):
+        self.raw_nb = raw_nb
+
+        # id(raw cell) -> Cell wrapping it (at its last known position)
+        self._cells: Dict[int, Cell] = {}
+        # lock of the writers of _cells, readers don't need it
+        self._lock = threading.Lock()
+
+        # features of the raw cells, shared by their wrappers
+        self.features = CellFeatures()
+
+    @classmethod
+    def of(cls, raw_nb: dict) -> 'CellPool':
+        """
+        Returns the pool of a raw notebook, creating it if needed
+        """
+        pool = cls.get(raw_nb)
+        if pool is None:
+            pool = cls(raw_nb)
+            cls._pools[id(raw_nb)] = pool
+        return pool
+
+    @classmethod
+    def get(cls, raw_nb: dict) -> Optional['CellPool']:
+        pool = cls._pools.get(id(raw_nb))
+        if pool is not None and pool.raw_nb is raw_nb:
+            return pool
+        return None
+
+    def cell(self, raw_cell: dict, num: int, cells: Optional[list] = None) -> Cell:
+        """
+        Returns the wrapper of a raw cell, at position num.
+        Wrappers are reused only at the same position: the number of a wrapper
+        yielded to a reader never changes.
+
+        :param raw_cell: raw cell
+        :param num: position of the raw cell
+        :param cells: cell list the position refers to (default: the current one).
+            The wrappers made for an outdated cell list are not pooled.
+        """
+        cell = self._cells.get(id(raw_cell))
+        if cell is not None and cell.cell is raw_cell and cell._num == num:
+            return cell
+
+        new_cell = Cell(raw_cell, num)
+        new_cell._features = self.features
+        if cell is not None and cell.cell is raw_cell:
+            # the raw cell moved: its digests are still valid
+            new_cell._digests = cell._digests
+
+        if cells is None or cells is self.raw_nb['cells']:
+            with self._lock:
+                if len(self._cells) > 2 * len(self.raw_nb['cells']) + 64:
+                    self._prune()
+                self._cells[id(raw_cell)] = new_cell
+        return new_cell
+
+    def rebind(self, raw_cell: dict, clone: dict) -> None:
+        """
+        Binds the pooled wrapper of a raw cell to its clone, that replaced it
+        in the notebook
+        """
+        with self._lock:
+            cell = self._cells.pop(id(raw_cell), None)
+            if cell is not None and cell.cell is raw_cell:
+                cell.cell = clone
+                self._cells[id(clone)] = cell
+
+    def prune(self) -> None:
+        """
+        Drops the wrappers and the features of the raw cells removed from the notebook
+        """
+        with self._lock:
+            self._prune()
+
+    def _prune(self) -> None:
+        # drop the wrappers of the raw cells that were removed from the notebook
+        self._cells = {
+            id(raw_cell): self._cells[id(raw_cell)]
+            for raw_cell in self.raw_nb['cells']
+            if id(raw_cell) in self._cells
+            and self._cells[id(raw_cell)].cell is raw_cell
+        }
+        self.features.prune(self.raw_nb['cells'])
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import re
 import shutil
@@ -39,6 +40,9 @@ HTML_IMG_REGEX = (
 )
 HTML_IMG_EXPRESSION = r'<img {PREFIX}src="attachment:{attachment_name}"{SUFFIX}>'
 
+# --- Output Budget Constants ---
+TRUNCATION_MARKER = '\n[... output truncated by nbmanips ({size} bytes) ...]\n'
+
 # -- Styles --
 styles = {
     'single': '││┌─┐└─┘',
@@ -138,6 +142,21 @@ def _get_output_types(output_type: Union[set, dict, str]) -> set:
     return output_types
 
 
+def _join_output_lines(output: dict) -> dict:
+    """
+    Returns the output with its multiline strings (text and data) joined
+    """
+    output = dict(output)
+    if isinstance(output.get('text'), list):
+        output['text'] = ''.join(output['text'])
+    if isinstance(output.get('data'), dict):
+        output['data'] = {
+            key: ''.join(value) if isinstance(value, list) else value
+            for key, value in output['data'].items()
+        }
+    return output
+
+
 def _to_html(text):
     import html
 
@@ -173,3 +192,96 @@ def burn_attachment(match, cell, assets_path: Path, expr):
 
 def total_size(o):
     return len(json.dumps(o).encode('utf-8'))
+
+
+def truncate_text(text: Union[str, list], max_size: int) -> str:
+    """
+    Keeps the head and the tail of a text so that it fits in max_size bytes
+    (as measured by total_size). The removed part is replaced by an explicit marker.
+
+    :param text: text to truncate (str or list of lines)
+    :param max_size: maximum byte size of the result
+    """
+    if not isinstance(text, str):
+        text = ''.join(text)
+
+    size = total_size(text)
+    if size <= max_size:
+        return text
+
+    content = text.encode('utf-8')
+    marker = TRUNCATION_MARKER.format(size=len(content))
+
+    # scale the budget to take the json escaping of the text into account
+    budget = (max_size - total_size(marker)) * len(content) // size
+    while True:
+        budget = max(budget, 0)
+        head = content[: budget - budget // 2].decode('utf-8', errors='ignore')
+        tail = content[len(content) - budget // 2 :].decode('utf-8', errors='ignore')
+        result = head + marker + tail
+
+        excess = total_size(result) - max_size
+        if excess <= 0 or budget == 0:
+            return result
+        budget -= excess
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def content_stamp(value) -> list:
+    """
+    Cheap fingerprint of a json value: its structure, and its leaves kept by reference.
+    Comparing two stamps (see same_stamp) tells if the value changed, without
+    reading its strings.
+    """
+    stamp: list = []
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stamp += (dict, len(value), *value)
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stamp += (list, len(value))
+            stack.extend(value)
+        else:
+            stamp.append(value)
+    return stamp
+
+
+def same_stamp(stamp: list, other: list) -> bool:
+    """
+    True if two stamps (see content_stamp) are the stamps of the same value
+    """
+    return len(stamp) == len(other) and all(
+        a is b or (type(a) is type(b) and not isinstance(a, str) and a == b)
+        for a, b in zip(stamp, other)
+    )
+
+
+def update_digest(hasher, value) -> None:
+    """
+    Feeds a canonical encoding of a json value to a hasher, without serializing it.
+    Dictionaries are hashed in key order, strings are length-prefixed.
+    """
+    if isinstance(value, str):
+        content = value.encode('utf-8')
+        hasher.update(b's%d:' % len(content))
+        hasher.update(content)
+    elif isinstance(value, dict):
+        hasher.update(b'd%d:' % len(value))
+        for key in sorted(value):
+            update_digest(hasher, key)
+            update_digest(hasher, value[key])
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b'l%d:' % len(value))
+        for item in value:
+            update_digest(hasher, item)
+    elif value is None or isinstance(value, bool):
+        hasher.update(b'%r;' % value)
+    elif isinstance(value, (int, float)):
+        hasher.update(b'n%r;' % value)
+    else:
+        raise TypeError(f'Cannot hash value of type {type(value).__name__!r}')
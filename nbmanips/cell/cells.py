@@ -1,4 +1,5 @@
 import re
+from copy import deepcopy
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Union
 
@@ -11,30 +12,57 @@ except ImportError:
     pygments = None
     get_lexer_by_name = None
 
+from nbmanips._pickling import join_payloads, split_payloads
 from nbmanips.cell.cell_utils import (
     FORMATTER,
+    _join_output_lines,
+    content_stamp,
     get_mime_type,
     monochrome,
+    new_hasher,
     printable_cell,
+    same_stamp,
     total_size,
+    update_digest,
 )
 
+from .blob_store import BlobStore
+from .cell_features import CellFeatures
 from .cell_output import CellOutput
 
 
 class Cell:
+    __slots__ = ('cell', '_num', '_state', '_digests', '_features')
+
     _cell_types: Dict[str, type] = {}
 
     def __init__(self, content, num=None):
         self.cell = content
         self._num = num
+        self._state = None
+        self._digests = None
+        self._features = None
 
     def __getitem__(self, key):
         return self.cell[key]
 
     def __setitem__(self, key, value):
+        if key == 'id':
+            self.id = value
+            return
+        self._before_change()
         self.cell[key] = value
 
+    def _before_change(self):
+        """
+        Notifies the notebook the cell is bound to that the cell is about to change.
+        """
+        self._digests = None
+        if self._features is not None:
+            self._features.discard(self.cell)
+        if self._state is not None:
+            self._state.on_cell_change(self)
+
     @property
     def type(self):
         return self.cell['cell_type']
@@ -45,14 +73,32 @@ class Cell:
 
     @id.setter
     def id(self, new_id):
+        old_id = self.id
+        self._before_change()
         self.cell['id'] = new_id
+        if self._state is not None:
+            self._state.on_cell_id_change(old_id, new_id)
 
     @property
     def num(self):
         return self._num
 
+    @property
+    def version(self) -> int:
+        """
+        Number of changes made to the cell through the Cell methods, since it
+        was added to (or loaded with) its notebook
+        """
+        if self._state is None:
+            return 0
+        return self._state.get_cell_version(self.cell)
+
     @property
     def metadata(self):
+        """
+        Metadata of the cell. Changes made directly to it are not tracked by the
+        notebook: use update_metadata, or Notebook.touch(cell) after the changes.
+        """
         return self.cell['metadata']
 
     @property
@@ -69,7 +115,34 @@ class Cell:
 
     @property
     def outputs(self):
-        return map(CellOutput, self.cell.get('outputs', []))
+        blob_store = self.blob_store
+        return (
+            CellOutput(content, blob_store) for content in self.cell.get('outputs', [])
+        )
+
+    @property
+    def blob_store(self) -> Optional[BlobStore]:
+        """
+        BlobStore of the notebook the cell is bound to, resolving the offloaded payloads
+        """
+        return None if self._state is None else self._state.blob_store
+
+    def get_feature(self, name: str) -> Any:
+        """
+        Returns a feature of the cell (see CellFeatures). If the selection cache
+        of its notebook is enabled, the feature is cached in the feature table of
+        the notebook until the cell is changed through its methods.
+        """
+        if self._features is None:
+            return CellFeatures.compute(name, self)
+        return self._features.get(name, self)
+
+    @property
+    def caches_features(self) -> bool:
+        """
+        True if the features of the cell are cached (see get_feature)
+        """
+        return self._features is not None and self._features.enabled
 
     def get_copy(self, new_id=None):
         from copy import deepcopy
@@ -79,6 +152,68 @@ class Cell:
             cell.id = new_id
         return cell
 
+    def digest(self, outputs=True) -> str:
+        """
+        Content hash of the cell (its id is not part of the content)
+
+        :param outputs: include the outputs and the execution count
+        :return: hexadecimal digest
+        """
+        return self._digest(outputs).hex()
+
+    def digests(self) -> Dict[str, str]:
+        """
+        Content hashes of the source, the metadata and the outputs of the cell.
+        They are cached until the content of the cell changes.
+
+        :return: a dictionary of hexadecimal digests
+        """
+        return {key: value.hex() for key, value in self._get_digests().items()}
+
+    def _digest(self, outputs=True) -> bytes:
+        digests = self._get_digests()
+        hasher = new_hasher()
+        hasher.update(digests['source'])
+        hasher.update(digests['metadata'])
+        if outputs:
+            hasher.update(digests['outputs'])
+        return hasher.digest()
+
+    def _get_digests(self) -> Dict[str, bytes]:
+        cell = self.cell
+        # each part is hashed again only if its raw content changed since it was
+        # hashed, so that the changes made directly to the raw cell are seen too
+        raw_parts = {
+            'source': (cell['cell_type'], cell['source'], cell.get('attachments')),
+            'metadata': cell.get('metadata', {}),
+            'outputs': (cell.get('outputs', []), cell.get('execution_count')),
+        }
+
+        cached = self._digests or {}
+        digests = {}
+        for key, raw_part in raw_parts.items():
+            stamp = content_stamp(raw_part)
+            if key in cached and same_stamp(cached[key][0], stamp):
+                digests[key] = cached[key]
+                continue
+
+            hasher = new_hasher()
+            update_digest(hasher, self._get_hashed_part(key))
+            digests[key] = (stamp, hasher.digest())
+        self._digests = digests
+        return {key: digest for key, (_, digest) in digests.items()}
+
+    def _get_hashed_part(self, key: str):
+        cell = self.cell
+        if key == 'source':
+            return cell['cell_type'], self.get_source(), cell.get('attachments')
+        if key == 'metadata':
+            return cell.get('metadata', {})
+        return (
+            [_join_output_lines(output) for output in cell.get('outputs', [])],
+            cell.get('execution_count'),
+        )
+
     def get_output(
         self, text=True, parsers=None, parsers_config=None, excluded_data_types=None
     ):
@@ -117,6 +252,7 @@ class Cell:
             content = [
                 f'{line}\n' if i != len(lines) else line for i, line in enumerate(lines)
             ]
+        self._before_change()
         self.cell['source'] = content
 
     def contains(self, text, case=True, output=False, regex=False, flags=0):
@@ -151,12 +287,13 @@ class Cell:
         :param output_types: Output Type(MIME type) to delete: text/plain, text/html, image/png, ...
         :type output_types: set or str or None to delete all output
         """
+        self._before_change()
         outputs = list(self.outputs)
         if len(outputs) == 0:
             return
 
         if output_types is None:
-            self['outputs'] = []
+            self.cell['outputs'] = []
             return
         elif isinstance(output_types, str):
             output_types = {output_types}
@@ -169,7 +306,125 @@ class Cell:
             if new_output is not None:
                 new_outputs.append(new_output)
 
-        self['outputs'] = new_outputs
+        self.cell['outputs'] = new_outputs
+
+    def limit_output(
+        self,
+        max_output_size: Optional[int] = None,
+        max_cell_size: Optional[int] = None,
+        drop_above: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        Enforce an output size budget on the cell.
+        Outputs are truncated (head and tail are kept) or dropped.
+
+        :param max_output_size: maximum byte size of each output
+        :param max_cell_size: maximum byte size of all the outputs of the cell
+        :param drop_above: outputs bigger than drop_above bytes are dropped
+        :return: a report of the trimmed outputs, with the MIME types removed
+            from the outputs that were truncated
+        """
+        report: List[dict] = []
+
+        def trim(index, content, new_content):
+            removed = []
+            if new_content is not None and 'data' in content:
+                removed = [
+                    key for key in content['data'] if key not in new_content['data']
+                ]
+            report.append(
+                {
+                    'cell': self.num,
+                    'output': index,
+                    'action': 'dropped' if new_content is None else 'truncated',
+                    'size': total_size(content),
+                    'new_size': 0 if new_content is None else total_size(new_content),
+                    'removed': removed,
+                }
+            )
+            return new_content
+
+        outputs = []
+        for index, cell_output in enumerate(self.outputs):
+            content = cell_output.content
+            size = cell_output.byte_size(None)
+            if drop_above is not None and size > drop_above:
+                content = trim(index, content, None)
+            elif max_output_size is not None and size > max_output_size:
+                content = trim(index, content, cell_output.truncate(max_output_size))
+
+            if content is not None:
+                outputs.append((index, content))
+
+        if max_cell_size is not None:
+            remaining = max_cell_size
+            cell_outputs = outputs
+            outputs = []
+            for index, content in cell_outputs:
+                if total_size(content) > remaining:
+                    new_content = (
+                        CellOutput(content).truncate(remaining) if remaining else None
+                    )
+                    content = trim(index, content, new_content)
+
+                if content is not None:
+                    outputs.append((index, content))
+                    remaining -= total_size(content)
+                remaining = max(remaining, 0)
+
+        if report:
+            old_outputs = self.cell.get('outputs', [])
+            self._before_change()
+            # the raw cell may have been cloned (copy-on-write): the kept outputs
+            # are taken from the clone, the truncated ones are copied
+            new_outputs = self.cell.get('outputs', [])
+            self.cell['outputs'] = [
+                new_outputs[index]
+                if content is old_outputs[index]
+                else deepcopy(content)
+                for index, content in outputs
+            ]
+        return report
+
+    def offload_outputs(
+        self, store: BlobStore, min_size: int = 4096, output_types=None
+    ):
+        """
+        Move the output payloads bigger than min_size to a content-addressed store
+
+        :param store: BlobStore where to put the payloads
+        :param min_size: minimum byte size of the payloads to offload
+        :param output_types: Output Types(MIME type) to offload: image/png, text/html, ...
+        :type output_types: set or str or None to offload all output types
+        """
+        if isinstance(output_types, str):
+            output_types = {output_types}
+
+        self._before_change()
+        for cell_output in self.outputs:
+            cell_output.offload(store, min_size, output_types)
+        if self._state is not None:
+            self._state.blob_store = store
+
+    def rehydrate(self, store: Optional[BlobStore] = None):
+        """
+        Restore the output payloads that were offloaded to a BlobStore
+
+        :param store: BlobStore to read the payloads from (default: the one of the notebook)
+        """
+        self._before_change()
+        for cell_output in self.outputs:
+            cell_output.rehydrate(store)
+
+    def has_offloaded_outputs(self) -> bool:
+        """
+        True if some output payloads of the cell were offloaded to a BlobStore
+        """
+        return any(
+            BlobStore.parse_reference(value) is not None
+            for output in self.cell.get('outputs', ())
+            for value in output.get('data', {}).values()
+        )
 
     def has_output_type(self, output_types: set):
         """
@@ -215,6 +470,7 @@ class Cell:
         :param key: metadata key
         :param value: metadata value
         """
+        self._before_change()
         if 'metadata' not in self.cell:
             self.cell['metadata'] = {}
 
@@ -230,6 +486,7 @@ class Cell:
         Add tag to cell metadata.
         :param tag: tag to add
         """
+        self._before_change()
         if 'metadata' not in self.cell:
             self.cell['metadata'] = {}
 
@@ -250,6 +507,7 @@ class Cell:
         if 'metadata' not in self.cell or 'tags' not in self.metadata:
             return
 
+        self._before_change()
         while tag in self.metadata['tags']:
             self.metadata['tags'].remove(tag)
 
@@ -259,11 +517,17 @@ class Cell:
 
         return uuid.uuid4().hex[:8]
 
+    def __reduce_ex__(self, protocol):
+        # The cell is unpickled unbound, its long strings are out-of-band buffers
+        return _rebuild_cell, (*split_payloads(self.cell, protocol), self._num)
+
     def __new__(cls, content, *args, **kwargs):
         cell_type = content['cell_type']
         cell_class = cls._cell_types[cell_type]
         obj = super().__new__(cell_class)
-        cell_class.__init__(obj, content, *args, **kwargs)
+        if not isinstance(obj, cls):
+            # __init__ is only called automatically on instances of cls
+            cell_class.__init__(obj, content, *args, **kwargs)
         return obj
 
     def __init_subclass__(cls, cell_type=None, **kwargs):
@@ -273,6 +537,8 @@ class Cell:
 
 
 class CodeCell(Cell, cell_type='code'):
+    __slots__ = ()
+
     def to_str(
         self,
         width=None,
@@ -313,6 +579,8 @@ class CodeCell(Cell, cell_type='code'):
 
 
 class MarkdownCell(Cell, cell_type='markdown'):
+    __slots__ = ()
+
     _bs4_parser = 'lxml'
 
     def to_str(
@@ -337,15 +605,18 @@ class MarkdownCell(Cell, cell_type='markdown'):
 
     @property
     def attachments(self):
+        if 'attachments' not in self.cell:
+            self._before_change()
         return self.cell.setdefault('attachments', {})
 
     def attach(self, path: Union[str, Path], attachment_name: Optional[str] = None):
         import base64
 
+        self._before_change()
         mime_type = get_mime_type(str(path))
         path = Path(path)
         attachment_name = attachment_name or path.name
-        self.attachments[attachment_name] = {
+        self.cell.setdefault('attachments', {})[attachment_name] = {
             mime_type: base64.encodebytes(path.read_bytes()).decode('utf-8')
         }
 
@@ -354,7 +625,9 @@ class MarkdownCell(Cell, cell_type='markdown'):
         from nbconvert.filters.markdown_mistune import IPythonRenderer, MarkdownWithMath
 
         renderer = IPythonRenderer(
-            escape=False, attachments=self.attachments, exclude_anchor_links=True
+            escape=False,
+            attachments=self.cell.get('attachments', {}),
+            exclude_anchor_links=True,
         )
         return MarkdownWithMath(renderer=renderer).render(self.source)
 
@@ -366,4 +639,10 @@ class MarkdownCell(Cell, cell_type='markdown'):
 
 
 class RawCell(Cell, cell_type='raw'):
+    __slots__ = ()
+
     pass
+
+
+def _rebuild_cell(content, payloads, num):
+    return Cell(join_payloads(content, payloads), num)
@@ -1,3 +1,4 @@
+import re
 import warnings
 from pathlib import Path
 
@@ -5,15 +6,19 @@ import click
 import cloudpickle
 
 
-def export(nb, input_path, output_path, force=False):
-    default_output = output_path is None
-    output_path = input_path if output_path is None else output_path
+def check_overwrite(output_path, force=False):
     if not force and Path(output_path).exists():
         click.echo(
             f'Notebook "{output_path}" already exists.' ' Use --force to overwrite'
         )
         raise click.Abort()
 
+
+def export(nb, input_path, output_path, force=False):
+    default_output = output_path is None
+    output_path = input_path if output_path is None else output_path
+    check_overwrite(output_path, force)
+
     if output_path.lower().endswith('.dbc'):
         return nb.to_dbc(output_path)
 
@@ -38,3 +43,36 @@ def get_selector():
         return None
 
     return cloudpickle.loads(stream)
+
+
+_SIZE_UNITS = {
+    '': 1,
+    'B': 1,
+    'K': 1024,
+    'KB': 1024,
+    'M': 1024**2,
+    'MB': 1024**2,
+    'G': 1024**3,
+    'GB': 1024**3,
+}
+
+
+def parse_size(size: str) -> int:
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*', str(size))
+    if match is None or match.group(2).upper() not in _SIZE_UNITS:
+        raise ValueError(f'Invalid size: {size!r}. Example: 512KB, 20MB, 1GB')
+
+    value, unit = match.groups()
+    return int(float(value) * _SIZE_UNITS[unit.upper()])
+
+
+class ByteSize(click.ParamType):
+    name = 'size'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return parse_size(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
@@ -1,6 +1,3 @@
-from functools import reduce
-from operator import add
-
 import click
 
 from nbmanips import Notebook
@@ -29,15 +26,19 @@ __all__ = [
     help='Notebook to apply selector on. if unused, selector will be applied to all notebooks',
 )
 def cat(file, select, output, force):
-    nbs = [Notebook.read(notebook_path) for notebook_path in file]
     selector = get_selector()
+    if select is not None and select < 0:
+        select += len(file)
 
-    if select is None:
-        nbs = [nb.select(selector) for nb in nbs]
-    else:
-        nbs[select] = nbs[select].select(selector)
+    def iter_notebooks():
+        # Notebooks are read one at a time, while they are concatenated
+        for i, notebook_path in enumerate(file):
+            nb = Notebook.read(notebook_path)
+            if select is None or i == select:
+                nb = nb.select(selector)
+            yield nb
 
-    nb = reduce(add, nbs)
+    nb = Notebook.concat(iter_notebooks())
     if output:
         export(nb, ..., output, force=force)
     else:
@@ -286,3 +286,45 @@ def slides(
         theme=theme,
         **dict(kwargs),
     )
+
+
+_MULTI_FORMATS = {
+    'html': ('html', '.html'),
+    'md': ('markdown', '.md'),
+    'markdown': ('markdown', '.md'),
+    'py': ('python', '.py'),
+    'python': ('python', '.py'),
+    'slides': ('slides', '.slides.html'),
+}
+
+
+@convert.command(help='Exports to several formats in one pass.')
+@click.argument('notebook_path')
+@click.option(
+    '--to',
+    '-t',
+    'formats',
+    required=True,
+    help=f'comma separated list of formats: {", ".join(_MULTI_FORMATS)}',
+)
+@click.option(
+    '--output', '-o', help='path to export to (without extension)', default=None
+)
+@click.option(
+    '--workers', '-w', type=int, help='number of concurrent writers', default=None
+)
+def multi(notebook_path, formats, output, workers):
+    base = os.path.splitext(notebook_path)[0] if output is None else output
+
+    targets = {}
+    for fmt in formats.split(','):
+        fmt = fmt.strip().lower()
+        if fmt not in _MULTI_FORMATS:
+            raise click.BadParameter(f'Unknown format: {fmt!r}', param_hint='--to')
+        exporter_name, ext = _MULTI_FORMATS[fmt]
+        targets[exporter_name] = base + ext
+
+    nb = Notebook.read(notebook_path)
+    selector = get_selector()
+
+    nb.select(selector).convert_many(targets, max_workers=workers)
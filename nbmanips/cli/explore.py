@@ -108,16 +108,37 @@ def list_(notebook_path):
 
 @click.command(help='Search string in all selected cells')
 @click.argument('notebook_path')
-@click.option('--text', '-t', required=True)
+@click.option('--text', '-t', default=None)
+@click.option(
+    '--patterns-file',
+    '-p',
+    type=click.File('r', encoding='utf-8'),
+    default=None,
+    help='file of the strings to search, one per line',
+)
 @click.option('--case/--no-case', default=False)
 @click.option('--regex', '-r', is_flag=True, default=False)
 @click.option('--output', '-o', is_flag=True, default=False)
-def search(notebook_path, text, case, output, regex):
+def search(notebook_path, text, patterns_file, case, output, regex):
+    if (text is None) == (patterns_file is None):
+        raise click.UsageError('Provide either --text or --patterns-file')
+
     nb = Notebook.read(notebook_path)
     selector = get_selector()
 
-    result = nb.select(selector).search_all(text, case, output, regex)
-    click.echo(result)
+    if text is not None:
+        result = nb.select(selector).search_all(text, case, output, regex)
+        click.echo(result)
+        return
+
+    patterns = [line.rstrip('\r\n') for line in patterns_file]
+    patterns = [pattern for pattern in patterns if pattern]
+    results = nb.select(selector).search_many(
+        patterns, regex=regex, case=case, output=output
+    )
+    for pattern, matches in results.items():
+        if matches:
+            click.echo(f'{pattern}: {list(matches)}')
 
 
 @click.command(help='Return the numbers of the selected cells')
@@ -1,11 +1,12 @@
 import os.path
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 from operator import add
 
 import click
 
 from nbmanips import Notebook
-from nbmanips.cli import export, get_selector
+from nbmanips.cli import ByteSize, check_overwrite, export, get_selector
 
 __all__ = [
     'erase',
@@ -14,6 +15,7 @@ __all__ = [
     'replace',
     'auto_slide',
     'erase_output',
+    'limit_output',
     'split',
     'burn',
 ]
@@ -141,12 +143,78 @@ def erase_output(notebook_path, output, output_types, force):
     export(nb, notebook_path, output, force=force)
 
 
-@click.command(help='Split the notebook based the cell indexes')
+@click.command(help='Truncate or drop the outputs exceeding a size budget')
+@click.argument('notebook_path')
+@click.option('--output', '-o', default=None)
+@click.option(
+    '--max-output-size',
+    type=ByteSize(),
+    default=None,
+    help='maximum size of each output (e.g. 1MB)',
+)
+@click.option(
+    '--max-cell-size',
+    type=ByteSize(),
+    default=None,
+    help='maximum size of the outputs of a cell (e.g. 5MB)',
+)
+@click.option(
+    '--drop-above',
+    type=ByteSize(),
+    default=None,
+    help='drop the outputs bigger than this size (e.g. 50MB)',
+)
+@click.option(
+    '--force',
+    '-f',
+    is_flag=True,
+    default=False,
+    help='Do not prompt for confirmation if file already exists',
+)
+def limit_output(
+    notebook_path, output, max_output_size, max_cell_size, drop_above, force
+):
+    nb = Notebook.read(notebook_path)
+    selector = get_selector()
+
+    report = nb.select(selector).limit_output(
+        max_output_size=max_output_size,
+        max_cell_size=max_cell_size,
+        drop_above=drop_above,
+    )
+    for entry in report:
+        removed = ''
+        if entry['removed']:
+            removed = f", removed {', '.join(entry['removed'])}"
+        click.echo(
+            f"cell {entry['cell']}, output {entry['output']}: {entry['action']}"
+            f" ({entry['size']} -> {entry['new_size']} bytes{removed})",
+            err=True,
+        )
+    export(nb, notebook_path, output, force=force)
+
+
+@click.command(help='Split the notebook based on cell indexes, the selection or a size')
 @click.argument('notebook_path')
 @click.argument('indexes', nargs=-1, required=False)
 @click.option('--output', '-o', default=None)
 @click.option('--index', '-i', multiple=True)
 @click.option('--use-selection', '-s', is_flag=True, default=False)
+@click.option(
+    '--max-size',
+    type=ByteSize(),
+    default=None,
+    help='split in notebooks whose cells fit in this size (e.g. 20MB)',
+)
+@click.option(
+    '--keep-sections',
+    is_flag=True,
+    default=False,
+    help='with --max-size, never split a heading section',
+)
+@click.option(
+    '--workers', '-w', type=int, help='number of concurrent writers', default=None
+)
 @click.option(
     '--force',
     '-f',
@@ -154,35 +222,55 @@ def erase_output(notebook_path, output, output_types, force):
     default=False,
     help='Do not prompt for confirmation if file already exists',
 )
-def split(notebook_path, output, indexes, index, force, use_selection):
+def split(
+    notebook_path,
+    output,
+    indexes,
+    index,
+    force,
+    use_selection,
+    max_size,
+    keep_sections,
+    workers,
+):
     if index or indexes:
         indexes = reduce(
             add, [index.split(',') for index in list(indexes) + list(index)]
         )
         indexes = [int(index) for index in indexes]
-    elif not use_selection:
+    elif not use_selection and max_size is None:
         raise ValueError('You need to specify the cells to split on')
 
-    if indexes and use_selection:
-        raise ValueError('Cannot use selection and indexes at the same time')
+    if sum([bool(indexes), use_selection, max_size is not None]) > 1:
+        raise ValueError('Use only one of indexes, selection and max size')
 
     nb = Notebook.read(notebook_path)
     selector = get_selector()
 
-    if use_selection:
+    if max_size is not None:
+        nbs = nb.select(selector).split_by_size(max_size, keep_sections=keep_sections)
+    elif use_selection:
         nbs = nb.select(selector).split_on_selection()
     else:
-        nbs = nb.select(selector).split(*indexes)
+        nbs = nb.select(selector).iter_split(*indexes)
 
-    # Exporting
+    # Exporting: the output paths are all checked before any part is written,
+    # then the parts are written concurrently
     base, ext = os.path.splitext(notebook_path)
     input_path = base + '-%d' + ext
-    for i, nb in enumerate(nbs):
-        if output:
-            output_path = output % i
-        else:
-            output_path = None
-        export(nb, input_path % i, output_path, force=force)
+    parts = [
+        (nb, input_path % i, output % i if output else None) for i, nb in enumerate(nbs)
+    ]
+    for nb, part_input_path, output_path in parts:
+        check_overwrite(output_path or part_input_path, force)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(export, nb, part_input_path, output_path, force=force)
+            for nb, part_input_path, output_path in parts
+        ]
+        for future in futures:
+            future.result()
 
 
 @click.command(help='Burn the images in markdown cells as attachments')
@@ -1,3 +1,14 @@
+from .cell_executor import CellExecutor
+from .corpus import NotebookCorpus
 from .notebook import DBC, IPYNB, ZPLN, Notebook
+from .shared_notebook import SharedNotebook
 
-__all__ = ['Notebook', 'IPYNB', 'DBC', 'ZPLN']
+__all__ = [
+    'Notebook',
+    'IPYNB',
+    'DBC',
+    'ZPLN',
+    'CellExecutor',
+    'NotebookCorpus',
+    'SharedNotebook',
+]
@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Union
+
+import cloudpickle
+
+from nbmanips.cell import Cell
+
+
+class CellExecutor:
+    """
+    Runs functions on cells with a pool of workers.
+    The pool is started on first use, and reused until the executor is closed.
+
+    :param workers: number of workers (default: number of CPUs)
+    :param executor: 'process' or 'thread'
+    :param chunksize: number of cells sent to a worker process at once
+    """
+
+    def __init__(
+        self, workers: Optional[int] = None, executor='process', chunksize=None
+    ):
+        if executor not in {'process', 'thread'}:
+            raise ValueError(f"executor must be 'process' or 'thread': {executor!r}")
+
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self.chunksize = chunksize
+        self._pool: Optional[Executor] = None
+
+    @property
+    def pool(self) -> Executor:
+        if self._pool is None:
+            if self.executor == 'process':
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def map(self, func: Callable[[Cell], Any], cells: List[Cell], chunksize=None):
+        """
+        Apply func to each cell, and return the results in order
+
+        :param func: function applied to cells
+        :param cells: list of cells
+        :param chunksize: number of cells sent to a worker process at once
+        """
+        return self._run(func, cells, chunksize, return_cells=False)
+
+    def apply(
+        self, func: Callable[[Cell], Optional[Cell]], cells: List[Cell], chunksize=None
+    ) -> List[Optional[dict]]:
+        """
+        Apply func to each cell, and return the raw content of the returned cells
+
+        :param func: function applied to cells
+        :param cells: list of cells
+        :param chunksize: number of cells sent to a worker process at once
+        :return: list of raw cells (None if func returned None)
+        """
+        return self._run(func, cells, chunksize, return_cells=True)
+
+    def _run(self, func, cells: List[Cell], chunksize, return_cells) -> list:
+        if self.executor == 'thread':
+            results = self.pool.map(func, cells)
+            if return_cells:
+                results = (None if cell is None else cell.cell for cell in results)
+            return list(results)
+
+        chunksize = chunksize or self.chunksize or self._get_chunksize(len(cells))
+        pickled_func = cloudpickle.dumps(func)
+        chunks = [
+            (pickled_func, [(cell.cell, cell.num) for cell in cells[i : i + chunksize]])
+            for i in range(0, len(cells), chunksize)
+        ]
+        runner = _apply_chunk if return_cells else _map_chunk
+        return [result for chunk in self.pool.map(runner, chunks) for result in chunk]
+
+    def _get_chunksize(self, n_cells: int) -> int:
+        # About 4 chunks per worker, to balance the load
+        return max(1, -(-n_cells // (self.workers * 4)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f'<CellExecutor {self.executor} workers={self.workers}>'
+
+
+@contextmanager
+def get_cell_executor(
+    workers: Optional[int] = None,
+    executor: Union[str, CellExecutor] = 'process',
+    chunksize=None,
+) -> Iterator[Optional[CellExecutor]]:
+    """
+    Yields the executor to use: the executor itself if it is a CellExecutor,
+    a temporary one if workers is set, and None otherwise (serial execution)
+    """
+    if isinstance(executor, CellExecutor):
+        yield executor
+    elif workers is None:
+        yield None
+    else:
+        with CellExecutor(workers, executor, chunksize) as cell_executor:
+            yield cell_executor
+
+
+def _map_chunk(chunk) -> list:
+    pickled_func, raw_cells = chunk
+    func = cloudpickle.loads(pickled_func)
+    return [func(Cell(raw_cell, num)) for raw_cell, num in raw_cells]
+
+
+def _apply_chunk(chunk) -> List[Optional[dict]]:
+    return [None if cell is None else cell.cell for cell in _map_chunk(chunk)]
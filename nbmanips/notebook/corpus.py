@@ -0,0 +1,187 @@
+import sys
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Union
+
+from nbmanips.cell import Cell
+from nbmanips.cell.cell_utils import _join_output_lines
+from nbmanips.selector import Selector
+
+from .notebook import Notebook
+
+# Strings up to this length are interned (keys, mime types, metadata values...)
+INTERN_MAX_LENGTH = 64
+
+_MISSING = object()
+_EMPTY_DICT = MappingProxyType({})
+
+# Layout of the compact cells: tuples of the values of these keys, then a dict of
+# the other keys (or None)
+_CELL_KEYS = (
+    'cell_type',
+    'id',
+    'source',
+    'metadata',
+    'outputs',
+    'execution_count',
+    'attachments',
+)
+_KEY_INDEX = {key: i for i, key in enumerate(_CELL_KEYS)}
+
+
+class CompactCell(Mapping):
+    """
+    Read-only mapping view of a compact cell, that can be wrapped in a Cell
+    """
+
+    __slots__ = ('_values',)
+
+    def __init__(self, values: tuple):
+        self._values = values
+
+    def __getitem__(self, key):
+        index = _KEY_INDEX.get(key)
+        if index is None:
+            extra = self._values[-1]
+            if extra is None:
+                raise KeyError(key)
+            return extra[key]
+
+        value = self._values[index]
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for key, value in zip(_CELL_KEYS, self._values):
+            if value is not _MISSING:
+                yield key
+        if self._values[-1] is not None:
+            yield from self._values[-1]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'CompactCell({dict(self)!r})'
+
+
+class NotebookCorpus:
+    """
+    Collection of notebooks held in memory in a compact, read-only layout:
+    - dictionary keys and short strings are interned, so they are shared by all
+      the notebooks
+    - sources and output texts are stored as single strings, and lists as tuples
+    - cells are stored as tuples instead of dictionaries
+
+    Cells are read through read-only Cell objects, created on demand.
+    Notebooks are materialized (as regular, mutable notebooks) when accessed.
+    """
+
+    def __init__(self, notebooks: Iterable[Union[Notebook, dict]] = ()):
+        # (name, notebook without its cells, cells)
+        self._notebooks: List[Tuple[Optional[str], Mapping, tuple]] = []
+        for nb in notebooks:
+            self.add(nb)
+
+    @classmethod
+    def read(cls, paths: Iterable[str], **kwargs) -> 'NotebookCorpus':
+        """
+        Read notebooks into a corpus, one at a time
+
+        :param paths: paths of the notebooks
+        :param kwargs: arguments passed to Notebook.read
+        """
+        corpus = cls()
+        for path in paths:
+            corpus.add(Notebook.read(path, **kwargs))
+        return corpus
+
+    def add(self, nb: Union[Notebook, dict], name: Optional[str] = None) -> None:
+        """
+        Add a notebook to the corpus
+
+        :param nb: Notebook or notebook dictionary
+        :param name: name of the notebook (default: the name of the Notebook)
+        """
+        if isinstance(nb, Notebook):
+            name = name or nb.name
+            nb = nb.raw_nb
+
+        header = _compact({key: value for key, value in nb.items() if key != 'cells'})
+        cells = tuple(_compact_cell(cell) for cell in nb.get('cells', []))
+        self._notebooks.append((name, header, cells))
+
+    def __len__(self):
+        return len(self._notebooks)
+
+    def __getitem__(self, index: int) -> Notebook:
+        """
+        Materialize a notebook of the corpus
+        """
+        name, header, cells = self._notebooks[index]
+        raw_nb = _thaw(header)
+        raw_nb['cells'] = [_thaw(CompactCell(cell)) for cell in cells]
+        return Notebook(raw_nb, name, validate=False, copy=False)
+
+    def __iter__(self) -> Iterator[Notebook]:
+        return (self[i] for i in range(len(self)))
+
+    def names(self) -> List[Optional[str]]:
+        return [name for name, _, _ in self._notebooks]
+
+    def iter_cells(
+        self, selector: Any = None, *args, **kwargs
+    ) -> Iterator[Tuple[int, Cell]]:
+        """
+        Iterate over the cells of the corpus that match a selector
+
+        :param selector: selector (same as Notebook.select)
+        :return: iterator of (notebook index, read-only cell)
+        """
+        selector = Selector(selector, *args, **kwargs)
+        for index, (_, header, cells) in enumerate(self._notebooks):
+            view = {**header, 'cells': [CompactCell(cell) for cell in cells]}
+            for cell in selector.iter_cells(view):
+                yield index, cell
+
+    def count(self, selector: Any = None, *args, **kwargs) -> int:
+        """
+        Count the cells of the corpus that match a selector
+        """
+        return sum(1 for _ in self.iter_cells(selector, *args, **kwargs))
+
+    def __repr__(self):
+        return f'<NotebookCorpus ({len(self)} notebooks)>'
+
+
+def _compact(value):
+    if isinstance(value, str):
+        return sys.intern(value) if len(value) <= INTERN_MAX_LENGTH else value
+    if isinstance(value, dict):
+        if not value:
+            return _EMPTY_DICT
+        return {sys.intern(key): _compact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return tuple(_compact(item) for item in value)
+    return value
+
+
+def _compact_cell(cell: dict) -> tuple:
+    cell = dict(cell)
+    if isinstance(cell.get('source'), list):
+        cell['source'] = ''.join(cell['source'])
+    if 'outputs' in cell:
+        cell['outputs'] = [_join_output_lines(output) for output in cell['outputs']]
+
+    values = [_compact(cell.pop(key, _MISSING)) for key in _CELL_KEYS]
+    values.append(_compact(cell) if cell else None)
+    return tuple(values)
+
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_thaw(item) for item in value]
+    return value
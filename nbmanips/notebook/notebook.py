@@ -9,6 +9,7 @@ from .notebook_mixins import (
     NotebookMetadata,
     SlideShowMixin,
 )
+from .pattern_search import search_cells
 
 
 def _get_regex(text, case=False, regex=False):
@@ -67,6 +68,22 @@ class Notebook(
         compiled_regex = _get_regex(text, case=case, regex=regex)
         return self.select('has_match', compiled_regex, output=output).list()
 
+    def search_many(self, patterns, regex=False, case=False, output=False):
+        """
+        Search several texts in the selected cells, in one pass over the cells:
+        texts are matched by an Aho-Corasick automaton, and regular expressions
+        are only evaluated on the cells matching at least one of them.
+
+        :param patterns: strings (or regular expressions) to find in cells
+        :param regex: boolean whether to use regex or not
+        :param case: True if the search is case sensitive
+        :param output: True if you want the search in the output of the cell too
+        :return: dictionary pattern -> {cell number: offsets of the matches}
+        """
+        return search_cells(
+            self._iter_cells(), patterns, regex=regex, case=case, output=output
+        )
+
     def replace(self, old, new, count=None, case=True, regex=False):
         """
         Replace matching text in the selected cells
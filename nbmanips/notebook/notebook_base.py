@@ -1,11 +1,17 @@
+from contextlib import contextmanager
 from copy import deepcopy
-from typing import Any, Callable, Iterator, Optional
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
 
 import nbformat
 
+from nbmanips._pickling import join_payloads, split_payloads
 from nbmanips.cell import Cell
 from nbmanips.selector import Selector
 
+from .cell_executor import CellExecutor, get_cell_executor
+from .notebook_state import CellBatch, NotebookState, copy_raw_cell
+from .validation import validate_notebook
+
 
 class NotebookBase:
     def __init__(
@@ -15,40 +21,140 @@ class NotebookBase:
             content = dict(nbformat.v4.new_notebook())
 
         if validate:
-            self.__validate(content)
+            self.__check_content(content)
 
+        state = NotebookState.get(content)
         if copy:
-            self.raw_nb = deepcopy(content)
-        else:
-            self.raw_nb = content
+            # the copy of a tracked notebook keeps its blob store
+            if state is not None and isinstance(content.get('cells'), list):
+                state = state.copy()
+                content = state.raw_nb
+            else:
+                state = None
+                content = deepcopy(content)
 
+        self._raw_nb = content
         self.name = name
         self._selector = Selector(None)
+        self._state = state or NotebookState.of(content)
+
+        if validate:
+            self.validate()
 
     def select(self, selector: Any, *args, **kwargs):
         nb = self.reset_selection()
         nb._selector = self._selector & Selector(selector, *args, **kwargs)
         return nb
 
-    def apply(self, func: Callable[[Cell], Optional[Cell]], neg=False):
-        delete_list = []
-        for cell in self.iter_cells(neg):
-            num = cell.num
-            new_cell = func(cell)
-            if new_cell is None:
-                delete_list.append(num)
+    def apply(
+        self,
+        func: Callable[[Cell], Optional[Cell]],
+        neg=False,
+        workers: Optional[int] = None,
+        executor: Union[str, CellExecutor] = 'process',
+        chunksize: Optional[int] = None,
+    ):
+        """
+        Apply a function to the selected cells.
+        The cells for which the function returns None are deleted.
+
+        :param func: function that takes a cell and returns a cell (or None)
+        :param neg: apply the function to the cells that are not selected
+        :param workers: number of workers (default: the function is applied serially)
+        :param executor: 'process', 'thread' or a CellExecutor to reuse
+        :param chunksize: number of cells sent to a worker process at once
+        """
+        with get_cell_executor(workers, executor, chunksize) as cell_executor:
+            # the cells are taken from a snapshot of the notebook, func is run
+            # without the lock (it may change the cells through their methods)
+            state = self._state
+            with state.lock:
+                cells = list(self.iter_cells(neg))
+
+            if cell_executor is None:
+                results = (func(cell) for cell in cells)
+                raw_cells = [None if cell is None else cell.cell for cell in results]
             else:
-                self.cells[num] = new_cell.cell
-
-        for num in reversed(delete_list):
-            del self.cells[num]
+                raw_cells = cell_executor.apply(func, cells, chunksize)
+
+            with self.batch():
+                batch = state.batch
+                kept = []
+                for cell, raw_cell in zip(cells, raw_cells):
+                    # the cell may have been moved or deleted by another thread
+                    num = state.find(cell)
+                    if num is None:
+                        continue
+
+                    old_cell = self._raw_nb['cells'][num]
+                    if raw_cell is None:
+                        batch.delete(num)
+                    elif raw_cell is not old_cell and raw_cell != old_cell:
+                        batch.replace(num, raw_cell)
+                    else:
+                        kept.append(num)
+
+                # func may have changed the kept cells directly
+                state.forget(kept)
+
+    def map(
+        self,
+        func: Callable[[Cell], Any],
+        neg=False,
+        workers: Optional[int] = None,
+        executor: Union[str, CellExecutor] = 'process',
+        chunksize: Optional[int] = None,
+    ):
+        """
+        Apply a function to the selected cells and return the results
+
+        :param func: function that takes a cell
+        :param neg: apply the function to the cells that are not selected
+        :param workers: number of workers (default: the function is applied serially)
+        :param executor: 'process', 'thread' or a CellExecutor to reuse
+        :param chunksize: number of cells sent to a worker process at once
+        :return: the list of the results
+        """
+        with get_cell_executor(workers, executor, chunksize) as cell_executor:
+            if cell_executor is None:
+                return list(map(func, self.iter_cells(neg)))
+            return cell_executor.map(func, list(self.iter_cells(neg)), chunksize)
 
-    def map(self, func: Callable[[Cell], Any], neg=False):
-        return list(map(func, self.iter_cells(neg)))
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that records the structural changes of the notebook
+        (inserted, deleted, moved and replaced cells), and applies them in one
+        rebuild of the cell list on exit. Inside the batch, cell numbers still
+        refer to the cell list before the batch.
+        The batch holds the write lock of the notebook: changes made by other
+        threads wait until it is applied.
+        Recorded changes are dropped if an exception is raised, but the changes
+        made to the content of the cells are not rolled back.
+        """
+        state = self._state
+        with state.lock:
+            if state.batch is not None:
+                # nested batches are merged with the outermost one
+                # (other threads wait for the lock)
+                yield self
+                return
+
+            state.batch = CellBatch(len(self._raw_nb['cells']))
+            try:
+                yield self
+            except BaseException:
+                state.batch = None
+                raise
+
+            batch, state.batch = state.batch, None
+            if not batch.empty:
+                state.set_cells(batch.rebuild(self._raw_nb['cells']))
+                state.touch(batch.added_cells())
 
     def reset_selection(self):
         notebook_selection = self.__class__(
-            self.raw_nb, self.name, validate=False, copy=False
+            self._raw_nb, self.name, validate=False, copy=False
         )
 
         # Adding Original Notebook Path if defined
@@ -58,8 +164,63 @@ class NotebookBase:
 
         return notebook_selection
 
-    def iter_cells(self, neg=False) -> Iterator[Cell]:
-        return self._selector.iter_cells(self.raw_nb, neg=neg)
+    def iter_cells(self, neg=False, reverse=False, workers=None) -> Iterator[Cell]:
+        """
+        Iterate over the selected cells.
+        The iteration is not affected by the cells inserted, deleted or moved
+        (by any thread) after it started. The cells shared with copies of the
+        notebook are cloned when they are yielded, so that they can be changed
+        directly.
+
+        :param neg: iterate over the cells that are not selected
+        :param reverse: iterate from the last cell
+        :param workers: number of threads evaluating the selection, worth it for
+            expensive selectors (default: the selection is evaluated lazily)
+        """
+        state = self._state
+        return map(state.own, self._iter_cells(neg, reverse, workers))
+
+    def _iter_cells(self, neg=False, reverse=False, workers=None) -> Iterator[Cell]:
+        # same as iter_cells, for the readers: the shared cells are not cloned
+        cells = self._selector.iter_cells(
+            self._raw_nb, neg=neg, reverse=reverse, workers=workers
+        )
+        return map(self._state.bind, cells)
+
+    def mask(self) -> int:
+        """
+        Return the selection as a bitmask: bit i is set if cell i is selected.
+        The masks of the selectors can be cached (see set_selection_cache).
+        """
+        return self._selector.mask(self._raw_nb)
+
+    def set_selection_cache(self, max_size: int = 128) -> None:
+        """
+        Set the number of selection results cached for this notebook (the cache
+        is disabled by default). Results are identified by the selector (with its
+        arguments), and are kept up to date by the changes made through the Cell
+        and Notebook methods: only the results of the changed cells are evaluated
+        again. Changes made directly to the raw content of the cells must be
+        followed by touch.
+        Custom callables are only cached if their cost is declared (see with_cost).
+        The features of the cells read by the default selectors are cached too
+        (see CellFeatures), and compound selectors combine the cached results of
+        their terms with bitwise operations (see Selector.mask).
+
+        :param max_size: number of selectors cached, the least recently used are
+            evicted first (0 disables the cache)
+        """
+        self._state.masks.resize(max_size)
+        self._state.pool.features.enable(max_size > 0)
+
+    @property
+    def raw_nb(self) -> dict:
+        """
+        Raw content of the notebook. The cells shared with copies of the notebook
+        are cloned first, so that they can be changed directly.
+        """
+        self._state.own_all()
+        return self._raw_nb
 
     @property
     def cells(self):
@@ -67,11 +228,67 @@ class NotebookBase:
 
     @property
     def metadata(self):
-        return self.raw_nb['metadata']
+        return self._raw_nb['metadata']
 
     @property
     def used_ids(self):
-        return {cell['id'] for cell in self.cells if 'id' in cell}
+        return {cell['id'] for cell in self._raw_nb['cells'] if 'id' in cell}
+
+    @property
+    def version(self) -> int:
+        """
+        Version of the notebook, incremented by each change made through
+        the Cell and Notebook methods (see touch for the other changes)
+        """
+        return self._state.version
+
+    def dirty_cells(self, since: int = 0) -> list:
+        """
+        Return the selected cells changed since a version of the notebook.
+        Only the changes made through the Cell and Notebook methods are tracked:
+        the changes made directly to the raw content (Cell.metadata, Cell.cell,
+        Notebook.cells, ...) are not, unless the cells are marked with touch.
+
+        :param since: version of the notebook (default: since it was loaded)
+        :return: list of cells
+        """
+        state = self._state
+        return [
+            cell for cell in self.iter_cells() if state.changed_since(cell.cell, since)
+        ]
+
+    def touch(self, *cells: Cell):
+        """
+        Mark cells as changed, after changes made directly to their raw content
+        (e.g. cell.metadata['tags'].append(tag)): they are then reported by
+        dirty_cells, and the cached results computed from them are dropped.
+        The cells obtained before the notebook was copied may share their raw
+        content with the copy: touch them before changing them directly.
+
+        :param cells: cells of the notebook (default: the selected cells)
+        """
+        for cell in cells or list(self.iter_cells()):
+            self._state.bind(cell)._before_change()
+
+    def cell_by_id(self, cell_id: str) -> Optional[Cell]:
+        """
+        Return the cell with the given id (regardless of the selection)
+        :param cell_id: id of the cell
+        :return: the cell, or None if no cell has this id
+        """
+        num = self.position_of(cell_id)
+        if num is None:
+            return None
+        state = self._state
+        return state.own(state.bind(state.pool.cell(self._raw_nb['cells'][num], num)))
+
+    def position_of(self, cell_id: str) -> Optional[int]:
+        """
+        Return the position of the cell with the given id
+        :param cell_id: id of the cell
+        :return: the position, or None if no cell has this id
+        """
+        return self._state.position_of(cell_id)
 
     def first_cell(self):
         """
@@ -86,25 +303,118 @@ class NotebookBase:
         Return the last selected cell
         :return:
         """
-        for cell in reversed(list(self.iter_cells())):
+        for cell in self.iter_cells(reverse=True):
             return cell
 
-    def list_cells(self):
+    def list_cells(self, workers=None):
         """
         Return a list of the selected cells
+        :param workers: number of threads evaluating the selection
         :return:
         """
-        return [cell for cell in self.iter_cells()]
+        return [cell for cell in self.iter_cells(workers=workers)]
 
     def add_cell(self, cell: Cell, pos=None):
-        pos = len(self) if pos is None else pos
+        state = self._state
+        with state.lock:
+            pos = len(self) if pos is None else pos
+
+            new_id = cell.id
+            while new_id is not None and state.has_id(new_id):
+                new_id = cell.generate_id_candidate()
+
+            raw_cell = self._adopt_cell(cell, new_id)
+            if state.batch is not None:
+                state.batch.insert(pos, raw_cell)
+            elif pos >= len(self._raw_nb['cells']):
+                # readers do not see the cells appended after they started
+                self._raw_nb['cells'].append(raw_cell)
+                state.on_cells_changed(added=[raw_cell])
+            else:
+                cells = list(self._raw_nb['cells'])
+                cells.insert(pos, raw_cell)
+                state.set_cells(cells, added=[raw_cell])
+            state.touch([raw_cell])
+
+    def move_cell(self, num: int, pos: Optional[int] = None):
+        """
+        Move a cell before the cell that is at position pos
+        :param num: position of the cell to move
+        :param pos: position of the cell to move before (default: to the end)
+        """
+        pos = len(self._raw_nb['cells']) if pos is None else pos
+        if not -len(self._raw_nb['cells']) <= num < len(self._raw_nb['cells']):
+            raise IndexError(f'cell index out of range: {num}')
+
+        with self.batch():
+            self._state.batch.move(num % len(self._raw_nb['cells']), pos)
 
-        new_id = cell.id
-        while new_id in self.used_ids:
-            new_id = cell.generate_id_candidate()
+    def _adopt_cell(self, cell: Cell, new_id: Optional[str] = None) -> dict:
+        """
+        Return a raw cell that can be added to this notebook
+        :param cell: cell of any notebook
+        :param new_id: id of the returned raw cell (default: the id of the cell)
+        """
+        state = self._state
+        raw_cell = cell.cell
+
+        # the offloaded payloads of the cell must be resolvable by this notebook
+        store = cell.blob_store
+        offloaded = store is not None and cell.has_offloaded_outputs()
+        if offloaded and state.blob_store is None:
+            state.blob_store = store
+        rehydrate = offloaded and state.blob_store is not store
+
+        # the cells of other notebooks are shared until they change (copy-on-write)
+        source = cell._state
+        if (
+            source is None
+            or source is state
+            or id(raw_cell) in state.shared
+            or rehydrate
+            or (new_id and new_id != raw_cell.get('id'))
+        ):
+            raw_cell = copy_raw_cell(raw_cell)
+            if new_id:
+                raw_cell['id'] = new_id
+            if rehydrate:
+                Cell(raw_cell).rehydrate(store)
+        else:
+            source.share([raw_cell])
+            state.share([raw_cell])
+        return raw_cell
 
-        cell = cell.get_copy(new_id)
-        self.cells.insert(pos, cell.cell)
+    @classmethod
+    def concat(cls, notebooks: Iterable['NotebookBase'], dedupe_ids=True):
+        """
+        Concatenate the selected cells of several notebooks in one pass.
+        The metadata is copied from the first notebook.
+
+        :param notebooks: notebooks to concatenate (can be a generator)
+        :param dedupe_ids: rename the cells whose ids are already used
+        :return: a new notebook
+        """
+        new_nb = None
+        used_ids = set()
+        for nb in notebooks:
+            if new_nb is None:
+                raw_nb = {
+                    key: deepcopy(value)
+                    for key, value in nb._raw_nb.items()
+                    if key != 'cells'
+                }
+                raw_nb['cells'] = []
+                new_nb = cls(raw_nb, validate=False, copy=False)
+
+            for cell in nb._iter_cells():
+                new_id = cell.id
+                if dedupe_ids and new_id is not None:
+                    while new_id in used_ids:
+                        new_id = cell.generate_id_candidate()
+                    used_ids.add(new_id)
+                new_nb._raw_nb['cells'].append(new_nb._adopt_cell(cell, new_id))
+
+        return cls() if new_nb is None else new_nb
 
     def __iter__(self) -> Iterator[Cell]:
         return self.iter_cells()
@@ -115,7 +425,9 @@ class NotebookBase:
 
         # Copying the notebook
         raw_nb = {
-            key: deepcopy(value) for key, value in self.raw_nb.items() if key != 'cells'
+            key: deepcopy(value)
+            for key, value in self._raw_nb.items()
+            if key != 'cells'
         }
 
         # Creating empty Notebook
@@ -123,8 +435,8 @@ class NotebookBase:
         new_nb = self.__class__(raw_nb, validate=False, copy=False)
 
         # Concatenating the notebooks
-        for cell in self.list_cells() + other.list_cells():
-            new_nb.add_cell(cell)
+        for cell in list(self._iter_cells()) + list(other._iter_cells()):
+            new_nb.add_cell(cell, pos=len(new_nb._raw_nb['cells']))
 
         return new_nb
 
@@ -134,7 +446,9 @@ class NotebookBase:
 
         # Copying the notebook
         raw_nb = {
-            key: deepcopy(value) for key, value in self.raw_nb.items() if key != 'cells'
+            key: deepcopy(value)
+            for key, value in self._raw_nb.items()
+            if key != 'cells'
         }
 
         # Creating empty Notebook
@@ -143,19 +457,30 @@ class NotebookBase:
 
         # Concatenating the notebooks
         for _ in range(other):
-            for cell in self.iter_cells():
-                new_nb.add_cell(cell)
+            for cell in self._iter_cells():
+                new_nb.add_cell(cell, pos=len(new_nb._raw_nb['cells']))
         return new_nb
 
+    def __reduce_ex__(self, protocol):
+        # The state of the notebook (caches, change tracking) is not pickled.
+        # With protocol 5, long strings (e.g. images) are out-of-band buffers.
+        raw_nb, payloads = split_payloads(self._raw_nb, protocol)
+        attributes = {
+            key: value
+            for key, value in self.__dict__.items()
+            if key not in {'_raw_nb', '_state'}
+        }
+        return _rebuild_notebook, (self.__class__, raw_nb, payloads), attributes
+
     def __getitem__(self, item):
         if isinstance(item, tuple):
             return self.select(*item)
         return self.select(item)
 
     def __len__(self):
-        if self.raw_nb is None or 'cells' not in self.raw_nb:
+        if self._raw_nb is None or 'cells' not in self._raw_nb:
             return 0
-        return len(self.list_cells())
+        return self._selector.count(self._raw_nb)
 
     def __repr__(self):
         if self.name:
@@ -164,13 +489,13 @@ class NotebookBase:
             return '<Notebook>'
 
     def __str__(self):
-        return '\n'.join(str(cell) for cell in self.iter_cells())
+        return '\n'.join(str(cell) for cell in self._iter_cells())
 
     def __and__(self, other):
         if not isinstance(other, NotebookBase):
             return NotImplemented
 
-        if other.raw_nb is not self.raw_nb:
+        if other._raw_nb is not self._raw_nb:
             raise ValueError('and operator only works with the same Notebook.')
 
         nb = self.reset_selection()
@@ -181,7 +506,7 @@ class NotebookBase:
         if not isinstance(other, NotebookBase):
             return NotImplemented
 
-        if other.raw_nb is not self.raw_nb:
+        if other._raw_nb is not self._raw_nb:
             raise ValueError('and operator only works with the same Notebook.')
 
         nb = self.reset_selection()
@@ -193,8 +518,34 @@ class NotebookBase:
         nb._selector = ~self._selector
         return nb
 
+    def validate(self, incremental=False):
+        """
+        Validate the notebook against the nbformat schema.
+        The schema is compiled once per process.
+
+        :param incremental: only validate the cells that changed since the last
+            validation. Only the changes made through Cell methods are tracked.
+        """
+        self.__check_content(self._raw_nb)
+
+        validated_cells = self._state.validated_cells
+        cells = self._raw_nb.get('cells')
+        if incremental and isinstance(cells, list):
+            repaired = validate_notebook(
+                self._raw_nb,
+                cells=[cell for cell in cells if id(cell) not in validated_cells],
+            )
+        else:
+            repaired = validate_notebook(self._raw_nb)
+        if repaired:
+            self._state.reset_ids()
+
+        validated_cells.clear()
+        if isinstance(cells, list):
+            validated_cells.update((id(cell), cell) for cell in cells)
+
     @staticmethod
-    def __validate(content: dict):
+    def __check_content(content: dict):
         if not isinstance(content, dict):
             message = (
                 f"'content' must be of type 'dict': {type(content).__name__!r} given"
@@ -202,4 +553,7 @@ class NotebookBase:
             if isinstance(content, str):
                 message += '\nUse Notebook.read(path) to read notebook from file'
             raise ValueError(message)
-        nbformat.validate(nbdict=content)
+
+
+def _rebuild_notebook(cls, raw_nb, payloads):
+    return cls(join_payloads(raw_nb, payloads), validate=False, copy=False)
@@ -1,17 +1,21 @@
 import json
 import os
+import re
 import shutil
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
-from typing import Any, Union
+from typing import Any, Optional, Union
 
 try:
     import nbconvert
 except ImportError:
     nbconvert = None
 
-from nbmanips.cell.cell_utils import PYGMENTS_SUPPORTED
+from nbmanips.cell import Cell
+from nbmanips.cell.blob_store import BlobStore
+from nbmanips.cell.cell_utils import PYGMENTS_SUPPORTED, new_hasher, update_digest
 from nbmanips.notebook.utils import (
     dict_to_ipynb,
     get_ipynb_name,
@@ -31,6 +35,62 @@ except ImportError:
     get_lexer_by_name = None
 
 
+def _share_markdown_rendering(exporter, cache: dict):
+    """
+    Replaces the markdown2html filter of an nbconvert exporter with a version
+    that shares its results through cache with the other exporters.
+    """
+    try:
+        from jinja2 import pass_context as contextfilter
+    except ImportError:
+        from jinja2 import contextfilter
+
+    environment = getattr(exporter, 'environment', None)
+    if environment is None or 'markdown2html' not in environment.filters:
+        return
+
+    render = environment.filters['markdown2html']
+    pass_context = getattr(render, 'jinja_pass_arg', None) or getattr(
+        render, 'contextfilter', False
+    )
+    settings = tuple(
+        getattr(exporter, attr, None)
+        for attr in ('embed_images', 'anchor_link_text', 'exclude_anchor_links')
+    )
+
+    @contextfilter
+    def markdown2html(context, source):
+        key: tuple = (source,)
+        if pass_context:
+            cell = context.get('cell', {})
+            path = context.get('resources', {}).get('metadata', {}).get('path', '')
+            attachments = json.dumps(cell.get('attachments', {}), sort_keys=True)
+            key += (settings, path, attachments)
+
+        if key not in cache:
+            cache[key] = render(context, source) if pass_context else render(source)
+        return cache[key]
+
+    exporter.register_filter('markdown2html', markdown2html)
+
+
+# Markdown (ATX) or HTML headings
+_HEADING_PATTERN = re.compile(r'^ {0,3}#{1,6}(?:[ \t]|$)|<h[1-6][\s>]', re.M | re.I)
+
+
+def _is_heading(cell: Cell) -> bool:
+    return cell.type == 'markdown' and _HEADING_PATTERN.search(cell.source) is not None
+
+
+def _get_output_budget(max_output_size=None, max_cell_size=None, drop_above=None):
+    budget = {
+        'max_output_size': max_output_size,
+        'max_cell_size': max_cell_size,
+        'drop_above': drop_above,
+    }
+    return {key: value for key, value in budget.items() if value is not None}
+
+
 class ClassicNotebook(NotebookBase):
     def update_cell_metadata(self, key: str, value: Any):
         """
@@ -56,24 +116,84 @@ class ClassicNotebook(NotebookBase):
         for cell in self.iter_cells():
             cell.erase_output(output_types)
 
+    def limit_output(self, max_output_size=None, max_cell_size=None, drop_above=None):
+        """
+        Enforce an output size budget on the selected cells.
+        Outputs are truncated (head and tail are kept) or dropped.
+
+        :param max_output_size: maximum byte size of each output
+        :param max_cell_size: maximum byte size of all the outputs of a cell
+        :param drop_above: outputs bigger than drop_above bytes are dropped
+        :return: a report of the trimmed outputs (see Cell.limit_output)
+        """
+        budget = _get_output_budget(max_output_size, max_cell_size, drop_above)
+        if not budget:
+            return []
+
+        report = []
+        selection = self.select(
+            'has_byte_size', min(budget.values()) + 1, ignore_source=True
+        )
+        for cell in selection.iter_cells():
+            report.extend(cell.limit_output(**budget))
+        return report
+
+    def offload_outputs(self, store_dir, min_size=4096, output_types=None):
+        """
+        Move the output payloads of the selected cells to a content-addressed store.
+        Each payload bigger than min_size is replaced by a reference to its SHA-256.
+        Only the references are saved with the notebook: pass the store again
+        when loading it (see set_blob_store).
+
+        :param store_dir: directory of the blob store
+        :param min_size: minimum byte size of the payloads to offload
+        :param output_types: Output Types(MIME type) to offload: image/png, text/html, ...
+        """
+        store = BlobStore(store_dir)
+        self._state.blob_store = store
+        for cell in self.iter_cells():
+            cell.offload_outputs(store, min_size, output_types)
+
+    def set_blob_store(self, store_dir):
+        """
+        Set the blob store resolving the output payloads offloaded by offload_outputs
+
+        :param store_dir: directory of the blob store (None to unset it)
+        """
+        self._state.blob_store = None if store_dir is None else BlobStore(store_dir)
+
+    def rehydrate(self, store_dir=None):
+        """
+        Restore the output payloads of the selected cells from the blob store
+
+        :param store_dir: directory of the blob store (default: the notebook's store)
+        """
+        store = None if store_dir is None else BlobStore(store_dir)
+        for cell in self.iter_cells():
+            cell.rehydrate(store)
+
     def delete(self):
         """
         Delete the selected cells
         """
-        self.raw_nb['cells'] = [cell.cell for cell in self.iter_cells(neg=True)]
+        with self.batch():
+            for cell in self._iter_cells():
+                self._state.batch.delete(cell.num)
 
     def keep(self):
         """
         Delete all the non-selected cells
         """
-        self.raw_nb['cells'] = [cell.cell for cell in self.iter_cells()]
+        with self.batch():
+            for cell in self._iter_cells(neg=True):
+                self._state.batch.delete(cell.num)
 
     def first(self):
         """
         Return the number of the first selected cell
         :return:
         """
-        for cell in self.iter_cells():
+        for cell in self._iter_cells():
             return cell.num
 
     def last(self):
@@ -81,18 +201,20 @@ class ClassicNotebook(NotebookBase):
         Return the number of the last selected cell
         :return:
         """
-        for cell in reversed(list(self.iter_cells())):
+        for cell in self._iter_cells(reverse=True):
             return cell.num
 
     def copy(self, selection=True, crop=True):
         """
-        Copy the notebook instance
+        Copy the notebook instance. The cells are shared with the copy until they
+        are changed, or handed out to be changed directly (e.g. by iter_cells):
+        then they are cloned.
 
         :param selection: keep selection
         :param crop: crop on selection
         :return: a new copy of the notebook
         """
-        cp = self.__class__(self.raw_nb, self.name, validate=False, copy=True)
+        cp = self.__class__(self._raw_nb, self.name, validate=False, copy=True)
         if selection:
             cp._selector = self._selector
             if crop:
@@ -107,32 +229,95 @@ class ClassicNotebook(NotebookBase):
         :param args:
         :return:
         """
-        return self.copy().select(args, type='or').split_on_selection()
+        return list(self.iter_split(*args))
+
+    def iter_split(self, *args):
+        """
+        Split the notebook based passed selectors (typically cell indexes),
+        and yield the notebooks one at a time
+
+        :param args:
+        :return: generator of notebooks
+        """
+        if not all(isinstance(arg, int) for arg in args):
+            cp = self.copy()
+            points = [cell.num for cell in cp.select(args, type='or')._iter_cells()]
+            yield from cp._iter_parts(cp._raw_nb['cells'], points)
+            return
+
+        # positions in the selected cells
+        cells = [cell.cell for cell in self._iter_cells()]
+        points = sorted(
+            {index % len(cells) for index in args if -len(cells) <= index < len(cells)}
+        )
+        yield from self._iter_parts(cells, points)
+
+    def split_by_size(self, max_bytes: int, output_types=None, keep_sections=False):
+        """
+        Split the selected cells in notebooks whose cells fit in a byte budget.
+        Cells are packed greedily in one pass: a cell bigger than the budget
+        gets its own notebook.
+
+        :param max_bytes: maximum size of the cells of each notebook (Cell.byte_size)
+        :param output_types: output types to count (default: all the outputs)
+        :param keep_sections: never split a heading section (a markdown heading
+            and the cells until the next heading). Sections bigger than the budget
+            get their own notebook.
+        :return: list of notebooks
+        """
+        if max_bytes <= 0:
+            raise ValueError(f'max_bytes must be positive: {max_bytes!r}')
+
+        cells = []
+        points = []
+        part_size = unit_size = 0
+        unit_start = None
+        for i, cell in enumerate(self._iter_cells()):
+            cells.append(cell.cell)
+            if unit_start is None or not keep_sections or _is_heading(cell):
+                if unit_start is not None:
+                    if part_size and part_size + unit_size > max_bytes:
+                        points.append(unit_start)
+                        part_size = 0
+                    part_size += unit_size
+                unit_start, unit_size = i, 0
+            unit_size += cell.byte_size(output_types)
+
+        if part_size and part_size + unit_size > max_bytes:
+            points.append(unit_start)
+        return list(self._iter_parts(cells, points))
 
     def split_on_selection(self):
         """
         Split the notebook based on the selected cells
         :return:
         """
-        cp = self.reset_selection()
-        notebooks = []
-        prev = 0
-        for cell in self.iter_cells():
-            if cell.num == prev:
-                continue
+        cells = self._raw_nb['cells']
+        return list(self._iter_parts(cells, [cell.num for cell in self._iter_cells()]))
 
-            notebooks.append(cp[prev : cell.num].copy())
+    def _iter_parts(self, cells: list, points: list):
+        """
+        Yield the notebooks made of the raw cells between consecutive split points.
+        Only the cells of each part are copied.
 
-            prev = cell.num
-        notebooks.append(cp[prev:].copy())
-        return notebooks
+        :param cells: raw cells
+        :param points: sorted positions in cells, each one starts a new part
+        """
+        start = 0
+        for end in [*points, len(cells)]:
+            if end > start or end == len(cells):
+                state = self._state.copy(cells[start:end])
+                yield self.__class__(
+                    state.raw_nb, self.name, validate=False, copy=False
+                )
+                start = end
 
     def list(self):
         """
         Return the numbers of the selected cells
         :return:
         """
-        return [cell.num for cell in self.list_cells()]
+        return [cell.num for cell in self._iter_cells()]
 
     def count(self):
         """
@@ -144,7 +329,7 @@ class ClassicNotebook(NotebookBase):
 
 class SlideShowMixin(ClassicNotebook):
     def mark_slideshow(self):
-        self.raw_nb['metadata']['celltoolbar'] = 'Slideshow'
+        self._raw_nb['metadata']['celltoolbar'] = 'Slideshow'
 
     def set_slide(self):
         self.tag_slide('slide')
@@ -246,13 +431,21 @@ class ExportMixin(NotebookBase):
         """
         returns notebook as json string.
         """
-        return json.dumps(self.raw_nb)
+        return json.dumps(self._raw_nb)
 
     def to_notebook_node(self):
         """
-        returns notebook as an nbformat NotebookNode
+        returns notebook as an nbformat NotebookNode,
+        with the output payloads offloaded to the blob store restored
         """
-        return dict_to_ipynb(self.raw_nb)
+        cells = []
+        for num, raw_cell in enumerate(self._raw_nb['cells']):
+            cell = Cell(raw_cell, num)
+            if cell.has_offloaded_outputs():
+                cell = Cell(deepcopy(raw_cell), num)
+                cell.rehydrate(self._state.blob_store)
+            cells.append(cell.cell)
+        return dict_to_ipynb({**self._raw_nb, 'cells': cells})
 
     def convert(self, exporter_name, path, *args, exporter_type='nbmanips', **kwargs):
         assert exporter_type in {'nbmanips', 'nbconvert'}
@@ -274,10 +467,57 @@ class ExportMixin(NotebookBase):
         )
 
         (body, resources) = exporter.from_notebook_node(notebook_node)
+        self._write_export(body, resources, path)
+
+    def convert_many(self, targets: dict, max_workers=None, **kwargs):
+        """
+        Exports the notebook to several nbconvert formats in one pass.
+
+        The notebook is converted to a NotebookNode once, the markdown rendering
+        is shared between the exporters, and the outputs are rendered and written
+        concurrently. The outputs extracted to files (markdown, rst, latex, ...)
+        are not shared: they depend on the preprocessors each exporter runs before
+        the extraction (e.g. streams are coalesced for rst, which changes the
+        names of the files).
 
+        :param targets: mapping of exporter names to target paths.
+            A value can also be a tuple (path, exporter_kwargs).
+        :type targets: dict (e.g. {'html': 'nb.html', 'markdown': 'nb.md'})
+        :param max_workers: maximum number of threads used to write the outputs
+        :param kwargs: keyword arguments passed to every exporter
+        """
+        notebook_node = self.to_notebook_node()
+        markdown_cache: dict = {}
+
+        def export(exporter_name, target):
+            path, exporter_kwargs = (
+                target if isinstance(target, tuple) else (target, {})
+            )
+            exporter = self.get_exporter(
+                exporter_name,
+                exporter_type='nbconvert',
+                **{**kwargs, **exporter_kwargs},
+            )
+            _share_markdown_rendering(exporter, markdown_cache)
+
+            (body, resources) = exporter.from_notebook_node(notebook_node)
+            self._write_export(body, resources, path)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(export, exporter_name, target)
+                for exporter_name, target in targets.items()
+            ]
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def _write_export(body, resources, path):
         # Exporting result
         build_directory, file_name = os.path.split(path)
-        writer = nbconvert.writers.files.FilesWriter(build_directory=build_directory)
+        writer = nbconvert.writers.files.FilesWriter(
+            build_directory=build_directory or os.curdir
+        )
 
         _, ext = os.path.splitext(file_name)
         if ext:
@@ -474,7 +714,7 @@ class ExportMixin(NotebookBase):
                 excluded_data_types=excluded_data_types,
                 truncate=truncate,
             )
-            for cell in self.iter_cells()
+            for cell in self._iter_cells()
         )
 
     def to_text(self, path, *args, **kwargs):
@@ -489,12 +729,34 @@ class ExportMixin(NotebookBase):
         with open(path, 'w', encoding='utf-8') as f:
             f.write(content)
 
-    def to_ipynb(self, path):
+    def to_ipynb(self, path, output_budget: Optional[dict] = None):
         """
         Export to ipynb file
         :param path: target path
+        :param output_budget: output size budget applied to the written file only:
+            {'max_output_size': ..., 'max_cell_size': ..., 'drop_above': ...}
+        :return: a report of the trimmed outputs if output_budget is set
         """
-        write_ipynb(self.raw_nb, path)
+        budget = _get_output_budget(**(output_budget or {}))
+        if not budget:
+            write_ipynb(self._raw_nb, path)
+            return None
+
+        from nbmanips.selector.default_selector import has_byte_size
+
+        min_size = min(budget.values()) + 1
+
+        report = []
+        cells = []
+        for num, raw_cell in enumerate(self._raw_nb['cells']):
+            cell = Cell(raw_cell, num)
+            if has_byte_size(cell, min_size, ignore_source=True):
+                cell = Cell(deepcopy(raw_cell), num)
+                report.extend(cell.limit_output(**budget))
+            cells.append(cell.cell)
+
+        write_ipynb({**self._raw_nb, 'cells': cells}, path)
+        return report
 
     def show(
         self,
@@ -534,15 +796,18 @@ class ExportMixin(NotebookBase):
             print(str_repr)
 
     @classmethod
-    def read_ipynb(cls, path, name=None, validate=False):
+    def read_ipynb(cls, path, name=None, validate=False, blob_store=None):
         """
         Read ipynb file
         :param path: path to the ipynb file
         :param name: name of the Notebook
+        :param blob_store: directory of the blob store of the offloaded outputs
         :return: Notebook object
         """
         nb = read_ipynb(path)
         nb = cls(nb, name or get_ipynb_name(path), validate=validate, copy=False)
+        if blob_store is not None:
+            nb.set_blob_store(blob_store)
 
         nb._original_path = path
 
@@ -753,13 +1018,29 @@ class NotebookCellMetadata(ClassicNotebook):
 
 
 class ContentAnalysisMixin(NotebookBase):
+    def digest(self, outputs=True) -> str:
+        """
+        Merkle root of the selected cells: combines the nbformat version,
+        the notebook metadata and the (cached) content hashes of the cells.
+
+        :param outputs: include the outputs and the execution counts of the cells
+        :return: hexadecimal digest
+        """
+        hasher = new_hasher()
+        nb_format = (self._raw_nb.get('nbformat'), self._raw_nb.get('nbformat_minor'))
+        update_digest(hasher, nb_format)
+        update_digest(hasher, self._raw_nb.get('metadata', {}))
+        for cell in self._iter_cells():
+            hasher.update(cell._digest(outputs))
+        return hasher.hexdigest()
+
     @property
     def toc(self):
         markdown_cells = self.select('is_markdown')
 
         toc = []
         indentation_levels = []
-        for cell in markdown_cells.iter_cells():
+        for cell in markdown_cells._iter_cells():
             for element in cell.soup.select('h1, h2, h3, h4, h5, h6'):
                 indentation_level = int(element.name[-1]) - 1
                 indentation_levels.append(indentation_level)
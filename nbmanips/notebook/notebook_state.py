@@ -0,0 +1,438 @@
+import threading
+from collections import Counter
+from copy import deepcopy
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+from weakref import WeakValueDictionary
+
+from nbmanips.cell import BlobStore, Cell, CellPool
+from nbmanips.selector.mask import MaskCache
+
+
+class NotebookState:
+    """
+    State shared by all the notebooks (and selections) built on the same raw notebook.
+    Cells yielded by the notebook are bound to it, so that the changes
+    made through the Cell methods are tracked.
+
+    Copies share their raw cells (copy-on-write): a shared cell is cloned before
+    it is changed through the Cell methods, or handed out to be changed directly
+    (see own).
+
+    Thread safety: writers hold the lock of the state, readers don't need to.
+    The cell list of the notebook is never changed in place, except for cells
+    appended at its end: other structural changes replace the list, so readers
+    keep iterating over the cells (and the length) they started with.
+    Snapshots cover the structure of the notebook, not the content of the cells.
+    """
+
+    # id(raw notebook) -> NotebookState
+    _states: 'WeakValueDictionary[int, NotebookState]' = WeakValueDictionary()
+
+    def __init__(self, raw_nb: dict):
+        self.raw_nb = raw_nb
+        self.pool = CellPool.of(raw_nb)
+
+        # selection cache: masks of the selectors, updated by each change
+        self.masks = MaskCache.of(raw_nb)
+
+        # write lock, re-entrant so that batches can be nested
+        self.lock = threading.RLock()
+
+        # id(raw cell) -> raw cell, for the cells validated since their last change
+        self.validated_cells: Dict[int, dict] = {}
+
+        # version of the notebook, incremented by each change
+        self.version = 0
+
+        # id(raw cell) -> (raw cell, number of changes, version of the last change)
+        self.cell_changes: Dict[int, Tuple[dict, int, int]] = {}
+
+        # ids of the raw cells shared with other notebooks (a stale id only costs
+        # an unneeded clone)
+        self.shared: Set[int] = set()
+
+        # Cell ID index: cell id -> number of cells using it, and cell id -> position.
+        # The index is rebuilt when the cell list is replaced or its length changes
+        # behind our back, positions are checked (and rebuilt if needed) on lookup.
+        self._ids: Optional[Counter] = None
+        self._positions: Dict[str, int] = {}
+        self._indexed_cells: Optional[List[dict]] = None
+        self._indexed_length = 0
+
+        # structural changes recorded by Notebook.batch
+        self.batch: Optional[CellBatch] = None
+
+        # store of the offloaded output payloads (kept out of the raw notebook)
+        self.blob_store: Optional[BlobStore] = None
+
+    @classmethod
+    def of(cls, raw_nb: dict) -> 'NotebookState':
+        """
+        Returns the state of a raw notebook, creating it if needed
+        """
+        state = cls.get(raw_nb)
+        if state is None:
+            state = cls(raw_nb)
+            cls._states[id(raw_nb)] = state
+        return state
+
+    @classmethod
+    def get(cls, raw_nb: dict) -> Optional['NotebookState']:
+        state = cls._states.get(id(raw_nb))
+        if state is not None and state.raw_nb is raw_nb:
+            return state
+        return None
+
+    def bind(self, cell: Cell) -> Cell:
+        cell._state = self
+        return cell
+
+    def copy(self, cells: Optional[Iterable[dict]] = None) -> 'NotebookState':
+        """
+        Copies the raw notebook. The raw cells are shared with the copy until
+        they are changed (see own).
+
+        :param cells: raw cells of the copy (default: all the cells)
+        :return: the state of the copy
+        """
+        raw_nb = {
+            key: deepcopy(value) for key, value in self.raw_nb.items() if key != 'cells'
+        }
+        raw_nb['cells'] = list(self.raw_nb['cells'] if cells is None else cells)
+
+        state = NotebookState.of(raw_nb)
+        state.blob_store = self.blob_store
+        self.share(raw_nb['cells'])
+        state.share(raw_nb['cells'])
+        return state
+
+    # -- Copy-on-write --
+    def share(self, raw_cells: Iterable[dict]) -> None:
+        """
+        Marks raw cells as shared with another notebook
+        """
+        with self.lock:
+            self.shared.update(id(raw_cell) for raw_cell in raw_cells)
+
+    def own(self, cell: Cell) -> Cell:
+        """
+        Clones the raw cell of a cell of the notebook if it is shared with another
+        notebook, so that it can be changed (the cell is bound to the clone)
+        """
+        if id(cell.cell) not in self.shared:
+            return cell
+
+        with self.lock:
+            if id(cell.cell) in self.shared:
+                num = self.find(cell)
+                if num is None:
+                    # the cell is no longer in the notebook (or was cloned already)
+                    cell.cell = copy_raw_cell(cell.cell)
+                else:
+                    self._clone(num)
+                    cell.cell = self.raw_nb['cells'][num]
+        return cell
+
+    def own_all(self) -> None:
+        """
+        Clones all the raw cells of the notebook that are shared with another notebook
+        """
+        if not self.shared:
+            return
+
+        with self.lock:
+            for num, raw_cell in enumerate(self.raw_nb['cells']):
+                if id(raw_cell) in self.shared:
+                    self._clone(num)
+            self.shared.clear()
+
+    def _clone(self, num: int) -> None:
+        # replaces the shared raw cell at position num by a clone (the lock is held);
+        # its tracking (version, validation) and its pooled wrapper follow it.
+        # The id of the shared cell is kept: the other wrappers of the cell are
+        # detached from it when they change.
+        cells = self.raw_nb['cells']
+        raw_cell = cells[num]
+        clone = copy_raw_cell(raw_cell)
+        cells[num] = clone
+        changes = self.cell_changes.pop(id(raw_cell), None)
+        if changes is not None and changes[0] is raw_cell:
+            self.cell_changes[id(clone)] = (clone, *changes[1:])
+        if self.validated_cells.pop(id(raw_cell), None) is raw_cell:
+            self.validated_cells[id(clone)] = clone
+        self.pool.rebind(raw_cell, clone)
+
+    def on_cell_change(self, cell: Cell) -> None:
+        with self.lock:
+            self._on_cell_change(cell)
+
+    def _on_cell_change(self, cell: Cell) -> None:
+        raw_cell = self.own(cell).cell
+        self.validated_cells.pop(id(raw_cell), None)
+        self.pool.features.discard(raw_cell)
+
+        num = self.find(cell)
+        if num is not None:
+            self.masks.discard([num])
+        self.touch([cell.cell])
+
+    def forget(self, positions: Iterable[int]) -> None:
+        """
+        Drops the cached results (masks and features) of the cells at the given
+        positions, that may have been changed without their methods
+        """
+        positions = list(positions)
+        if not positions:
+            return
+
+        cells = self.raw_nb['cells']
+        with self.lock:
+            for num in positions:
+                self.pool.features.discard(cells[num])
+            self.masks.discard(positions)
+
+    def find(self, cell: Cell) -> Optional[int]:
+        """
+        Returns the position of a cell in the current cell list (None if it was removed)
+        """
+        cells = self.raw_nb['cells']
+        raw_cell = cell.cell
+        num = cell.num
+        if num is None or num >= len(cells) or cells[num] is not raw_cell:
+            num = next((i for i, c in enumerate(cells) if c is raw_cell), None)
+        return num
+
+    def set_cells(
+        self,
+        cells: List[dict],
+        removed: Iterable[dict] = (),
+        added: Iterable[dict] = (),
+    ) -> None:
+        """
+        Replaces the cell list of the notebook (the lock must be held)
+
+        :param cells: new cell list
+        :param removed: raw cells that are no longer in the list
+        :param added: raw cells that were added to the list
+        """
+        old_cells = self.raw_nb['cells']
+        self.raw_nb['cells'] = cells
+        if self._indexed_cells is old_cells:
+            self._indexed_cells = cells
+        self.on_cells_changed(removed, added)
+        self._prune()
+
+    # -- Change tracking --
+    def touch(self, raw_cells: Iterable[dict] = ()) -> None:
+        """
+        Increments the version of the notebook, and marks raw cells as changed
+        """
+        self.version += 1
+        for raw_cell in raw_cells:
+            self.cell_changes[id(raw_cell)] = (
+                raw_cell,
+                self.get_cell_version(raw_cell) + 1,
+                self.version,
+            )
+        if len(self.cell_changes) > 2 * len(self.raw_nb['cells']) + 16:
+            # cells removed without set_cells (e.g. directly from the list)
+            self._prune()
+
+    def _prune(self) -> None:
+        """
+        Drops the change tracking entries of the cells that are no longer in
+        the notebook, so that the state doesn't keep removed cells alive
+        """
+        cell_ids = {id(cell) for cell in self.raw_nb['cells']}
+        for tracked in (self.cell_changes, self.validated_cells):
+            for key in [key for key in tracked if key not in cell_ids]:
+                del tracked[key]
+        self.shared &= cell_ids
+        self.pool.prune()
+
+    def get_cell_version(self, raw_cell: dict) -> int:
+        """
+        Returns the number of changes of a raw cell
+        """
+        changes = self.cell_changes.get(id(raw_cell))
+        if changes is None or changes[0] is not raw_cell:
+            return 0
+        return changes[1]
+
+    def changed_since(self, raw_cell: dict, version: int) -> bool:
+        changes = self.cell_changes.get(id(raw_cell))
+        return changes is not None and changes[0] is raw_cell and changes[2] > version
+
+    # -- Cell ID index --
+    def has_id(self, cell_id: str) -> bool:
+        with self.lock:
+            if self.batch is not None and cell_id in self.batch.ids:
+                return True
+            return self._get_ids()[cell_id] > 0
+
+    def position_of(self, cell_id: str) -> Optional[int]:
+        """
+        Returns the position of the cell with the given id (None if there is none)
+        """
+        with self.lock:
+            if not self.has_id(cell_id):
+                return None
+
+            cells = self.raw_nb['cells']
+            pos = self._positions.get(cell_id)
+            if pos is None or pos >= len(cells) or cells[pos].get('id') != cell_id:
+                self._positions = {}
+                for i, cell in enumerate(cells):
+                    self._positions.setdefault(cell.get('id'), i)
+                pos = self._positions.get(cell_id)
+            return pos
+
+    def on_cells_changed(
+        self, removed: Iterable[dict] = (), added: Iterable[dict] = ()
+    ) -> None:
+        """
+        Updates the selection cache and the cell ID index after raw cells are
+        removed from or added to the cell list of the notebook
+        """
+        removed, added = list(removed), list(added)
+        cells = self.raw_nb['cells']
+        self.masks.update(cells)
+        length = self._indexed_length - len(removed) + len(added)
+        if (
+            self._ids is None
+            or self._indexed_cells is not cells
+            or length != len(cells)
+        ):
+            self._ids = None
+            return
+
+        self._indexed_length = length
+        for cell in removed:
+            self._discard_id(cell.get('id'))
+        for cell in added:
+            if cell.get('id') is not None:
+                self._ids[cell['id']] += 1
+
+        # Appending a cell is the most common case: its position is known
+        if len(added) == 1 and not removed and cells[-1] is added[0]:
+            self._positions[added[0].get('id')] = len(cells) - 1
+
+    def on_cell_id_change(self, old_id: Optional[str], new_id: str) -> None:
+        if self._ids is not None:
+            self._discard_id(old_id)
+            self._ids[new_id] += 1
+
+    def reset_ids(self) -> None:
+        """
+        Drops the Cell ID index, after cell ids were changed in place
+        """
+        with self.lock:
+            self._ids = None
+
+    def _discard_id(self, cell_id: Optional[str]) -> None:
+        if cell_id in self._ids:
+            self._ids[cell_id] -= 1
+            if self._ids[cell_id] <= 0:
+                del self._ids[cell_id]
+
+    def _get_ids(self) -> Counter:
+        cells = self.raw_nb['cells']
+        if (
+            self._ids is None
+            or self._indexed_cells is not cells
+            or self._indexed_length != len(cells)
+        ):
+            self._ids = Counter(cell['id'] for cell in cells if 'id' in cell)
+            self._positions = {}
+            self._indexed_cells = cells
+            self._indexed_length = len(cells)
+        return self._ids
+
+
+class CellBatch:
+    """
+    Structural changes of a notebook, applied in one rebuild of its cell list.
+    Positions always refer to the cell list before the batch.
+    """
+
+    def __init__(self, n_cells: int):
+        self.n_cells = n_cells
+
+        # position -> new raw cells, or numbers of moved cells, to place before it
+        self.placements: Dict[int, List[Union[dict, int]]] = {}
+        self.deleted: Set[int] = set()
+        self.replaced: Dict[int, dict] = {}
+        self.moved: Dict[int, int] = {}
+
+        # ids of the inserted cells
+        self.ids: Set[str] = set()
+
+    def insert(self, pos: int, raw_cell: dict) -> None:
+        self.placements.setdefault(self._get_pos(pos), []).append(raw_cell)
+        if raw_cell.get('id') is not None:
+            self.ids.add(raw_cell['id'])
+
+    def delete(self, num: int) -> None:
+        self.deleted.add(num)
+
+    def replace(self, num: int, raw_cell: dict) -> None:
+        self.replaced[num] = raw_cell
+        if raw_cell.get('id') is not None:
+            self.ids.add(raw_cell['id'])
+
+    def move(self, num: int, pos: int) -> None:
+        if num in self.moved:
+            self.placements[self.moved[num]].remove(num)
+
+        pos = self._get_pos(pos)
+        self.moved[num] = pos
+        self.placements.setdefault(pos, []).append(num)
+
+    def added_cells(self) -> List[dict]:
+        """
+        Returns the raw cells inserted or replaced by the batch
+        """
+        added = [cell for cells in self.placements.values() for cell in cells]
+        added = [cell for cell in added if not isinstance(cell, int)]
+        return added + list(self.replaced.values())
+
+    @property
+    def empty(self) -> bool:
+        return not (self.placements or self.deleted or self.replaced or self.moved)
+
+    def rebuild(self, cells: List[dict]) -> List[dict]:
+        """
+        Returns the new cell list
+        """
+        new_cells: List[dict] = []
+        for num, raw_cell in enumerate(cells):
+            self._place(num, cells, new_cells)
+            if num not in self.deleted and num not in self.moved:
+                new_cells.append(self.replaced.get(num, raw_cell))
+        self._place(len(cells), cells, new_cells)
+        return new_cells
+
+    def _place(self, pos: int, cells: List[dict], new_cells: List[dict]) -> None:
+        for entry in self.placements.get(pos, ()):
+            if not isinstance(entry, int):
+                new_cells.append(entry)
+            elif entry not in self.deleted:
+                new_cells.append(self.replaced.get(entry, cells[entry]))
+
+    def _get_pos(self, pos: int) -> int:
+        # same semantics as list.insert
+        if pos < 0:
+            pos = max(self.n_cells + pos, 0)
+        return min(pos, self.n_cells)
+
+
+def copy_raw_cell(raw_cell: dict) -> dict:
+    """
+    Copies a raw cell. The strings (sources and output payloads) are immutable,
+    so they are shared with the copy; the dictionaries and lists are copied,
+    so that changes made directly to one of the cells don't reach the other one.
+    """
+    return {
+        key: value if isinstance(value, str) else deepcopy(value)
+        for key, value in raw_cell.items()
+    }
@@ -0,0 +1,164 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
+
+from nbmanips.cell import Cell
+
+# pattern -> cell number -> offsets of the matches
+SearchResult = Dict[str, Dict[int, List[int]]]
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton: finds all the occurrences of a set of strings
+    in one pass over a text
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = list(keywords)
+
+        # state -> character -> next state (state 0 is the root)
+        self._goto: List[Dict[str, int]] = [{}]
+        # state -> longest proper suffix of the state that is also a state
+        self._fail: List[int] = [0]
+        # state -> indexes of the keywords ending in the state
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for index, keyword in enumerate(self.keywords):
+            self._add(keyword, index)
+        self._build()
+
+    def _add(self, keyword: str, index: int) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = next_state
+        self._out[state] += (index,)
+
+    def _build(self) -> None:
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                suffix = fail[state]
+                while suffix and char not in goto[suffix]:
+                    suffix = fail[suffix]
+                if state:
+                    fail[next_state] = goto[suffix].get(char, 0)
+                out[next_state] += out[fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (start offset, keyword index) for each occurrence of the keywords
+        (overlapping occurrences included), by increasing end offset
+        """
+        goto, fail, out, keywords = self._goto, self._fail, self._out, self.keywords
+        state = 0
+        for end, char in enumerate(text, start=1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in out[state]:
+                yield end - len(keywords[index]), index
+
+
+def search_cells(
+    cells: Iterable[Cell],
+    patterns: Iterable[str],
+    regex=False,
+    case=False,
+    output=False,
+) -> SearchResult:
+    """
+    Searches several patterns in cells, in one pass over the cells
+
+    :param cells: cells to search
+    :param patterns: strings (or regular expressions if regex is True) to find
+    :param regex: True if the patterns are regular expressions
+    :param case: True if the search is case sensitive
+    :param output: True if you want the search in the output of the cells too
+    :return: dictionary pattern -> {cell number: offsets of the matches}.
+        Offsets refer to the source of the cell (followed by a newline and the
+        output, if output is True).
+    """
+    patterns = list(dict.fromkeys(patterns))
+    result: SearchResult = {pattern: {} for pattern in patterns}
+    if not patterns:
+        return result
+
+    if regex:
+        flags = 0 if case else re.IGNORECASE
+        regexes = [re.compile(pattern, flags) for pattern in patterns]
+        match_cell = _get_regex_matcher(patterns, regexes, flags)
+    else:
+        if '' in patterns:
+            raise ValueError('patterns cannot be empty')
+        match_cell = _get_literal_matcher(patterns, case)
+
+    for cell in cells:
+        search_target = cell.source
+        if output:
+            search_target += '\n' + cell.output
+
+        for pattern, start in match_cell(search_target):
+            result[pattern].setdefault(cell.num, []).append(start)
+    return result
+
+
+def _get_literal_matcher(patterns: List[str], case: bool):
+    # case insensitive patterns that only differ by their case share a keyword
+    keywords: Dict[str, List[str]] = {}
+    for pattern in patterns:
+        keywords.setdefault(pattern if case else _lower(pattern), []).append(pattern)
+
+    automaton = AhoCorasick(keywords)
+    keyword_patterns = list(keywords.values())
+
+    def match_cell(text: str) -> Iterator[Tuple[str, int]]:
+        if not case:
+            text = _lower(text)
+        for start, index in automaton.iter_matches(text):
+            for pattern in keyword_patterns[index]:
+                yield pattern, start
+
+    return match_cell
+
+
+def _get_regex_matcher(patterns: List[str], regexes: List[Pattern], flags: int):
+    # cells are first checked against the alternation of the patterns, so that
+    # the cells matching none of them are scanned once
+    alternation: Optional[Pattern] = None
+    if all(compiled.groups == 0 for compiled in regexes):
+        # (patterns with groups could have back references to renumbered groups)
+        try:
+            alternation = re.compile(
+                '|'.join(f'(?:{pattern})' for pattern in patterns), flags
+            )
+        except re.error:
+            alternation = None
+
+    def match_cell(text: str) -> Iterator[Tuple[str, int]]:
+        if alternation is not None and not alternation.search(text):
+            return
+        for pattern, compiled in zip(patterns, regexes):
+            for match in compiled.finditer(text):
+                yield pattern, match.start()
+
+    return match_cell
+
+
+def _lower(text: str) -> str:
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+
+    # characters whose lower case is longer are kept, so that offsets are preserved
+    return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
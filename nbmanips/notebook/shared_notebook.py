@@ -0,0 +1,101 @@
+import json
+import sys
+from typing import Dict, Optional
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from .notebook import Notebook
+
+# name of the shared memory block -> notebook loaded from it (in this process)
+_attached_notebooks: Dict[str, Notebook] = {}
+
+
+class SharedNotebook:
+    """
+    Handle of a notebook stored (as JSON) in a shared memory block.
+    Pickling the handle only sends the name of the block: worker processes load
+    the notebook from shared memory the first time they access it, once per process.
+
+    The process that creates the handle owns the block, and must close it (or use
+    the handle as a context manager). Workers get a read-only view of the notebook:
+    their changes are not shared. They can close their handle to release the
+    notebook they loaded.
+    Workers are expected to be started by the owner through multiprocessing, so
+    that they share its resource tracker.
+
+    :param nb: notebook to share
+    """
+
+    def __init__(self, nb: Notebook):
+        if shared_memory is None:
+            raise ImportError('SharedNotebook requires Python 3.8 or later')
+
+        data = json.dumps(nb.raw_nb).encode('utf-8')
+        self._shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self._shm.buf[: len(data)] = data
+
+        self.shm_name = self._shm.name
+        self.size = len(data)
+        self.name = nb.name
+        self._nb: Optional[Notebook] = nb
+
+    @property
+    def notebook(self) -> Notebook:
+        """
+        The shared notebook, loaded from shared memory on first access
+        """
+        if self._nb is not None:
+            return self._nb
+
+        nb = _attached_notebooks.get(self.shm_name)
+        if nb is None:
+            raw_nb = json.loads(self._read())
+            nb = Notebook(raw_nb, self.name, validate=False, copy=False)
+            _attached_notebooks[self.shm_name] = nb
+        return nb
+
+    def _read(self) -> bytes:
+        if sys.version_info >= (3, 13):
+            # only the owner of the block should unlink it
+            shm = shared_memory.SharedMemory(name=self.shm_name, track=False)
+        else:
+            # the block is registered again with the resource tracker of the owner,
+            # which keeps one registration per block: it is left to the owner
+            shm = shared_memory.SharedMemory(name=self.shm_name)
+        try:
+            return bytes(shm.buf[: self.size])
+        finally:
+            shm.close()
+
+    def close(self):
+        """
+        Free the shared memory block (owner process), or release the notebook
+        loaded from it (worker processes)
+        """
+        _attached_notebooks.pop(self.shm_name, None)
+        self._nb = None
+        shm: Optional[shared_memory.SharedMemory] = getattr(self, '_shm', None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+            self._shm = None
+
+    def __getstate__(self):
+        return {'shm_name': self.shm_name, 'size': self.size, 'name': self.name}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = None
+        self._nb = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f'<SharedNotebook "{self.shm_name}" ({self.size} bytes)>'
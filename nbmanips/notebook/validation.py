@@ -0,0 +1,113 @@
+import json
+import os
+from functools import lru_cache
+from typing import Callable, Iterable, Optional
+
+import nbformat
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+
+@lru_cache(maxsize=None)
+def get_schema(version_minor: Optional[int] = None) -> dict:
+    """
+    Loads the nbformat v4 schema (once per process)
+
+    :param version_minor: minor version of the schema (None for the latest)
+    """
+    schemas = nbformat.v4.nbformat_schema
+    schema_file = schemas.get((4, version_minor), schemas[(None, None)])
+    schema_path = os.path.join(os.path.dirname(nbformat.v4.__file__), schema_file)
+    with open(schema_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def get_validator(
+    version_minor: Optional[int] = None, definition: Optional[str] = None
+) -> Callable[[dict], None]:
+    """
+    Returns a compiled validator of the nbformat v4 schema.
+    The validator is generated with fastjsonschema when it is installed.
+
+    :param version_minor: minor version of the schema (None for the latest)
+    :param definition: validate against a definition of the schema (e.g. 'cell')
+    :return: a function that raises a ValidationError for invalid content
+    """
+    schema = get_schema(version_minor)
+    if definition is not None:
+        schema = {
+            '$schema': schema['$schema'],
+            '$ref': f'#/definitions/{definition}',
+            'definitions': schema['definitions'],
+        }
+
+    if fastjsonschema is not None:
+        compiled_validator = fastjsonschema.compile(schema)
+
+        def validator(content):
+            try:
+                compiled_validator(content)
+            except fastjsonschema.JsonSchemaException as e:
+                raise nbformat.ValidationError(e.message) from None
+
+        return validator
+
+    from jsonschema.validators import validator_for
+
+    validator_class = validator_for(schema)
+    return validator_class(schema).validate
+
+
+def validate_notebook(nb: dict, cells: Optional[Iterable[dict]] = None) -> bool:
+    """
+    Validates a notebook using the compiled validators.
+    On failure, nbformat.validate is used to report (or repair) the error.
+
+    :param nb: notebook dictionary
+    :param cells: cells to validate (default: all the cells of the notebook)
+    :return: True if nbformat repaired the notebook (duplicate cell ids)
+    """
+    if nb.get('nbformat') != 4:
+        nbformat.validate(nbdict=nb)
+        return False
+
+    try:
+        _validate_v4(nb, cells)
+    except nbformat.ValidationError:
+        nbformat.validate(nbdict=nb)
+        return False
+
+    # the uniqueness of the cell ids is not part of the schema:
+    # nbformat renames the duplicates
+    if _has_duplicate_ids(nb['cells']):
+        nbformat.validate(nbdict=nb)
+        return True
+    return False
+
+
+def _validate_v4(nb: dict, cells: Optional[Iterable[dict]] = None) -> None:
+    version_minor = nb.get('nbformat_minor')
+    if not isinstance(nb.get('cells'), list):
+        get_validator(version_minor)(nb)
+        return
+
+    get_validator(version_minor)({**nb, 'cells': []})
+
+    cell_validator = get_validator(version_minor, 'cell')
+    for cell in nb['cells'] if cells is None else cells:
+        cell_validator(cell)
+
+
+def _has_duplicate_ids(cells: Iterable[dict]) -> bool:
+    ids = set()
+    for cell in cells:
+        cell_id = cell.get('id')
+        if cell_id is not None:
+            if cell_id in ids:
+                return True
+            ids.add(cell_id)
+    return False
@@ -1,6 +1,6 @@
 from typing import Callable
 
-from .base_selectors import ListSelector, SelectorBase, TrueSelector
+from .base_selectors import Cost, ListSelector, SelectorBase, TrueSelector
 
 
 class Selector(SelectorBase):
@@ -40,4 +40,4 @@ class Selector(SelectorBase):
         raise NotImplementedError()
 
 
-__all__ = ['SelectorBase', 'Selector']
+__all__ = ['SelectorBase', 'Selector', 'Cost']
@@ -1,27 +1,304 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
+from enum import IntEnum
 from itertools import filterfalse
-from typing import Callable, Iterator, List, Tuple
-
-from nbmanips._utils import partial
-from nbmanips.cell import Cell
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+from nbmanips.cell import Cell, CellPool
+
+from .mask import (
+    MaskCache,
+    build_mask,
+    count_bits,
+    full_mask,
+    mask_from_indexes,
+    mask_indexes,
+)
+
+
+class Cost(IntEnum):
+    """
+    Static cost classes of the selectors, from the cheapest to the most expensive.
+    The terms of AND/OR selectors are evaluated from the cheapest to the most
+    expensive, so that the cheap ones can short-circuit the others.
+    Selectors up to TEXT can be evaluated on all the cells (to cache their mask),
+    so they must accept any cell.
+    """
+
+    INDEX = 0  # cell number: indexes and slices
+    TYPE = 1  # cell type
+    TAG = 2  # cell metadata: tags, slide types...
+    TEXT = 3  # cell source
+    REGEX = 4  # regular expressions
+    OUTPUT = 5  # rendered outputs
+    SOUP = 6  # markdown rendered to HTML and parsed
+    CUSTOM = 7  # custom callables, unless their cost is declared
 
 
 class SelectorBase(ABC):
+    default_cost = Cost.CUSTOM
+
     def __init__(self):
         self._neg = False
+        self._cost: Optional[int] = None
+
+    @property
+    def cost(self) -> int:
+        """
+        Cost class of the selector (see Cost)
+        """
+        return self.default_cost if self._cost is None else self._cost
+
+    def with_cost(self, cost: int) -> 'SelectorBase':
+        """
+        Returns a copy of the selector with a declared cost class
+        (e.g. Selector(func).with_cost(Cost.TYPE) for a cheap custom callable).
+        Custom callables with a declared cost must only depend on the content
+        of the cell (not on its position or on other state): their results
+        can be cached (see Notebook.set_selection_cache).
+
+        :param cost: cost class (see Cost)
+        """
+        selector = copy(self)
+        selector._cost = cost
+        return selector
 
     @abstractmethod
     def get_callable(self, nb: dict) -> Callable[..., bool]:
         pass
 
-    def iter_cells(self, nb, neg=False) -> Iterator[Cell]:
-        selector = self.get_callable(nb)
-        filter_method = filterfalse if (self._neg ^ neg) else filter
-        return filter_method(
-            selector, (Cell(cell, i) for i, cell in enumerate(nb['cells']))
+    def iter_cells(self, nb, neg=False, reverse=False, workers=None) -> Iterator[Cell]:
+        """
+        Iterates over the selected cells
+
+        :param nb: raw notebook
+        :param neg: iterate over the cells that are not selected
+        :param reverse: iterate from the last cell
+        :param workers: number of threads evaluating the selector
+            (default: the selector is evaluated lazily, in the calling thread)
+        """
+        cells = nb['cells']
+        # index and slice constraints: only the candidate cells are visited
+        indexes = None if neg else self._get_indexes(len(cells))
+        if indexes is None and workers is None:
+            mask = self._get_selection_mask(nb, cells, neg)
+            if mask is not None:
+                indexes = mask_indexes(mask)
+                return self._enumerate_cells(nb, indexes, reverse=reverse, cells=cells)
+
+            cache = MaskCache.get(nb)
+            key = None if cache is None or not cache.enabled else self._mask_key()
+            if key is not None:
+                return self._iter_memoized(nb, cells, cache, key, neg, reverse)
+
+        selector = self.compile(nb)
+        cells = self._enumerate_cells(nb, indexes, reverse=reverse, cells=cells)
+        if workers is not None and workers > 1:
+            return self._filter_parallel(selector, cells, workers, neg)
+
+        filter_method = filterfalse if neg else filter
+        return filter_method(selector, cells)
+
+    def _get_indexes(self, n_cells: int) -> Optional[Sequence[int]]:
+        """
+        Returns the sorted numbers of the cells that can be selected, as constrained
+        by the index and slice selectors (None if every cell can be selected)
+        """
+        return None
+
+    def compile(self, nb) -> Callable[[Cell], bool]:
+        """
+        Compiles the selector for a notebook: the callables, indexes and negations
+        of the whole selector tree are resolved once, in one flat and
+        short-circuiting predicate
+
+        :param nb: raw notebook
+        :return: predicate taking a cell (True if the cell is selected)
+        """
+        namespace: Dict[str, Callable] = {}
+        expression = self._compile(nb, namespace)
+        if expression == 'p0(cell)':
+            return namespace['p0']
+        return _generate_predicate(expression, namespace)
+
+    def _compile(self, nb, namespace: Dict[str, Callable]) -> str:
+        """
+        Returns the python expression of the selector (on a variable named cell),
+        and adds the predicates it calls to namespace
+        """
+        name = f'p{len(namespace)}'
+        namespace[name] = self.get_callable(nb)
+        return f'not {name}(cell)' if self._neg else f'{name}(cell)'
+
+    def count(self, nb, neg=False) -> int:
+        """
+        Returns the number of selected cells
+        """
+        cells = nb['cells']
+        if self._get_indexes(len(cells)) is None:
+            mask = self._get_selection_mask(nb, cells, neg)
+            if mask is not None:
+                return count_bits(mask)
+        return sum(1 for _ in self.iter_cells(nb, neg=neg))
+
+    @staticmethod
+    def _enumerate_cells(nb, indexes=None, reverse=False, cells=None) -> Iterator[Cell]:
+        # indexes must refer to the same cell list (snapshot) as cells
+        cells = nb['cells'] if cells is None else cells
+        indexes = range(len(cells)) if indexes is None else indexes
+        if reverse:
+            indexes = reversed(indexes)
+
+        # Notebooks reuse their Cell wrappers across iterations
+        pool = CellPool.get(nb)
+        if pool is None:
+            return (Cell(cells[i], i) for i in indexes)
+        return (pool.cell(cells[i], i, cells) for i in indexes)
+
+    @staticmethod
+    def _filter_parallel(
+        selector: Callable[[Cell], bool], cells: Iterator[Cell], workers: int, neg
+    ) -> Iterator[Cell]:
+        # The cells are split in about 4 chunks per thread, to balance the load
+        cells = list(cells)
+        chunksize = max(1, -(-len(cells) // (workers * 4)))
+        chunks = [cells[i : i + chunksize] for i in range(0, len(cells), chunksize)]
+        filter_method = filterfalse if neg else filter
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            selected = pool.map(
+                lambda chunk: list(filter_method(selector, chunk)), chunks
+            )
+            return iter([cell for chunk in selected for cell in chunk])
+
+    # -- Bitmask engine --
+    def mask(self, nb) -> int:
+        """
+        Evaluates the selector on all the cells of a notebook, as a bitmask:
+        bit i is set if cell i is selected.
+        The masks of the terms are combined with bitwise operations, and cached
+        until the notebook changes if its selection cache is enabled.
+
+        :param nb: raw notebook
+        """
+        cells = nb['cells']
+        return self._mask(nb, cells, MaskCache.get(nb), full_mask(len(cells)))
+
+    def _get_selection_mask(self, nb, cells: list, neg=False) -> Optional[int]:
+        """
+        Returns the selection mask, if the bitmask engine should be used.
+        The engine is part of the selection cache: without cached masks to reuse,
+        the compiled predicate is faster, and lazy.
+        """
+        cache = MaskCache.get(nb)
+        if cache is None or not self._prefers_mask(cache, cells):
+            return None
+
+        mask = self._mask(nb, cells, cache, full_mask(len(cells)))
+        return mask ^ full_mask(len(cells)) if neg else mask
+
+    def _prefers_mask(self, cache: MaskCache, cells: list) -> bool:
+        key = self._mask_key()
+        # the cells that were not evaluated yet (or changed) are evaluated eagerly
+        return key is not None and cache.get_mask(key, cells) is not None
+
+    def _mask_key(self) -> Optional[Hashable]:
+        """
+        Key identifying the (non-negated) selector in the mask caches
+        (None if its mask should not be cached)
+        """
+        return None
+
+    def _mask(self, nb, cells: list, cache: Optional[MaskCache], domain: int) -> int:
+        """
+        Returns the mask of the selector, only exact for the cells in domain
+        (the bits of the other cells are unset)
+        """
+        mask = self._positive_mask(nb, cells, cache, domain)
+        return ~mask & domain if self._neg else mask & domain
+
+    def _positive_mask(
+        self, nb, cells: list, cache: Optional[MaskCache], domain: int
+    ) -> int:
+        key = None if cache is None else self._mask_key()
+        known = mask = 0
+        if key is not None:
+            generation = cache.generation
+            entry = cache.get_mask(key, cells)
+            if entry is not None:
+                known, mask = entry
+                if not domain & ~known:
+                    return mask
+
+        # cheap selectors are evaluated on all the cells, the others only on the
+        # cells of the domain that were not evaluated yet
+        n_cells = len(cells)
+        if key is not None and self.cost <= Cost.TEXT:
+            target = full_mask(n_cells) & ~known
+        else:
+            target = domain & ~known
+
+        mask |= self._evaluate_mask(nb, cells, cache, target)
+        if key is not None:
+            cache.set_mask(key, known | target, mask, generation, cells)
+        return mask
+
+    def _evaluate_mask(
+        self, nb, cells: list, cache: Optional[MaskCache], domain: int
+    ) -> int:
+        """
+        Evaluates the (non-negated) selector on the cells in domain
+        """
+        predicate = self.get_callable(nb)
+        if domain == full_mask(len(cells)):
+            return build_mask(predicate, self._enumerate_cells(nb, cells=cells))
+
+        indexes = mask_indexes(domain)
+        candidates = self._enumerate_cells(nb, indexes, cells=cells)
+        return mask_from_indexes(
+            (i for i, cell in zip(indexes, candidates) if predicate(cell)),
+            len(cells),
         )
 
+    def _iter_memoized(
+        self, nb, cells: list, cache: MaskCache, key: Hashable, neg, reverse
+    ) -> Iterator[Cell]:
+        """
+        Iterates lazily over the selected cells, reusing the cached results
+        and caching the new ones (even if the iteration stops early)
+        """
+        generation = cache.generation
+        known, mask = cache.get_mask(key, cells) or (0, 0)
+        known_cells, selected_cells = set(mask_indexes(known)), set(mask_indexes(mask))
+        predicate = self.get_callable(nb)
+        neg = neg ^ self._neg
+
+        evaluated: List[int] = []
+        selected: List[int] = []
+        try:
+            for cell in self._enumerate_cells(nb, reverse=reverse, cells=cells):
+                num = cell.num
+                if num in known_cells:
+                    value = num in selected_cells
+                else:
+                    value = bool(predicate(cell))
+                    evaluated.append(num)
+                    if value:
+                        selected.append(num)
+                if value ^ neg:
+                    yield cell
+        finally:
+            if evaluated:
+                n_cells = len(cells)
+                cache.set_mask(
+                    key,
+                    known | mask_from_indexes(evaluated, n_cells),
+                    mask | mask_from_indexes(selected, n_cells),
+                    generation,
+                    cells,
+                )
+
     def __invert__(self):
         selector = copy(self)
         selector._neg = not selector._neg
@@ -47,14 +324,30 @@ class SelectorBase(ABC):
 
 
 class TrueSelector(SelectorBase):
-    def iter_cells(self, nb, neg=False) -> Iterator[Cell]:
+    default_cost = Cost.INDEX
+
+    def iter_cells(self, nb, neg=False, reverse=False, workers=None) -> Iterator[Cell]:
         if self._neg ^ neg:
             return (_ for _ in range(0))
-        return (Cell(cell, i) for i, cell in enumerate(nb['cells']))
+        return self._enumerate_cells(nb, reverse=reverse)
+
+    def count(self, nb, neg=False) -> int:
+        if self._neg ^ neg:
+            return 0
+        return len(nb['cells'])
 
     def get_callable(self, nb):
         return lambda cell: True
 
+    def _compile(self, nb, namespace: Dict[str, Callable]) -> str:
+        return 'False' if self._neg else 'True'
+
+    def _get_indexes(self, n_cells: int) -> Optional[Sequence[int]]:
+        return range(0) if self._neg else None
+
+    def _positive_mask(self, nb, cells, cache, domain: int) -> int:
+        return domain
+
     def __and__(self, other: 'SelectorBase'):
         if not isinstance(other, SelectorBase):
             return NotImplemented
@@ -100,9 +393,17 @@ class ListSelector(SelectorBase):
         if not self._and:
             return super().__and__(other)
 
+        # a negated list is an operand, it cannot be extended
+        if self._neg:
+            return ListSelector([self], type='and').__and__(other)
+
         selector = copy(self)
         selector._list = copy(selector._list)
-        if isinstance(other, ListSelector) and (other._and == self._and):
+        if (
+            isinstance(other, ListSelector)
+            and other._and == self._and
+            and not other._neg
+        ):
             selector._list.extend(other._list)
         else:
             selector._list.append(other)
@@ -115,20 +416,109 @@ class ListSelector(SelectorBase):
         if self._and:
             return super().__or__(other)
 
+        # a negated list is an operand, it cannot be extended
+        if self._neg:
+            return ListSelector([self], type='or').__or__(other)
+
         selector = copy(self)
         selector._list = copy(selector._list)
-        if isinstance(other, ListSelector) and (other._and == self._and):
+        if (
+            isinstance(other, ListSelector)
+            and other._and == self._and
+            and not other._neg
+        ):
             selector._list.extend(other._list)
         else:
             selector._list.append(other)
         return selector
 
     def get_callable(self, nb: dict) -> Callable:
-        op = all if self._and else any
-        return partial(self.__combine, op=op, nb=nb)
+        namespace: Dict[str, Callable] = {}
+        return _generate_predicate(self._combine(nb, namespace), namespace)
+
+    def _compile(self, nb, namespace: Dict[str, Callable]) -> str:
+        expression = self._combine(nb, namespace)
+        return f'not {expression}' if self._neg else expression
+
+    def _combine(self, nb, namespace: Dict[str, Callable]) -> str:
+        # all([]) is True and any([]) is False
+        if not self._list:
+            return 'True' if self._and else 'False'
 
-    def __combine(self, cell: Cell, op, nb):
-        return op((sel._neg ^ sel.get_callable(nb)(cell)) for sel in self._list)
+        # AND/OR are commutative: the cheapest terms are evaluated first
+        # (sorted is stable: terms of the same cost keep their order)
+        selectors = sorted(self._list, key=lambda sel: sel.cost)
+        op = ' and ' if self._and else ' or '
+        return '(' + op.join(sel._compile(nb, namespace) for sel in selectors) + ')'
+
+    def _get_indexes(self, n_cells: int) -> Optional[Sequence[int]]:
+        if self._neg:
+            return None
+
+        indexes = [sel._get_indexes(n_cells) for sel in self._list]
+        if self._and:
+            # intersection: the candidates of the most constrained term,
+            # that are candidates of the other terms
+            constrained = [index for index in indexes if index is not None]
+            if not constrained:
+                return None
+            constrained.sort(key=len)
+            shortest, others = constrained[0], constrained[1:]
+            if not others:
+                return shortest
+            # ranges have constant time membership, the other candidates are hashed
+            others = [
+                other if isinstance(other, range) else set(other) for other in others
+            ]
+            return [i for i in shortest if all(i in other for other in others)]
+
+        # union: only if every term is constrained
+        if not indexes or any(index is None for index in indexes):
+            return None
+        if len(indexes) == 1:
+            return indexes[0]
+        return sorted(set().union(*indexes))
+
+    def _prefers_mask(self, cache: MaskCache, cells: list) -> bool:
+        # the terms are combined with bitwise operations if their masks can be cached
+        # (evaluated live, the masks are slower and not lazy: first_cell would
+        # evaluate every cell)
+        return cache.enabled
+
+    def _mask_key(self) -> Optional[Hashable]:
+        # lists of cached selectors are cached too
+        keys = tuple((sel._neg, sel._mask_key()) for sel in self._list)
+        if any(key is None for _, key in keys):
+            return None
+        return ('and' if self._and else 'or', keys)
+
+    def _evaluate_mask(
+        self, nb, cells: list, cache: Optional[MaskCache], domain: int
+    ) -> int:
+        # the terms are evaluated from the cheapest, each one on the cells
+        # that the previous ones did not decide
+        selectors = sorted(self._list, key=lambda sel: sel.cost)
+        if self._and:
+            for sel in selectors:
+                if not domain:
+                    break
+                domain &= sel._mask(nb, cells, cache, domain)
+            return domain
+
+        mask = 0
+        for sel in selectors:
+            if not domain:
+                break
+            selected = sel._mask(nb, cells, cache, domain)
+            mask |= selected
+            domain &= ~selected
+        return mask
+
+    @property
+    def cost(self) -> int:
+        if self._cost is not None:
+            return self._cost
+        return max((sel.cost for sel in self._list), default=Cost.INDEX)
 
     @staticmethod
     def _check_sanity(kwargs):
@@ -163,3 +553,11 @@ class ListSelector(SelectorBase):
             else:
                 raise ValueError('Cannot parse arguments:', str(arg))
         return args_list, kwargs_list
+
+
+def _generate_predicate(expression: str, namespace: Dict[str, Callable]) -> Callable:
+    # generated function: one call per cell, without intermediate closures
+    source = f'def predicate(cell):\n    return {expression}\n'
+    namespace = dict(namespace)
+    exec(source, namespace)
+    return namespace['predicate']
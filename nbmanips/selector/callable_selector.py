@@ -1,16 +1,57 @@
-from typing import Callable
+from typing import Callable, Hashable, Optional
 
-from nbmanips._utils import partial
-from nbmanips.selector import SelectorBase
+from nbmanips.selector import Cost, SelectorBase
 
 
 class CallableSelector(SelectorBase):
     def __init__(self, selector, *args, **kwargs):
-        if args or kwargs:
-            self._selector = partial(selector, *args, **kwargs)
-        else:
-            self._selector = selector
+        self._function = selector
+        self._args = args
+        self._kwargs = kwargs
+        self._selector = self._bind_arguments(selector, args, kwargs)
         super().__init__()
 
     def get_callable(self, nb: dict) -> Callable[..., bool]:
         return self._selector
+
+    def _mask_key(self) -> Optional[Hashable]:
+        if self.cost >= Cost.CUSTOM:
+            # custom callables may depend on the position of the cells or on
+            # other state: they are cached only if their cost is declared
+            return None
+
+        try:
+            key = (
+                self._function,
+                _freeze(self._args),
+                _freeze(tuple(sorted(self._kwargs.items()))),
+            )
+            hash(key)
+        except TypeError:
+            # arguments that cannot be described by a key
+            return None
+        return key
+
+    @staticmethod
+    def _bind_arguments(selector, args: tuple, kwargs: dict) -> Callable[..., bool]:
+        # arguments are passed after the cell, without merging them on each call
+        if kwargs:
+            return lambda cell: selector(cell, *args, **kwargs)
+        if args:
+            return lambda cell: selector(cell, *args)
+        return selector
+
+
+def _freeze(value):
+    """
+    Hashable description of the arguments of a selector (lists, sets, dicts...)
+    """
+    if isinstance(value, tuple):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, list):
+        return list, tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset, frozenset(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return dict, tuple((key, _freeze(item)) for key, item in value.items())
+    return value
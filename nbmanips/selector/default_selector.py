@@ -2,21 +2,35 @@ import re
 from typing import Callable, ClassVar, Dict, Optional, Union
 
 from nbmanips.cell import Cell, MarkdownCell
+from nbmanips.cell.cell_features import byte_size
 
+from .base_selectors import Cost
 from .callable_selector import CallableSelector
 
 
 class DefaultSelector(CallableSelector):
     default_selectors: ClassVar[Dict[str, Callable]] = {}
+    default_costs: ClassVar[Dict[str, int]] = {}
 
     def __init__(self, selector: str, *args, **kwargs):
         # TODO: use signature ?
         callable_selector = self.default_selectors[selector]
         super(DefaultSelector, self).__init__(callable_selector, *args, **kwargs)
+        self._cost = self.default_costs.get(selector)
 
     @classmethod
-    def register_selector(cls, key: str, selector: Callable[..., bool]) -> None:
+    def register_selector(
+        cls, key: str, selector: Callable[..., bool], cost: int = Cost.CUSTOM
+    ) -> None:
+        """
+        Registers a selector under a name
+
+        :param key: name of the selector
+        :param selector: function taking a cell (and the selector arguments)
+        :param cost: cost class of the selector (see Cost)
+        """
         cls.default_selectors[key] = selector
+        cls.default_costs[key] = cost
 
 
 # -- Default Selectors --
@@ -109,7 +123,7 @@ def has_output(cell: Cell, value: bool = True) -> bool:
     :param value: set to False if you want to select cells with no output
     :return: a bool object (True if cell should be selected)
     """
-    return (cell.output != '') == value
+    return cell.get_feature('has_output') == value
 
 
 def has_output_type(cell: Cell, output_type: Union[set, str]) -> bool:
@@ -122,11 +136,9 @@ def has_output_type(cell: Cell, output_type: Union[set, str]) -> bool:
     :return: a bool object (True if cell should be selected)
     """
     if isinstance(output_type, str):
-        output_types = {output_type}
-    else:
-        output_types = set(output_type)
+        return output_type in cell.get_feature('output_types')
 
-    return cell.has_output_type(output_types)
+    return not cell.get_feature('output_types').isdisjoint(output_type)
 
 
 def is_empty(cell: Cell) -> bool:
@@ -136,7 +148,7 @@ def is_empty(cell: Cell) -> bool:
     :param cell: Cell object to select
     :return: a bool object (True if cell should be selected)
     """
-    return cell.source == '' and has_output(cell, False)
+    return cell.get_feature('source_length') == 0 and has_output(cell, False)
 
 
 def has_byte_size(
@@ -160,7 +172,11 @@ def has_byte_size(
     if isinstance(output_types, str):
         output_types = {output_types}
 
-    size = cell.byte_size(output_types, ignore_source)
+    if cell.caches_features:
+        size = byte_size(cell.get_feature('byte_sizes'), output_types, ignore_source)
+    else:
+        # the sizes of the data items are only worth computing if they are cached
+        size = cell.byte_size(output_types, ignore_source)
 
     return size >= min_size and (max_size is None or size < max_size)
 
@@ -174,17 +190,13 @@ def has_slide_type(cell: Cell, slide_type) -> bool:
     :type slide_type: str / set / list
     :return: a bool object (True if cell should be selected)
     """
-    if isinstance(slide_type, str):
-        slide_type = {slide_type}
+    cell_slide_type = cell.get_feature('slide_type')
+    if cell_slide_type is None:
+        return False
 
-    return all(
-        f(cell)
-        for f in [
-            lambda c: 'slideshow' in c.metadata,
-            lambda c: 'slide_type' in c.metadata['slideshow'],
-            lambda c: c.metadata['slideshow']['slide_type'] in slide_type,
-        ]
-    )
+    if isinstance(slide_type, str):
+        return cell_slide_type == slide_type
+    return cell_slide_type in slide_type
 
 
 def has_tag(cell: Cell, tag: str, case=False) -> bool:
@@ -199,11 +211,9 @@ def has_tag(cell: Cell, tag: str, case=False) -> bool:
     :return: a bool object (True if cell should be selected)
     """
     if case:
-        return tag in cell.metadata.get('tags', {})
+        return tag in cell.get_feature('tags')
     else:
-        return tag.lower() in {
-            cell_tag.lower() for cell_tag in cell.metadata.get('tags', {})
-        }
+        return tag.lower() in cell.get_feature('lower_tags')
 
 
 def with_css_selector(cell: MarkdownCell, css_selector: str) -> bool:
@@ -221,6 +231,10 @@ def with_css_selector(cell: MarkdownCell, css_selector: str) -> bool:
     return cell.soup.select_one(css_selector) is not None
 
 
+_SLIDE_TYPES = frozenset({'slide'})
+_NEW_SLIDE_TYPES = frozenset({'slide', 'subslide'})
+
+
 def is_new_slide(cell: Cell, subslide=True) -> bool:
     """
     Selects cells where a new slide/subslide starts
@@ -228,37 +242,37 @@ def is_new_slide(cell: Cell, subslide=True) -> bool:
     :param subslide: False if subslides should not be selected
     :return: a bool object (True if cell should be selected)
     """
-    slide_types = {'slide'}
-    if subslide:
-        slide_types.add('subslide')
+    slide_types = _NEW_SLIDE_TYPES if subslide else _SLIDE_TYPES
     return has_slide_type(cell, slide_types)
 
 
 # -- Default Selectors --
-DefaultSelector.register_selector('contains', contains)
-DefaultSelector.register_selector('has_match', has_match)
-DefaultSelector.register_selector('empty', is_empty)
-DefaultSelector.register_selector('is_empty', is_empty)
-DefaultSelector.register_selector('has_byte_size', has_byte_size)
-DefaultSelector.register_selector('has_tag', has_tag)
+DefaultSelector.register_selector('contains', contains, cost=Cost.TEXT)
+DefaultSelector.register_selector('has_match', has_match, cost=Cost.REGEX)
+DefaultSelector.register_selector('empty', is_empty, cost=Cost.TEXT)
+DefaultSelector.register_selector('is_empty', is_empty, cost=Cost.TEXT)
+DefaultSelector.register_selector('has_byte_size', has_byte_size, cost=Cost.OUTPUT)
+DefaultSelector.register_selector('has_tag', has_tag, cost=Cost.TAG)
 
 # -- Code Specific Selectors --
-DefaultSelector.register_selector('has_output', has_output)
-DefaultSelector.register_selector('has_output_type', has_output_type)
+DefaultSelector.register_selector('has_output', has_output, cost=Cost.OUTPUT)
+DefaultSelector.register_selector('has_output_type', has_output_type, cost=Cost.OUTPUT)
 
 # -- Markdown Specific Selectors --
-DefaultSelector.register_selector('has_html_tag', with_css_selector)
-DefaultSelector.register_selector('with_css_selector', with_css_selector)
+DefaultSelector.register_selector('has_html_tag', with_css_selector, cost=Cost.SOUP)
+DefaultSelector.register_selector(
+    'with_css_selector', with_css_selector, cost=Cost.SOUP
+)
 
 # -- Cell Types --
-DefaultSelector.register_selector('has_type', has_type)
-DefaultSelector.register_selector('raw_cells', is_raw)
-DefaultSelector.register_selector('is_raw', is_raw)
-DefaultSelector.register_selector('markdown_cells', is_markdown)
-DefaultSelector.register_selector('is_markdown', is_markdown)
-DefaultSelector.register_selector('code_cells', is_code)
-DefaultSelector.register_selector('is_code', is_code)
+DefaultSelector.register_selector('has_type', has_type, cost=Cost.TYPE)
+DefaultSelector.register_selector('raw_cells', is_raw, cost=Cost.TYPE)
+DefaultSelector.register_selector('is_raw', is_raw, cost=Cost.TYPE)
+DefaultSelector.register_selector('markdown_cells', is_markdown, cost=Cost.TYPE)
+DefaultSelector.register_selector('is_markdown', is_markdown, cost=Cost.TYPE)
+DefaultSelector.register_selector('code_cells', is_code, cost=Cost.TYPE)
+DefaultSelector.register_selector('is_code', is_code, cost=Cost.TYPE)
 
 # -- Slide cells --
-DefaultSelector.register_selector('has_slide_type', has_slide_type)
-DefaultSelector.register_selector('is_new_slide', is_new_slide)
+DefaultSelector.register_selector('has_slide_type', has_slide_type, cost=Cost.TAG)
+DefaultSelector.register_selector('is_new_slide', is_new_slide, cost=Cost.TAG)
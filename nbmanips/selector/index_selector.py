@@ -1,20 +1,49 @@
 from functools import partial
-from typing import Callable
+from typing import Callable, Iterator, Optional, Sequence
 
 from ..cell import Cell
-from . import SelectorBase
+from . import Cost, SelectorBase
 
 
 class IndexSelector(SelectorBase):
+    default_cost = Cost.INDEX
+
     def __init__(self, index: int):
         self._index = index
         super().__init__()
 
     def get_callable(self, nb: dict) -> Callable:
+        return partial(self.selector, index=self._get_index(len(nb['cells'])))
+
+    def iter_cells(self, nb, neg=False, reverse=False, workers=None) -> Iterator[Cell]:
+        if self._neg ^ neg:
+            return super().iter_cells(nb, neg=neg, reverse=reverse, workers=workers)
+
+        cells = nb['cells']
+        index = self._get_index(len(cells))
+        indexes = range(index, index + 1) if 0 <= index < len(cells) else range(0)
+        return self._enumerate_cells(nb, indexes, cells=cells)
+
+    def count(self, nb, neg=False) -> int:
+        n_cells = len(nb['cells'])
+        selected = int(0 <= self._get_index(n_cells) < n_cells)
+        return n_cells - selected if self._neg ^ neg else selected
+
+    def _get_indexes(self, n_cells: int) -> Optional[Sequence[int]]:
+        if self._neg:
+            return None
+        index = self._get_index(n_cells)
+        return range(index, index + 1) if 0 <= index < n_cells else range(0)
+
+    def _positive_mask(self, nb, cells, cache, domain: int) -> int:
+        index = self._get_index(len(cells))
+        return 1 << index if 0 <= index < len(cells) else 0
+
+    def _get_index(self, n_cells: int) -> int:
         index = self._index
         if index < 0:
-            index = len(nb) + index
-        return partial(self.selector, index=index)
+            index = n_cells + index
+        return index
 
     @classmethod
     def selector(cls, cell: Cell, index):
@@ -0,0 +1,260 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Iterable, List, Optional, Tuple
+from weakref import WeakValueDictionary
+
+from nbmanips.cell import Cell
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Selections are bitmasks stored in python ints: bit i is set if cell i is selected
+
+# bit positions set in each byte value
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+# above this number of runs of moved cells, masks are moved bit by bit
+_MAX_RUNS = 64
+
+
+def full_mask(n_cells: int) -> int:
+    return (1 << n_cells) - 1
+
+
+def count_bits(mask: int) -> int:
+    return bin(mask).count('1')
+
+
+def build_mask(predicate: Callable[[Cell], bool], cells: Iterable[Cell]) -> int:
+    """
+    Evaluates a predicate on cells (in order, starting from cell 0)
+    """
+    bits = b''.join(b'1' if predicate(cell) else b'0' for cell in cells)
+    return int(bits[::-1], 2) if bits else 0
+
+
+def mask_from_indexes(indexes: Iterable[int], n_cells: int) -> int:
+    if isinstance(indexes, range) and indexes.step == 1:
+        if not indexes:
+            return 0
+        return full_mask(indexes.stop) ^ full_mask(indexes.start)
+
+    bits = bytearray(b'0') * n_cells
+    for i in indexes:
+        bits[n_cells - 1 - i] = ord('1')
+    return int(bits, 2) if bits else 0
+
+
+def mask_indexes(mask: int) -> List[int]:
+    """
+    Returns the positions of the bits set in a mask, in ascending order
+    """
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    if numpy is not None:
+        bits = numpy.unpackbits(
+            numpy.frombuffer(data, dtype=numpy.uint8), bitorder='little'
+        )
+        return numpy.flatnonzero(bits).tolist()
+
+    return [
+        8 * i + bit for i, byte in enumerate(data) if byte for bit in _BYTE_BITS[byte]
+    ]
+
+
+class MaskCache:
+    """
+    Selection cache of a notebook: masks of the selectors evaluated on its cells,
+    identified by their mask key (see SelectorBase._mask_key), with LRU eviction.
+
+    Selectors can be evaluated on some of the cells only: the cache stores the
+    mask of the cells evaluated (known) with the mask of the selected cells.
+    The masks are kept up to date with the changes of the notebook: the bits of
+    the changed cells are forgotten, and the masks follow the cells when the
+    cell list is rebuilt.
+    """
+
+    # id(raw notebook) -> MaskCache
+    _caches: 'WeakValueDictionary[int, MaskCache]' = WeakValueDictionary()
+
+    # default number of masks kept by each cache: the cache is opt-in
+    # (see Notebook.set_selection_cache)
+    max_size = 0
+
+    def __init__(self, raw_nb: dict, max_size: Optional[int] = None):
+        self.raw_nb = raw_nb
+        if max_size is not None:
+            self.max_size = max_size
+        self._masks: 'OrderedDict[Hashable, Tuple[int, int]]' = OrderedDict()
+
+        # the masks refer to this cell list, with this length
+        self._cells: Optional[list] = None
+        self._length = 0
+
+        # incremented by each change: masks computed before a change are not stored
+        self.generation = 0
+
+        # readers update the LRU order too
+        self._lock = threading.Lock()
+
+    @classmethod
+    def of(cls, raw_nb: dict) -> 'MaskCache':
+        """
+        Returns the mask cache of a raw notebook, creating it if needed
+        """
+        cache = cls.get(raw_nb)
+        if cache is None:
+            cache = cls(raw_nb)
+            cls._caches[id(raw_nb)] = cache
+        return cache
+
+    @classmethod
+    def get(cls, raw_nb: dict) -> Optional['MaskCache']:
+        cache = cls._caches.get(id(raw_nb))
+        if cache is not None and cache.raw_nb is raw_nb:
+            return cache
+        return None
+
+    def __len__(self):
+        return len(self._masks)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get_mask(self, key: Hashable, cells: list) -> Optional[Tuple[int, int]]:
+        """
+        Returns the cached (known, mask) of a selector, or None
+
+        :param key: mask key of the selector
+        :param cells: cell list the mask is computed on
+        """
+        with self._lock:
+            if not self._check(cells):
+                return None
+            entry = self._masks.get(key)
+            if entry is not None:
+                self._masks.move_to_end(key)
+            return entry
+
+    def set_mask(
+        self, key: Hashable, known: int, mask: int, generation: int, cells: list
+    ) -> None:
+        """
+        Stores the mask of a selector, unless the notebook changed since
+        the given generation
+
+        :param key: mask key of the selector
+        :param known: mask of the cells evaluated
+        :param mask: mask of the cells selected
+        :param generation: generation of the cache when the evaluation started
+        :param cells: cell list the mask was computed on
+        """
+        with self._lock:
+            if generation != self.generation or self.max_size <= 0:
+                return
+            if not self._check(cells):
+                return
+            self._masks[key] = (known, mask)
+            self._masks.move_to_end(key)
+            while len(self._masks) > self.max_size:
+                self._masks.popitem(last=False)
+
+    def resize(self, max_size: int) -> None:
+        """
+        Sets the number of masks kept by the cache (0 disables the cache)
+        """
+        with self._lock:
+            self.max_size = max_size
+            while len(self._masks) > max(max_size, 0):
+                self._masks.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self.generation += 1
+        self._masks = OrderedDict()
+
+    # -- Invalidation --
+    def discard(self, positions: Iterable[int]) -> None:
+        """
+        Forgets the bits of the cells at the given positions (the cells changed)
+        """
+        changed = ~sum(1 << i for i in set(positions))
+        with self._lock:
+            self.generation += 1
+            self._masks = OrderedDict(
+                (key, (known & changed, mask & changed))
+                for key, (known, mask) in self._masks.items()
+            )
+
+    def update(self, cells: list) -> None:
+        """
+        Moves the bits of the cells that are still in the new cell list of
+        the notebook to their new positions. The other bits are forgotten.
+        """
+        with self._lock:
+            self.generation += 1
+            old_cells, old_length = self._cells, self._length
+            self._cells, self._length = cells, len(cells)
+            if not self._masks or old_cells is None:
+                return
+
+            if cells is old_cells:
+                if len(cells) < old_length:
+                    # cells removed in place
+                    self._masks = OrderedDict()
+                # otherwise, cells appended in place: the new bits are unknown
+                return
+
+            self._masks = self._move_masks(old_cells[:old_length], cells)
+
+    def _move_masks(self, old_cells: list, cells: list) -> 'OrderedDict':
+        old_positions = {id(cell): i for i, cell in enumerate(old_cells)}
+        sources = [old_positions.get(id(cell)) for cell in cells]
+
+        # runs of consecutive cells: (old position, new position, length)
+        runs: List[List[int]] = []
+        for new_pos, old_pos in enumerate(sources):
+            if old_pos is None:
+                continue
+            if (
+                runs
+                and runs[-1][0] + runs[-1][2] == old_pos
+                and runs[-1][1] + runs[-1][2] == new_pos
+            ):
+                runs[-1][2] += 1
+            else:
+                runs.append([old_pos, new_pos, 1])
+
+        def move(mask: int) -> int:
+            if len(runs) <= _MAX_RUNS:
+                moved = 0
+                for old_pos, new_pos, length in runs:
+                    moved |= (mask >> old_pos & full_mask(length)) << new_pos
+                return moved
+
+            # scattered changes: the bits are moved one by one
+            bits = bin(mask)[:1:-1]
+            moved_bits = ''.join(
+                '0' if pos is None or pos >= len(bits) else bits[pos] for pos in sources
+            )
+            return int(moved_bits[::-1], 2) if moved_bits else 0
+
+        return OrderedDict(
+            (key, (move(known), move(mask)))
+            for key, (known, mask) in self._masks.items()
+        )
+
+    def _check(self, cells: list) -> bool:
+        current = self.raw_nb['cells']
+        if current is not self._cells or len(current) < self._length:
+            if self._cells is not None:
+                # the cell list was changed without notifying the cache
+                self._clear()
+            self._cells = current
+        self._length = len(current)
+        return cells is current
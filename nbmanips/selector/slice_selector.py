@@ -1,11 +1,14 @@
 from functools import partial
-from typing import Callable
+from typing import Callable, Iterator, Optional, Sequence
 
 from ..cell import Cell
-from . import SelectorBase
+from . import Cost, SelectorBase
+from .mask import mask_from_indexes
 
 
 class SliceSelector(SelectorBase):
+    default_cost = Cost.INDEX
+
     def __init__(self, selector):
         self._slice = selector
         super().__init__()
@@ -14,6 +17,46 @@ class SliceSelector(SelectorBase):
         new_slice = self.__adapt_slice(self._slice, len(nb.get('cells', [])))
         return self.__get_slice_selector(new_slice)
 
+    def iter_cells(self, nb, neg=False, reverse=False, workers=None) -> Iterator[Cell]:
+        cells = nb['cells']
+        indexes = self._get_range(len(cells))
+        if indexes is None or self._neg ^ neg:
+            return super().iter_cells(nb, neg=neg, reverse=reverse, workers=workers)
+        return self._enumerate_cells(nb, indexes, reverse=reverse, cells=cells)
+
+    def count(self, nb, neg=False) -> int:
+        n_cells = len(nb['cells'])
+        indexes = self._get_range(n_cells)
+        if indexes is None:
+            return super().count(nb, neg=neg)
+        return n_cells - len(indexes) if self._neg ^ neg else len(indexes)
+
+    def _get_indexes(self, n_cells: int) -> Optional[Sequence[int]]:
+        return None if self._neg else self._get_range(n_cells)
+
+    def _positive_mask(self, nb, cells, cache, domain: int) -> int:
+        indexes = self._get_range(len(cells))
+        if indexes is None:
+            return super()._positive_mask(nb, cells, cache, domain)
+        return mask_from_indexes(indexes, len(cells))
+
+    def _get_range(self, n_cells: int) -> Optional[range]:
+        """
+        Returns the range of the selected cell numbers (None for negative steps)
+        """
+        new_slice = self.__adapt_slice(self._slice, n_cells)
+        start, stop, step = new_slice.start, new_slice.stop, new_slice.step
+        if step is not None and step < 0:
+            return None
+
+        step = step or 1
+        first = 0 if start is None else max(start, 0)
+        end = n_cells if stop is None else min(stop, n_cells)
+        if start is not None:
+            # first number >= max(start, 0) such that (number - start) % step == 0
+            first += (start - first) % step
+        return range(first, max(first, end), step)
+
     @staticmethod
     def __adapt_slice(old_slice, n_cells):
         start, stop, step = old_slice.start, old_slice.stop, old_slice.step
@@ -37,7 +80,9 @@ class SliceSelector(SelectorBase):
         if stop is not None:
             selector_list.append(lambda cell: cell.num < stop)
         if step is not None:
-            selector_list.append(lambda cell: (cell.num - start) % abs(step) == 0)
+            selector_list.append(
+                lambda cell: (cell.num - (start or 0)) % abs(step) == 0
+            )
         return partial(cls.__get_multiple_selector, selector_list=selector_list)
 
     @staticmethod
@@ -37,6 +37,7 @@ setuptools.setup(
     ],
     extras_require={
         'images': ['img2text>=0.0.2'],
+        'validation': ['fastjsonschema'],
     },
     classifiers=[
         'Programming Language :: Python :: 3',
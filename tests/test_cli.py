@@ -130,6 +130,23 @@ def test_to_md(runner, test_files):
         assert Path('exported.md').exists()
 
 
+def test_convert_multi(runner, test_files):
+    nb3 = Path(str(test_files / 'nb3.ipynb')).read_text()
+    with runner.isolated_filesystem():
+        Path('nb.ipynb').write_text(nb3)
+
+        result = runner.invoke(
+            cli, ['convert', 'multi', 'nb.ipynb', '--to', 'html,md,py', '-o', 'out']
+        )
+        assert result.exit_code == 0
+        assert Path('out.html').exists()
+        assert Path('out.md').exists()
+        assert Path('out.py').exists()
+
+        result = runner.invoke(cli, ['convert', 'multi', 'nb.ipynb', '--to', 'docx'])
+        assert result.exit_code != 0
+
+
 def test_show(runner, test_files):
     result = runner.invoke(cli, ['show', str(test_files / 'nb1.ipynb')])
 
@@ -193,6 +210,20 @@ def test_search(runner, test_files):
     assert result.output.strip() == '[0, 2, 3]'
 
 
+def test_search_patterns_file(runner, test_files):
+    with runner.isolated_filesystem():
+        Path('patterns.txt').write_text('a\nhello\n\nunknown\n')
+        result = runner.invoke(
+            cli, ['search', '-p', 'patterns.txt', str(test_files / 'nb1.ipynb')]
+        )
+
+    assert result.exit_code == 0
+    assert result.output.strip().splitlines() == ['a: [0, 2, 3]', 'hello: [1]']
+
+    result = runner.invoke(cli, ['search', str(test_files / 'nb1.ipynb')])
+    assert result.exit_code != 0
+
+
 def test_erase(runner, test_files):
     nb3 = Path(str(test_files / 'nb3.ipynb')).read_text()
     with runner.isolated_filesystem():
@@ -345,6 +376,24 @@ def test_erase_output(runner, test_files):
         assert IPYNB('nb1.ipynb').select('has_output').count() == 0
 
 
+def test_limit_output(runner, test_files):
+    nb3 = Path(str(test_files / 'nb3.ipynb')).read_text()
+    with runner.isolated_filesystem():
+        Path('nb.ipynb').write_text(nb3)
+
+        result = runner.invoke(
+            cli, ['limit-output', 'nb.ipynb', '--drop-above', '1KB', '-o', 'out.ipynb']
+        )
+        assert result.exit_code == 0
+        assert 'dropped' in result.output
+
+        nb = IPYNB('out.ipynb')
+        assert nb.select('has_output_type', 'image/png').count() == 0
+
+        result = runner.invoke(cli, ['limit-output', 'nb.ipynb', '--drop-above', '1XB'])
+        assert result.exit_code != 0
+
+
 def test_auto_slide(runner, test_files):
     nb3 = Path(str(test_files / 'nb3.ipynb')).read_text()
     with runner.isolated_filesystem():
@@ -397,6 +446,49 @@ def test_split(runner, test_files):
         result = runner.invoke(cli, ['split', 'nb.ipynb', '1,6', '-f'])
         assert result.exit_code == 0
 
+        # no part is written if one of them already exists
+        Path('nb-2.ipynb').unlink()
+        Path('nb-3.ipynb').write_text(nb6)
+        result = runner.invoke(cli, ['split', 'nb.ipynb', '1,6,9'])
+        assert result.exit_code == 1
+        assert not Path('nb-2.ipynb').exists()
+
+
+def test_split_workers(runner, test_files):
+    nb6 = Path(str(test_files / 'nb6.ipynb')).read_text()
+    with runner.isolated_filesystem():
+        Path('nb.ipynb').write_text(nb6)
+
+        result = runner.invoke(cli, ['split', 'nb.ipynb', '1,6', '--workers', '2'])
+        assert result.exit_code == 0
+
+        result = runner.invoke(cli, ['split', 'nb.ipynb', '1,6', '-o', 'seq-%d.ipynb'])
+        assert result.exit_code == 0
+
+        for i in range(3):
+            parts = Path(f'nb-{i}.ipynb'), Path(f'seq-{i}.ipynb')
+            assert parts[0].read_text() == parts[1].read_text()
+
+
+def test_split_max_size(runner, test_files):
+    nb6 = Path(str(test_files / 'nb6.ipynb')).read_text()
+    with runner.isolated_filesystem():
+        Path('nb.ipynb').write_text(nb6)
+
+        result = runner.invoke(
+            cli, ['split', 'nb.ipynb', '--max-size', '0.2KB', '--keep-sections']
+        )
+        assert result.exit_code == 0, result.output
+        for i in range(5):
+            assert Path(f'nb-{i}.ipynb').exists()
+        assert not Path('nb-5.ipynb').exists()
+
+        result = runner.invoke(cli, ['split', 'nb.ipynb', '1', '--max-size', '1MB'])
+        assert isinstance(result.exception, ValueError)
+
+        result = runner.invoke(cli, ['split', 'nb.ipynb', '--max-size', '20XB'])
+        assert result.exit_code == 2
+
 
 def test_split_on_selection(runner, test_files):
     nb6 = Path(str(test_files / 'nb6.ipynb')).read_text()
@@ -80,3 +80,25 @@ def test_dbc_exporter(nb1, output_files):
     exp = DbcExporter()
     exp.export(nb1, path)
     assert os.path.exists(path)
+
+
+def test_convert_many(nb3, output_files):
+    targets = {
+        'html': f'{output_files}/test_many.html',
+        'markdown': f'{output_files}/test_many.md',
+        'python': f'{output_files}/test_many.py',
+        'slides': f'{output_files}/test_many.slides.html',
+    }
+    nb3.convert_many(targets)
+    for path in targets.values():
+        assert os.path.exists(path)
+
+    single_path = f'{output_files}/test_single.html'
+    nb3.to_html(single_path)
+    assert Path(single_path).read_text() == Path(targets['html']).read_text()
+    # the notebook keeps the default name of nbconvert
+    assert '<title>Notebook</title>' in Path(single_path).read_text()
+
+    single_path = f'{output_files}/test_single.md'
+    nb3.to_md(single_path)
+    assert Path(single_path).read_text() == Path(targets['markdown']).read_text()
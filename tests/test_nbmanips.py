@@ -4,6 +4,7 @@ import nbformat
 import pytest
 
 from nbmanips import Notebook
+from nbmanips.cell import Cell
 from nbmanips.selector import Selector
 
 
@@ -110,6 +111,36 @@ def test_search_all(nb1, search_term, case, output, expected):
     assert nb1.search_all(search_term, case=case, output=output) == expected
 
 
+@pytest.mark.parametrize('regex', [False, True])
+@pytest.mark.parametrize('case,output', [(False, False), (True, False), (True, True)])
+def test_search_many(nb1, regex, case, output):
+    patterns = ['b', 'Hello', 'hello', 'a', 'a ', '125', 'l', 'll']
+    if regex:
+        patterns += [r'H\w+o', r'\d+', r'(\w)\1']
+    result = nb1.search_many(patterns, regex=regex, case=case, output=output)
+
+    assert list(result) == patterns
+    for pattern, matches in result.items():
+        expected = nb1.search_all(pattern, case=case, output=output, regex=regex)
+        assert list(matches) == expected
+
+        for num, offsets in matches.items():
+            text = nb1[num].first_cell().source
+            if output:
+                text += '\n' + nb1[num].first_cell().output
+            if regex:
+                flags = 0 if case else re.IGNORECASE
+                found = [m.start() for m in re.finditer(pattern, text, flags)]
+            else:
+                text, key = (text, pattern) if case else (text.lower(), pattern.lower())
+                found = [i for i in range(len(text)) if text.startswith(key, i)]
+            assert offsets == found
+
+    # overlapping occurrences of literals are all reported
+    result = nb1.search_many(['ll', 'l', 'lo'], case=True)
+    assert result == {'ll': {1: [9]}, 'l': {0: [14], 1: [9, 10, 16]}, 'lo': {1: [10]}}
+
+
 @pytest.mark.parametrize(
     'old, new, case, count, regex, expected_old, expected_new',
     [
@@ -293,6 +324,34 @@ def test_select_on_selection(nb6):
     assert sum(len(nb) for nb in result) == len(nb6)
 
 
+@pytest.mark.parametrize(
+    'keep_sections,expected',
+    [(False, [0, 4, 5, 9, 11]), (True, [0, 4, 6, 8, 12])],
+)
+def test_split_by_size(nb6, keep_sections, expected):
+    result = nb6.split_by_size(200, keep_sections=keep_sections)
+    assert [len(nb) for nb in result] == [
+        end - start for start, end in zip(expected, expected[1:] + [len(nb6)])
+    ]
+    assert [cell.source for nb in result for cell in nb] == [
+        cell.source for cell in nb6
+    ]
+    for nb in result:
+        if keep_sections:
+            assert nb.first_cell().source.startswith('#')
+        else:
+            assert len(nb) == 1 or sum(cell.byte_size() for cell in nb) <= 200
+
+    # the selected cells are split, the cells of the notebooks are shared
+    result = nb6.select('is_markdown').split_by_size(10**6)
+    assert len(result) == 1 and len(result[0]) == len(nb6.select('is_markdown'))
+    result[0].first_cell().set_source('changed')
+    assert nb6[0].first_cell().source != 'changed'
+
+    with pytest.raises(ValueError):
+        nb6.split_by_size(0)
+
+
 @pytest.mark.parametrize(
     'value,expected',
     [
@@ -312,6 +371,27 @@ def test_select(nb6, value, expected):
     assert sum(len(nb) for nb in result) == len(nb6)
 
 
+def test_iter_split(nb6):
+    parts = nb6.iter_split(1, 6, -3)
+    assert not isinstance(parts, list)
+    parts = list(parts)
+    assert [len(nb) for nb in parts] == [1, 5, 6, 3]
+    assert [[cell.source for cell in nb] for nb in parts] == [
+        [cell.source for cell in nb6[start:end]]
+        for start, end in [(0, 1), (1, 6), (6, 12), (12, None)]
+    ]
+
+    # each part only holds a copy of its own cells
+    assert parts[1].cells[0] == nb6.cells[1]
+    assert parts[1].cells[0] is not nb6.cells[1]
+    parts[1].first_cell().set_source('changed')
+    assert nb6[1].first_cell().source != 'changed'
+
+    # selectors and selections
+    assert [len(nb) for nb in nb6.iter_split('is_markdown')] == [2, 2, 2, 2, 4, 3]
+    assert [len(nb) for nb in nb6[2:9].iter_split(0, 4)] == [4, 3]
+
+
 def test_toc(nb6):
     toc = nb6.ptoc(index=True)
     match = re.search(r'2\.1\sSubpart\s*\[\d+]', toc)
@@ -421,3 +501,685 @@ def test_attachments(nb7: Notebook):
         cell = nb7.cells[cell_idx]
         assert cell['source'] == source
         assert len(cell['attachments']) == 1
+
+
+def test_offload_outputs(nb3_0, test_files, tmp_path):
+    from copy import deepcopy
+
+    from nbmanips.cell import BlobStore
+
+    original_cells = deepcopy(nb3_0.cells)
+    original_output = nb3_0[2].first_cell().get_output(text=True, parsers=[])
+
+    store_dir = tmp_path / 'store'
+    nb3_0.offload_outputs(store_dir, min_size=1000)
+
+    image_cells = nb3_0.select('has_output_type', 'image/png').list()
+    assert image_cells
+    for num in image_cells:
+        for output in nb3_0.cells[num]['outputs']:
+            if 'image/png' in output.get('data', {}):
+                assert BlobStore.parse_reference(output['data']['image/png'])
+
+    blobs = list(store_dir.glob('*/*'))
+    assert blobs
+
+    # references are resolved lazily
+    assert nb3_0[2].first_cell().get_output(text=True, parsers=[]) == original_output
+
+    # identical payloads are deduplicated
+    Notebook.read_ipynb(test_files / 'nb3.ipynb').offload_outputs(store_dir, 1000)
+    assert len(list(store_dir.glob('*/*'))) == len(blobs)
+
+    # the store is not saved in the notebook, and is passed in when loading it
+    path = tmp_path / 'offloaded.ipynb'
+    nb3_0.to_ipynb(path)
+    assert str(store_dir) not in path.read_text()
+    with pytest.raises(ValueError):
+        Notebook.read_ipynb(path).to_notebook_node()
+    loaded = Notebook.read_ipynb(path, blob_store=store_dir)
+    assert loaded[2].first_cell().get_output(text=True, parsers=[]) == original_output
+    assert (
+        loaded.to_notebook_node()
+        == Notebook.read_ipynb(test_files / 'nb3.ipynb').to_notebook_node()
+    )
+
+    # notebooks built from the cells resolve their payloads
+    n_cells = len(nb3_0)
+    for combined in [nb3_0 * 2, nb3_0 + loaded, Notebook.concat([nb3_0, loaded])]:
+        assert len(combined.to_notebook_node()['cells']) == 2 * n_cells
+
+    # the payloads of another store are restored
+    other = Notebook.read_ipynb(test_files / 'nb3.ipynb')
+    other.offload_outputs(tmp_path / 'other_store', min_size=1000)
+    combined = nb3_0 + other
+    assert not any(cell.has_offloaded_outputs() for cell in combined[n_cells:])
+    assert len(combined.to_notebook_node()['cells']) == 2 * n_cells
+
+    nb3_0.rehydrate()
+    for cell, original_cell in zip(nb3_0.cells, original_cells):
+        for output, original in zip(
+            cell.get('outputs', []), original_cell.get('outputs', [])
+        ):
+            if 'data' in output:
+                assert {
+                    key: value if isinstance(value, str) else ''.join(value)
+                    for key, value in output['data'].items()
+                } == {
+                    key: value if isinstance(value, str) else ''.join(value)
+                    for key, value in original['data'].items()
+                }
+
+
+@pytest.fixture
+def nb_big_output():
+    nb = Notebook()
+    nb.add_cell(
+        Cell(
+            {
+                'cell_type': 'code',
+                'source': 'for i in range(100_000): print(i)',
+                'metadata': {},
+                'execution_count': 1,
+                'outputs': [
+                    {
+                        'output_type': 'stream',
+                        'name': 'stdout',
+                        'text': ''.join(f'{i}\n' for i in range(100_000)),
+                    },
+                    {
+                        'output_type': 'execute_result',
+                        'execution_count': 1,
+                        'metadata': {},
+                        'data': {'text/plain': 'x' * 5000, 'text/html': 'y' * 5000},
+                    },
+                ],
+            }
+        )
+    )
+    nb.add_cell(Cell({'cell_type': 'markdown', 'source': 'Hello', 'metadata': {}}))
+    return nb
+
+
+def test_limit_output(nb_big_output):
+    report = nb_big_output.limit_output(max_output_size=1000)
+    assert [entry['output'] for entry in report] == [0, 1]
+    assert all(entry['new_size'] <= 1000 for entry in report)
+
+    outputs = nb_big_output.cells[0]['outputs']
+    assert outputs[0]['text'].startswith('0\n1\n')
+    assert outputs[0]['text'].endswith('99999\n')
+    assert 'truncated by nbmanips' in outputs[0]['text']
+    assert list(outputs[1]['data']) == ['text/plain']
+    assert [entry['removed'] for entry in report] == [[], ['text/html']]
+    nbformat.validate(nb_big_output.raw_nb)
+
+    assert nb_big_output.limit_output(max_output_size=1000) == []
+
+
+def test_limit_output_drop(nb_big_output):
+    report = nb_big_output.limit_output(drop_above=100_000)
+    assert [(entry['output'], entry['action']) for entry in report] == [(0, 'dropped')]
+    assert len(nb_big_output.cells[0]['outputs']) == 1
+
+    report = nb_big_output.limit_output(max_cell_size=6000)
+    assert report[0]['action'] == 'truncated'
+    assert nb_big_output[0].first_cell().byte_size(ignore_source=True) <= 6000
+
+
+def test_to_ipynb_output_budget(nb_big_output, tmp_path):
+    path = tmp_path / 'budget.ipynb'
+    report = nb_big_output.to_ipynb(str(path), output_budget={'max_cell_size': 2000})
+    assert report
+
+    written = Notebook.read_ipynb(str(path))
+    assert written[0].first_cell().byte_size(ignore_source=True) <= 2000
+    # the notebook in memory is left untouched
+    assert nb_big_output[0].first_cell().byte_size(ignore_source=True) > 2000
+
+    # an empty budget is no budget
+    assert (
+        nb_big_output.to_ipynb(str(path), output_budget={'max_cell_size': None}) is None
+    )
+
+
+@pytest.mark.parametrize('max_size', [1000, 5000])
+def test_limit_output_error(max_size):
+    traceback = [f'line {i}' for i in range(20_000)]
+    nb = Notebook()
+    nb.add_cell(
+        Cell(
+            {
+                'cell_type': 'code',
+                'source': 'raise ValueError',
+                'metadata': {},
+                'execution_count': 1,
+                'outputs': [
+                    {
+                        'output_type': 'error',
+                        'ename': 'ValueError',
+                        'evalue': '',
+                        'traceback': traceback,
+                    },
+                    {'output_type': 'stream', 'name': 'stdout', 'text': 'x' * 5000},
+                ],
+            }
+        )
+    )
+    version = nb.version
+    report = nb.limit_output(max_output_size=max_size)
+    assert nb.version == version + 1
+    assert [entry['output'] for entry in report] == [0, 1]
+    assert all(entry['new_size'] <= max_size for entry in report)
+
+    output = nb.cells[0]['outputs'][0]
+    assert output['traceback'][:2] == traceback[:2]
+    assert output['traceback'][-1] == traceback[-1]
+    assert nb[0].first_cell().byte_size(ignore_source=True) <= 2 * max_size
+
+    # nothing left to trim: the notebook is not modified
+    assert nb.limit_output(max_output_size=max_size) == []
+    assert nb.version == version + 1
+
+    # the outputs that cannot even hold the truncation marker are dropped
+    max_cell_size = report[0]['new_size'] + 10
+    report = nb.limit_output(max_cell_size=max_cell_size)
+    assert [(entry['output'], entry['action']) for entry in report] == [(1, 'dropped')]
+    assert nb[0].first_cell().byte_size(ignore_source=True) <= max_cell_size
+
+
+def test_validate(nb1_0):
+    from nbformat import ValidationError
+
+    nb1_0.validate()
+
+    # untracked changes are only detected by a full validation
+    nb1_0.cells[0]['source'] = 5
+    nb1_0.validate(incremental=True)
+    with pytest.raises(ValidationError):
+        nb1_0.validate()
+
+    nb1_0.cells[0]['source'] = ''
+    nb1_0.validate()
+
+    # changes made through the Cell API are tracked
+    nb1_0[1].first_cell()['source'] = 5
+    with pytest.raises(ValidationError):
+        nb1_0.validate(incremental=True)
+
+
+def test_validate_duplicate_ids(nb6_0):
+    cells = nb6_0.cells
+    assert nb6_0.cell_by_id(cells[0]['id']).num == 0
+
+    # the duplicate ids are renamed by nbformat
+    cells[1]['id'] = cells[0]['id']
+    with pytest.warns(Warning, match='Non-unique cell id'):
+        nb6_0.validate(incremental=True)
+    assert cells[1]['id'] != cells[0]['id']
+    assert nb6_0.cell_by_id(cells[1]['id']).num == 1
+
+
+def test_compiled_validator():
+    from nbformat import ValidationError
+
+    from nbmanips.notebook.validation import get_validator
+
+    assert get_validator(4) is get_validator(4)
+
+    cell_validator = get_validator(4, 'cell')
+    cell_validator({'cell_type': 'markdown', 'source': '', 'metadata': {}})
+    with pytest.raises(ValidationError):
+        cell_validator({'cell_type': 'markdown', 'source': 5, 'metadata': {}})
+
+
+def test_copy_isolation(nb1):
+    source = nb1[0].first_cell().source
+
+    cp = nb1.copy()
+    assert cp.cells is not nb1.cells
+    assert cp.cells == nb1.cells
+    # the strings are shared
+    assert all(a['source'] is b['source'] for a, b in zip(cp.cells, nb1.cells))
+
+    cp[0].first_cell().set_source('changed')
+    assert nb1[0].first_cell().source == source
+    assert cp[0].first_cell().source == 'changed'
+
+    # changes made directly to the cells are not shared either
+    for other in [cp, Notebook(nb1.raw_nb), nb1 + nb1, nb1 * 2]:
+        other[1].first_cell().metadata['copied'] = True
+        other.cells[2]['metadata']['copied'] = True
+        other.cells[3]['execution_count'] = 42
+        assert all('copied' not in cell['metadata'] for cell in nb1.cells)
+        assert nb1.cells[3]['execution_count'] != 42
+
+
+def test_copy_on_write_operators(nb1):
+    source = nb1[0].first_cell().source
+
+    nb = nb1 * 2
+    nb[0].first_cell().set_source('changed')
+    assert nb1[0].first_cell().source == source
+    assert nb[len(nb1)].first_cell().source == source
+
+    nb = nb1 + nb1
+    nb1_cp = nb1.copy()
+    nb1_cp[0].first_cell().set_source('changed')
+    assert nb[0].first_cell().source == source
+    assert nb[len(nb1)].first_cell().source == source
+
+
+def test_copy_shares_cells(nb1):
+    import tracemalloc
+    from copy import deepcopy
+
+    nb = nb1 * 100
+    tracemalloc.start()
+    try:
+        cp = nb.copy()
+        copy_size = tracemalloc.get_traced_memory()[0]
+        raw_nb = deepcopy(nb.raw_nb)
+        deepcopy_size = tracemalloc.get_traced_memory()[0] - copy_size
+    finally:
+        tracemalloc.stop()
+    del raw_nb
+    assert copy_size < deepcopy_size / 4
+
+    # a shared cell is cloned when it is changed or handed out
+    cp[0].first_cell().set_source('changed')
+    cp.cells[1]['metadata']['copied'] = True
+    assert nb.raw_nb['cells'][0]['source'] != 'changed'
+    assert 'copied' not in nb.raw_nb['cells'][1]['metadata']
+
+    # the cells obtained before the copy are cloned by touch
+    cell = nb1.first_cell()
+    cp = nb1.copy()
+    nb1.touch(cell)
+    cell.metadata['copied'] = True
+    assert 'copied' not in cp.first_cell().metadata
+    assert nb1.first_cell().metadata['copied']
+
+
+def test_cell_id_index(nb1_0):
+    for i, cell in enumerate(nb1_0.cells):
+        cell['id'] = f'cell-{i}'
+
+    assert nb1_0.position_of('cell-2') == 2
+    assert nb1_0.cell_by_id('cell-2').num == 2
+    assert nb1_0.cell_by_id('missing') is None
+    assert nb1_0.position_of('missing') is None
+
+    # the index follows inserts, deletes and id changes
+    nb1_0.add_cell(nb1_0.cell_by_id('cell-1'), pos=0)
+    new_id = nb1_0.cells[0]['id']
+    assert new_id != 'cell-1'
+    assert nb1_0.position_of(new_id) == 0
+    assert nb1_0.position_of('cell-2') == 3
+
+    nb1_0[0].delete()
+    assert nb1_0.position_of(new_id) is None
+    assert nb1_0.position_of('cell-2') == 2
+
+    nb1_0.cell_by_id('cell-0').id = 'renamed'
+    assert nb1_0.position_of('cell-0') is None
+    assert nb1_0.position_of('renamed') == 0
+
+    nb1_0.add_cell(nb1_0.cell_by_id('renamed'))
+    assert nb1_0.used_ids == {cell['id'] for cell in nb1_0.cells}
+    assert len(nb1_0.used_ids) == len(nb1_0.cells)
+
+
+def test_concat(nb1, nb2, nb6):
+    nb = Notebook.concat(iter([nb1, nb2, nb1]))
+    assert len(nb.cells) == 2 * len(nb1.cells) + len(nb2.cells)
+    assert nb.metadata == nb1.metadata
+    assert nb.metadata is not nb1.metadata
+    assert [cell.source for cell in nb] == [cell.source for cell in (nb1 + nb2 + nb1)]
+
+    nb = Notebook.concat([nb6, nb6])
+    ids = [cell['id'] for cell in nb.cells]
+    assert len(ids) == len(set(ids)) == 2 * len(nb6.cells)
+    assert len(Notebook.concat([nb6, nb6], dedupe_ids=False).used_ids) == len(nb6.cells)
+
+    # only the selected cells are concatenated
+    nb = Notebook.concat([nb1[0], nb2])
+    assert len(nb.cells) == 1 + len(nb2.cells)
+
+    assert len(Notebook.concat([]).cells) == 0
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_parallel_apply(nb6_0, executor):
+    from nbmanips.notebook import CellExecutor
+
+    expected = [cell.source.upper() for cell in nb6_0 if cell.type != 'markdown']
+
+    def upper(cell):
+        if cell.type == 'markdown':
+            return None
+        cell.set_source(cell.source.upper())
+        return cell
+
+    nb6_0.apply(upper, workers=2, executor=executor, chunksize=3)
+    assert [cell.source for cell in nb6_0] == expected
+
+    with CellExecutor(2, executor=executor) as cell_executor:
+        assert nb6_0.map(lambda c: c.source, executor=cell_executor) == expected
+        assert nb6_0.map(lambda cell: cell.num, executor=cell_executor) == list(
+            range(len(expected))
+        )
+
+
+def test_cell_executor_errors():
+    from nbmanips.notebook import CellExecutor
+
+    with pytest.raises(ValueError):
+        CellExecutor(2, executor='gpu')
+
+
+def test_batch(nb6_0):
+    sources = [cell.source for cell in nb6_0]
+    new_cell = Cell({'cell_type': 'markdown', 'metadata': {}, 'source': 'new'})
+
+    with nb6_0.batch():
+        nb6_0[0].delete()
+        nb6_0.move_cell(1, 4)
+        nb6_0.add_cell(new_cell, pos=0)
+        nb6_0.add_cell(nb6_0[5].first_cell(), pos=3)
+        nb6_0[6:8].apply(lambda cell: None)
+
+        # nothing changes until the end of the batch
+        assert [cell.source for cell in nb6_0] == sources
+        assert nb6_0[2].first_cell().num == 2
+
+    assert [cell.source for cell in nb6_0] == (
+        ['new']
+        + sources[2:3]
+        + [sources[5]]
+        + sources[3:4]
+        + sources[1:2]
+        + sources[4:6]
+        + sources[8:]
+    )
+    ids = [cell['id'] for cell in nb6_0.cells if 'id' in cell]
+    assert len(ids) == len(set(ids)) == len(nb6_0.cells) - 1
+
+
+def test_batch_error(nb6_0):
+    sources = [cell.source for cell in nb6_0]
+    with pytest.raises(ZeroDivisionError):
+        with nb6_0.batch():
+            nb6_0[0].delete()
+            nb6_0.move_cell(2, 0)
+            1 / 0
+    assert [cell.source for cell in nb6_0] == sources
+
+
+def test_move_cell(nb6_0):
+    sources = [cell.source for cell in nb6_0]
+    nb6_0.move_cell(0)
+    assert [cell.source for cell in nb6_0] == sources[1:] + sources[:1]
+    nb6_0.move_cell(-1, 0)
+    assert [cell.source for cell in nb6_0] == sources
+    with pytest.raises(IndexError):
+        nb6_0.move_cell(len(sources))
+
+
+def test_cell_pool(nb6_0):
+    cells = nb6_0.list_cells()
+    assert all(a is b for a, b in zip(cells, nb6_0.list_cells()))
+    assert nb6_0[2].first_cell() is cells[2]
+
+    # the wrappers already yielded keep their position
+    nb6_0.move_cell(0)
+    last_cell = nb6_0.last_cell()
+    assert last_cell is not cells[0] and last_cell.cell is cells[0].cell
+    assert last_cell.num == len(cells) - 1
+    assert cells[0].num == 0
+    assert nb6_0.last_cell() is last_cell
+
+    with pytest.raises(AttributeError):
+        cells[0].new_attribute = None
+
+
+def test_dirty_cells(nb6_0):
+    assert nb6_0.version == 0
+    assert nb6_0.dirty_cells() == []
+
+    cell = nb6_0[1].first_cell()
+    cell.set_source('changed')
+    cell.add_tag('tag')
+    assert cell.version == 2
+    assert nb6_0[2].first_cell().version == 0
+    assert nb6_0.dirty_cells() == [cell]
+
+    version = nb6_0.version
+    nb6_0[3].first_cell().update_metadata('key', 'value')
+    nb6_0.add_cell(cell, pos=0)
+    assert nb6_0.version > version
+    assert [c.num for c in nb6_0.dirty_cells(since=version)] == [0, 4]
+    assert [c.num for c in nb6_0.dirty_cells()] == [0, 2, 4]
+
+    version = nb6_0.version
+    nb6_0[5].delete()
+    assert nb6_0.version == version + 1
+    assert nb6_0.dirty_cells(since=nb6_0.version) == []
+
+    # changes made to a copy are tracked by the copy only
+    cp = nb6_0.copy()
+    cp[6].first_cell().erase_output()
+    assert cp.version == 1
+    assert [c.num for c in cp.dirty_cells()] == [6]
+    assert 6 not in [c.num for c in nb6_0.dirty_cells()]
+
+    # direct changes are tracked once the cells are touched
+    version = nb6_0.version
+    cell = nb6_0[7].first_cell()
+    cell.metadata['key'] = 'value'
+    nb6_0.cells[8]['metadata']['key'] = 'value'
+    assert nb6_0.dirty_cells(since=version) == []
+    nb6_0.touch(cell)
+    nb6_0[8].touch()
+    assert nb6_0.version == version + 2
+    assert [c.num for c in nb6_0.dirty_cells(since=version)] == [7, 8]
+
+
+def test_removed_cells_are_released(nb6_0):
+    import gc
+    import tracemalloc
+
+    n_cells = len(nb6_0)
+    tracemalloc.start()
+    try:
+        size = tracemalloc.get_traced_memory()[0]
+        for i in range(50):
+            cell = Cell({'cell_type': 'markdown', 'source': str(i) * 100_000})
+            nb6_0.add_cell(cell)
+            nb6_0[-1].first_cell().add_tag('big')
+        del cell
+        assert tracemalloc.get_traced_memory()[0] - size > 5_000_000
+
+        nb6_0.select('has_tag', 'big').delete()
+        gc.collect()
+        assert len(nb6_0) == n_cells
+        assert tracemalloc.get_traced_memory()[0] - size < 1_000_000
+    finally:
+        tracemalloc.stop()
+
+
+def test_digest(nb6_0):
+    cell = nb6_0[1].first_cell()
+    digests = cell.digests()
+    assert set(digests) == {'source', 'metadata', 'outputs'}
+
+    # the representation of the source and the id are not part of the content
+    same_cell = Cell({**cell.cell, 'source': cell.get_source().splitlines(True)})
+    same_cell.id = 'other-id'
+    assert same_cell.digest() == cell.digest()
+
+    root = nb6_0.digest()
+    assert nb6_0.copy().digest() == root
+    assert nb6_0[1:].digest() != root
+
+    cell.set_source('changed')
+    assert cell.digests()['source'] != digests['source']
+    assert cell.digests()['metadata'] == digests['metadata']
+    assert nb6_0.digest() != root
+
+    # direct changes to the raw cell are seen too, by the pooled wrappers as well
+    digests = cell.digests()
+    root = nb6_0.digest()
+    cell.metadata['key'] = 'value'
+    nb6_0.cells[2]['source'] = 'changed directly'
+    assert cell.digests()['metadata'] != digests['metadata']
+    assert cell.digests()['source'] == digests['source']
+    assert nb6_0[2].first_cell().digest() == Cell(nb6_0.cells[2]).digest()
+    assert nb6_0.digest() != root
+
+
+def test_digest_outputs(nb3):
+    cp = nb3.copy()
+    root = cp.digest(outputs=False)
+    cell = cp['has_output'].first_cell()
+    digest = cell.digest(outputs=False)
+
+    cell.erase_output()
+    assert cell.digest(outputs=False) == digest
+    assert cp.digest(outputs=False) == root
+    assert cp.digest() != nb3.digest()
+
+
+@pytest.mark.parametrize('protocol', [4, 5])
+def test_pickle(nb3, protocol):
+    import pickle
+
+    selection = nb3[2:5]
+    buffers = []
+    data = pickle.dumps(
+        selection,
+        protocol=protocol,
+        buffer_callback=buffers.append if protocol >= 5 else None,
+    )
+    nb = pickle.loads(data, buffers=buffers)
+    assert nb.raw_nb == nb3.raw_nb
+    assert nb.list() == selection.list()
+
+    # large payloads (images) are sent out-of-band with protocol 5
+    assert bool(buffers) == (protocol >= 5)
+    if buffers:
+        assert len(data) < sum(len(buffer.raw()) for buffer in buffers)
+
+    cell = nb3[3].first_cell()
+    new_cell = pickle.loads(pickle.dumps(cell, protocol=protocol))
+    assert new_cell.cell == cell.cell and new_cell.num == 3
+    assert type(new_cell) is type(cell)
+
+
+def test_shared_notebook(nb3):
+    import pickle
+
+    from nbmanips.notebook import SharedNotebook, shared_notebook
+
+    with SharedNotebook(nb3) as handle:
+        data = pickle.dumps(handle)
+        assert len(data) < 200
+
+        # simulates a worker process: the notebook is loaded from shared memory
+        shared_notebook._attached_notebooks.clear()
+        worker_handle = pickle.loads(data)
+        nb = worker_handle.notebook
+        assert nb.raw_nb == nb3.raw_nb
+        assert pickle.loads(data).notebook is nb
+
+        # closing the handle in a worker releases the loaded notebook
+        worker_handle.close()
+        assert handle.shm_name not in shared_notebook._attached_notebooks
+    assert not shared_notebook._attached_notebooks
+
+
+def test_notebook_corpus(nb1, nb3, nb6):
+    from nbmanips.notebook import NotebookCorpus
+
+    corpus = NotebookCorpus([nb1, nb3, nb6.raw_nb])
+    assert len(corpus) == 3
+
+    # notebooks are materialized as regular notebooks
+    nb = corpus[1]
+    assert [cell.source for cell in nb] == [cell.source for cell in nb3]
+    assert [cell.output for cell in nb] == [cell.output for cell in nb3]
+    assert nb.metadata == nb3.metadata
+    nb[0].first_cell().set_source('changed')
+    assert corpus[1][0].first_cell().source != 'changed'
+
+    # cells are read-only
+    expected = nb1.count() + nb3.count() + nb6.count()
+    assert corpus.count() == expected
+    assert corpus.count('is_markdown') == sum(
+        nb.select('is_markdown').count() for nb in (nb1, nb3, nb6)
+    )
+    _, cell = next(corpus.iter_cells('has_output'))
+    assert cell.output == nb1.select('has_output').first_cell().output
+    with pytest.raises(TypeError):
+        cell.set_source('changed')
+
+
+def test_snapshot_iteration(nb6_0):
+    sources = [cell.source for cell in nb6_0]
+    cells = nb6_0.iter_cells()
+    first = next(cells)
+
+    # structural changes do not affect the iterations already started
+    nb6_0[1:4].delete()
+    nb6_0.add_cell(Cell({'cell_type': 'markdown', 'metadata': {}, 'source': 'new'}))
+    nb6_0.move_cell(0)
+    assert [first.source] + [cell.source for cell in cells] == sources
+    assert [cell.num for cell in nb6_0.iter_cells()] == list(range(len(nb6_0.cells)))
+
+
+def test_concurrent_changes(nb6_0):
+    from concurrent.futures import ThreadPoolExecutor
+
+    n_cells = len(nb6_0.cells)
+
+    def add_cells(i):
+        for j in range(20):
+            raw_cell = {'cell_type': 'markdown', 'metadata': {}, 'source': f'{i}'}
+            nb6_0.add_cell(Cell({**raw_cell, 'id': 'new'}), pos=j % 3)
+
+    def read_cells(_):
+        for _ in range(20):
+            cells = nb6_0.list_cells()
+            assert len(cells) >= n_cells
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(add_cells, i) for i in range(4)]
+        futures += [pool.submit(read_cells, i) for i in range(4)]
+        for future in futures:
+            future.result()
+
+    assert len(nb6_0.cells) == n_cells + 4 * 20
+    ids = [cell['id'] for cell in nb6_0.cells if 'id' in cell]
+    assert len(ids) == len(set(ids)) == len(nb6_0.cells)
+    assert all(nb6_0.position_of(cell_id) is not None for cell_id in ids)
+
+    # apply finds its cells after concurrent insertions, and func can change them
+    def tag(cell):
+        nb6_0.add_cell(Cell({'cell_type': 'markdown', 'metadata': {}, 'source': ''}), 0)
+        cell.add_tag('applied')
+        return cell
+
+    nb6_0.select('is_code').apply(tag, workers=4, executor='thread')
+    n_code = len(nb6_0.select('is_code'))
+    assert len(nb6_0.select('has_tag', 'applied')) == n_code
+
+
+def test_parallel_selection(nb3, nb6):
+    for nb in (nb3, nb6):
+        for selector in ('is_code', ~Selector('has_output'), [0, 2]):
+            selection = nb.select(selector)
+            expected = [cell.num for cell in selection.iter_cells()]
+            assert [cell.num for cell in selection.list_cells(workers=4)] == expected
+            assert [cell.num for cell in selection.iter_cells(neg=True, workers=3)] == [
+                cell.num for cell in selection.iter_cells(neg=True)
+            ]
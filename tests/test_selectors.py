@@ -166,3 +166,355 @@ def test_has_tag(nb6_0):
     assert nb6_0.select('has_tag', 'Toc').list() == [5, 8]
     assert nb6_0.select('has_tag', 'toc', case=True).list() == [5]
     assert nb6_0.select('has_tag', 'Toc', case=True).list() == [8]
+
+
+@pytest.mark.parametrize(
+    'selector',
+    [None, 0, 2, -1, -2, 10, slice(1, 3), slice(None, -1), slice(-3, None, 2)],
+)
+@pytest.mark.parametrize('neg', [False, True])
+def test_selector_count(nb6, selector, neg):
+    from nbmanips.selector.base_selectors import SelectorBase
+
+    selector = Selector(selector)
+    expected = [
+        cell.num for cell in SelectorBase.iter_cells(selector, nb6.raw_nb, neg=neg)
+    ]
+
+    assert selector.count(nb6.raw_nb, neg=neg) == len(expected)
+    assert [cell.num for cell in selector.iter_cells(nb6.raw_nb, neg=neg)] == expected
+    assert [
+        cell.num for cell in selector.iter_cells(nb6.raw_nb, neg=neg, reverse=True)
+    ] == expected[::-1]
+
+
+def test_last(nb6):
+    assert nb6.last() == len(nb6.cells) - 1
+    assert nb6[-1].last_cell().num == len(nb6.cells) - 1
+    assert nb6['is_markdown'].last() == nb6['is_markdown'].list()[-1]
+    assert (~nb6[-3:]).last() == len(nb6.cells) - 4
+    assert len(nb6[2:6]) == nb6[2:6].count() == 4
+
+
+def test_compile(nb6):
+    from nbmanips.cell import Cell
+
+    calls = []
+
+    def counting(cell, name):
+        calls.append(name)
+        return cell.type == name
+
+    markdown = Selector(counting, 'markdown')
+    code = Selector(counting, name='code')
+    selectors = [
+        markdown,
+        ~markdown,
+        markdown & Selector(slice(2, 10)),
+        ~(markdown | code) | Selector(-1),
+        ~(~markdown & ~Selector([1, 3], type='or')),
+        Selector([], type='or') | Selector(None),
+        ~Selector(None) & code,
+    ]
+    cells = [Cell(cell, i) for i, cell in enumerate(nb6.cells)]
+    expected = [
+        [c.type == 'markdown' for c in cells],
+        [c.type != 'markdown' for c in cells],
+        [c.type == 'markdown' and 2 <= c.num < 10 for c in cells],
+        [c.num == len(cells) - 1 for c in cells],
+        [c.type == 'markdown' or c.num in {1, 3} for c in cells],
+        [True for _ in cells],
+        [False for _ in cells],
+    ]
+    for selector, selected in zip(selectors, expected):
+        predicate = selector.compile(nb6.raw_nb)
+        assert [bool(predicate(cell)) for cell in cells] == selected
+        assert [cell.num for cell in selector.iter_cells(nb6.raw_nb)] == [
+            cell.num for cell, value in zip(cells, selected) if value
+        ]
+
+    # evaluation stops at the first false operand
+    calls.clear()
+    (markdown & code).compile(nb6.raw_nb)(cells[1])
+    assert calls == ['markdown']
+
+
+def test_selector_costs(nb6):
+    from nbmanips.selector import Cost
+    from nbmanips.selector.default_selector import DefaultSelector
+
+    calls = []
+
+    def expensive(cell):
+        calls.append(cell.num)
+        return True
+
+    # the cheap terms are evaluated first, whatever their position
+    selector = Selector(expensive) & Selector('is_markdown') & Selector(slice(4, 9))
+    assert [cell.num for cell in selector.iter_cells(nb6.raw_nb)] == [4, 6, 8]
+    assert calls == [4, 6, 8]
+
+    calls.clear()
+    selector = Selector(expensive) | Selector('is_code') | Selector(0)
+    assert len(list(selector.iter_cells(nb6.raw_nb))) == len(nb6.cells)
+    assert calls == [2, 4, 6, 8, 12]
+
+    assert Selector('with_css_selector', 'h1').cost == Cost.SOUP
+    assert Selector('has_type', 'code').cost == Cost.TYPE
+    assert Selector(expensive).cost == Cost.CUSTOM
+    assert Selector(expensive).with_cost(Cost.INDEX).cost == Cost.INDEX
+    assert (Selector('is_code') & Selector(-1)).cost == Cost.TYPE
+
+    # declared costs, terms of the same cost keep their order
+    order = []
+
+    def first(cell):
+        order.append('first')
+        return True
+
+    def second(cell):
+        order.append('second')
+        return True
+
+    selector = Selector(second).with_cost(Cost.TEXT) & Selector(first)
+    selector.compile(nb6.raw_nb)(nb6[0].first_cell())
+    assert order == ['second', 'first']
+
+    order.clear()
+    selector = Selector(first) & Selector(second) & Selector(slice(None))
+    selector.compile(nb6.raw_nb)(nb6[0].first_cell())
+    assert order == ['first', 'second']
+
+    DefaultSelector.register_selector('always', first, cost=Cost.TYPE)
+    try:
+        assert Selector('always').cost == Cost.TYPE
+    finally:
+        del DefaultSelector.default_selectors['always']
+        del DefaultSelector.default_costs['always']
+
+
+@pytest.mark.parametrize(
+    'selector,candidates',
+    [
+        (Selector(slice(10, 20)), list(range(10, 15))),
+        (Selector(-2), [13]),
+        (Selector(30), []),
+        (Selector([1, slice(5, 7)], type='or'), [1, 5, 6]),
+        (Selector(slice(2, 12, 3)) & Selector(slice(None, None, 2)), [2, 8]),
+        (Selector([slice(3, None), -1, 'is_code'], type='or'), list(range(15))),
+        (~Selector(1), list(range(15))),
+        (~(Selector(1) & Selector('is_code')), list(range(15))),
+    ],
+)
+def test_range_pushdown(nb6, selector, candidates):
+    from nbmanips.cell import Cell
+    from nbmanips.selector import Cost
+
+    visited = []
+
+    def spy(cell):
+        visited.append(cell.num)
+        return cell.num % 2 == 0
+
+    # evaluated first on each visited cell
+    selector = Selector(spy).with_cost(Cost.INDEX) & selector
+    all_cells = [Cell(cell, i) for i, cell in enumerate(nb6.cells)]
+    expected = [cell.num for cell in all_cells if selector.compile(nb6.raw_nb)(cell)]
+
+    visited.clear()
+    assert [cell.num for cell in selector.iter_cells(nb6.raw_nb)] == expected
+    assert visited == candidates
+    assert [
+        cell.num for cell in selector.iter_cells(nb6.raw_nb, reverse=True)
+    ] == expected[::-1]
+    assert selector.count(nb6.raw_nb) == len(expected)
+    assert selector.count(nb6.raw_nb, neg=True) == len(nb6.cells) - len(expected)
+
+
+def test_mask(nb6_0):
+    from nbmanips.selector import Cost
+
+    calls = []
+
+    def spy(cell, name):
+        calls.append(name)
+        return cell.type == name
+
+    nb6_0.set_selection_cache()
+    markdown = nb6_0.select(Selector(spy, 'markdown').with_cost(Cost.TYPE))
+    code = nb6_0.select(Selector(spy, name='code').with_cost(Cost.TYPE))
+    selections = [
+        markdown,
+        ~markdown,
+        markdown & nb6_0.select('contains', 'Part'),
+        markdown | code,
+        ~(markdown | nb6_0[3:5]) | nb6_0[-1],
+        ~(~markdown & ~nb6_0.select([1, 3], type='or')),
+    ]
+    expected = []
+    for selection in selections:
+        predicate = selection._selector.compile(nb6_0.raw_nb)
+        selected = [cell.num for cell in nb6_0 if predicate(cell)]
+        expected.append(selected)
+        assert selection.mask() == sum(1 << i for i in selected)
+
+    calls.clear()
+    for selection, selected in zip(selections, expected):
+        assert selection.list() == selected
+        assert [cell.num for cell in selection.iter_cells(reverse=True)] == (
+            selected[::-1]
+        )
+        assert len(selection) == len(selected)
+        assert len(~selection) == len(nb6_0.cells) - len(selected)
+
+    # the masks of the terms are cached, only the changed cells are evaluated again
+    assert calls == []
+    nb6_0[1].first_cell().set_source('# Markdown?')
+    assert (markdown | code).list() == list(range(len(nb6_0.cells)))
+    assert calls.count('markdown') == 1
+    nb6_0[0].delete()
+    assert markdown.list() == [cell.num for cell in nb6_0 if cell.type == 'markdown']
+
+
+def test_compound_selection_live(nb6_0):
+    # without the selection cache, compound selectors see the direct changes
+    selection = nb6_0.select(Selector('has_tag', 'x') | Selector('contains', 'QQQ'))
+    assert selection.list() == []
+    nb6_0.cells[0]['metadata']['tags'] = ['x']
+    nb6_0.cells[2]['source'] = 'QQQ'
+    assert selection.list() == [0, 2]
+    assert len(selection) == 2
+
+
+def test_selection_cache(nb6_0):
+    from nbmanips.cell import Cell
+    from nbmanips.selector import Cost
+
+    calls = []
+
+    def spy(cell, tags):
+        calls.append(cell.num)
+        return any(tag in cell.metadata.get('tags', ()) for tag in tags)
+
+    def expected():
+        return [cell.num for cell in nb6_0 if 'x' in cell.metadata.get('tags', ())]
+
+    def select(tags):
+        return nb6_0.select(Selector(spy, tags).with_cost(Cost.TAG))
+
+    nb6_0[2].first_cell().metadata['tags'] = ['x']
+    nb6_0[5].first_cell().metadata['tags'] = ['x']
+
+    # the cache is disabled by default
+    selection = select(['x'])
+    selection.list()
+    selection.list()
+    assert calls == 2 * list(range(len(nb6_0.cells)))
+
+    calls.clear()
+    nb6_0.set_selection_cache()
+
+    # lazy iterations are memoized, even partial ones
+    assert selection.first_cell().num == 2
+    assert calls == [0, 1, 2]
+    assert selection.list() == [2, 5]
+    assert len(selection) == 2
+    assert (selection & nb6_0.select('markdown_cells')).list() == [2]
+    assert calls == list(range(len(nb6_0.cells)))
+
+    # changes invalidate the results of the changed cells only
+    calls.clear()
+    cell = nb6_0[7].first_cell()
+    cell['metadata'] = {'tags': ['x']}
+    assert selection.list() == [2, 5, 7]
+    assert calls == [7]
+
+    # the results follow the cells when the structure changes
+    calls.clear()
+    nb6_0[0].delete()
+    nb6_0.add_cell(Cell({'cell_type': 'code', 'metadata': {'tags': ['x']}}), pos=3)
+    with nb6_0.batch():
+        nb6_0.move_cell(1, 10)
+        nb6_0[8].delete()
+    assert calls == []
+    assert selection.list() == expected()
+    assert calls == [2]
+    assert nb6_0.select(spy, tags=['x']).list() == selection.list()
+
+    # the cells returned by apply may have been changed directly
+    calls.clear()
+    nb6_0.select('is_code').apply(
+        lambda cell: (cell.metadata.setdefault('tags', []).append('x'), cell)[1]
+    )
+    assert selection.list() == expected()
+    assert nb6_0.select('has_tag', 'x').list() == expected()
+    assert sorted(calls) == nb6_0.select('is_code').list()
+
+    # the least recently used results are evicted
+    calls.clear()
+    nb6_0.set_selection_cache(2)
+    select(['y']).list()
+    select(['z']).list()
+    assert selection.list() == expected()
+    assert len(calls) == 3 * len(nb6_0.cells)
+
+    nb6_0.set_selection_cache(0)
+    calls.clear()
+    selection.list()
+    assert len(calls) == len(nb6_0.cells)
+
+
+def test_selection_cache_custom_callables(nb6_0):
+    nb6_0.set_selection_cache()
+    state = {'value': True}
+
+    # custom callables may depend on the position of the cells or on other state
+    even = nb6_0.select(lambda cell: cell.num % 2 == 0)
+    assert even.list() == list(range(0, len(nb6_0.cells), 2))
+    nb6_0.select(0).delete()
+    assert even.list() == list(range(0, len(nb6_0.cells), 2))
+
+    flag = nb6_0.select(lambda cell: state['value'])
+    assert len(flag) == len(nb6_0.cells)
+    state['value'] = False
+    assert len(flag) == 0
+
+
+def test_cell_features(nb3, nb6_0):
+    from nbmanips.cell import CellFeatures
+    from nbmanips.cell.cell_features import byte_size
+
+    # the byte sizes read from the features are the byte sizes of the cells
+    output_types = [None, set(), {'text/plain'}, {'image/png', 'text'}, {'image'}]
+    for cell in nb3.iter_cells():
+        sizes = cell.get_feature('byte_sizes')
+        for types in output_types:
+            for ignore_source in (False, True):
+                assert byte_size(sizes, types, ignore_source) == cell.byte_size(
+                    types, ignore_source
+                )
+
+    # without the selection cache, the features are computed on each call
+    assert nb6_0.select('has_tag', 'x').list() == []
+    nb6_0.cells[2]['metadata']['tags'] = ['x']
+    assert nb6_0.select('has_tag', 'x').list() == [2]
+
+    calls = []
+    CellFeatures.register_feature('spy', lambda cell: calls.append(cell.num))
+    nb6_0.set_selection_cache()
+    try:
+        for _ in range(2):
+            nb6_0.select(lambda cell: cell.get_feature('spy')).list()
+        assert calls == list(range(len(nb6_0.cells)))
+
+        # the features of a cell are computed again after it changes
+        calls.clear()
+        cell = nb6_0[4].first_cell()
+        assert not nb6_0.select('has_tag', 'New').list()
+        cell.add_tag('new')
+        nb6_0.select(lambda cell: cell.get_feature('spy')).list()
+        assert calls == [4]
+        assert nb6_0.select('has_tag', 'New').list() == [4]
+        assert nb6_0.select('has_tag', 'New', case=True).list() == []
+    finally:
+        del CellFeatures._features['spy']